@@ -0,0 +1,84 @@
+import sys
+import numpy as np
+from dataclasses import dataclass
+
+from thresholds import required_gamma, parse_scheme
+from fsl_vs_phi_l import pass_time
+from orbit import Orbit, pass_geometry, pass_summary, link_eb_to_no, segment_sums
+from link_budget import LinkBudget
+
+# MODCOD table sorted by required Eb/No. best[k] is the table entry with the highest
+# efficiency among the first k + 1 thresholds, i.e. the scheme to use once
+# required_ebno[k] is met.
+@dataclass
+class ModcodTable:
+    names:          np.ndarray
+    required_ebno:  np.ndarray      # [dB], margin included
+    efficiency:     np.ndarray      # [bit/s/Hz]
+    best:           np.ndarray
+
+    @classmethod
+    def from_schemes(cls, schemes, efficiency: dict, target_ber: float, margin: float = 0.0, precision: float = 1/100,
+                     required: dict = None):
+        # required: thresholds [dB] by scheme name (i.e. coded ones), instead of the uncoded searches
+        if required is None:
+            required = {name: required_gamma(*parse_scheme(name), target_ber, precision) for name in schemes}
+        required = np.array([required[name] for name in schemes]) + margin
+        order = np.argsort(required, kind = 'stable')
+        eff = np.array([efficiency[name] for name in schemes])[order]
+
+        best = np.zeros(len(order), dtype = int)
+        for k in range(1, len(order)):
+            best[k] = k if eff[k] > eff[best[k - 1]] else best[k - 1]
+        return cls(np.asarray(schemes)[order], required[order], eff, best)
+
+    def select(self, eb_to_no):
+        # Table index of the scheme used at each Eb/No [dB], -1 where none is met
+        k = np.searchsorted(self.required_ebno, eb_to_no, side = 'right') - 1
+        return np.where(k >= 0, self.best[np.maximum(k, 0)], -1)
+
+    def spectral_efficiency(self, eb_to_no):
+        index = self.select(eb_to_no)
+        return np.where(index >= 0, self.efficiency[np.maximum(index, 0)], 0.0)
+
+def pass_throughput(table: ModcodTable, elevation_angle, eb_to_no, orbit_height: float):
+    # Bits/Hz delivered during an overhead pass (fsl_vs_phi_l.pass_time) switching MODCODs.
+    # elevation_angle is ascending along the last axis; each interval between samples uses
+    # the scheme supported at its lower end.
+    time_above = pass_time(elevation_angle, orbit_height)
+    dt = time_above[..., :-1] - time_above[..., 1:]
+    return np.sum(table.spectral_efficiency(eb_to_no)[..., :-1] * dt, axis = -1)
+
+def simulate_acm_passes(orbit: Orbit, latitude, longitude, t, link: LinkBudget, table: ModcodTable,
+                        bandwidth: float, min_elevation: float = 0.0, coding_rate: float = 1.0):
+    # Like orbit.simulate_passes, with the MODCOD chosen sample by sample
+    geometry = pass_geometry(orbit, latitude, longitude, t)
+    eb_to_no = link_eb_to_no(geometry, link, min_elevation)
+    efficiency_time = table.spectral_efficiency(eb_to_no) * geometry['step']
+    usable_time = np.where(eb_to_no >= table.required_ebno[0], geometry['step'], 0.0)
+
+    row, start, stop = geometry['row'], geometry['start'], geometry['stop']
+    bits_per_hz = segment_sums(efficiency_time, row, start, stop)
+    return {
+        **pass_summary(geometry, t, min_elevation),
+        'usable_time':      segment_sums(usable_time, row, start, stop),
+        'bits_per_hz':      bits_per_hz,
+        'bits':             bits_per_hz * bandwidth * coding_rate,
+    }
+
+if __name__ == "__main__":
+    from compare_ebno_downlink import default_link, schemes, scheme_efficiency, target_ber, coding_rate
+    link = default_link()
+
+    margin = float(sys.argv[1]) if len(sys.argv) >= 2 else 0.0
+    table = ModcodTable.from_schemes(schemes, scheme_efficiency, target_ber, margin)
+    elevation_angle = np.arange(0, 90.2, 0.2)
+    eb_to_no = link.eb_to_no(elevation_angle)
+
+    print("MODCOD thresholds ({} dB margin):".format(margin))
+    for name, required in zip(table.names, table.required_ebno):
+        print("{:>8}: {:.2f} dB".format(name, required))
+    for name in schemes:
+        single = ModcodTable.from_schemes([name], scheme_efficiency, target_ber, margin)
+        print("{:>8}: {:6.1f} bits/Hz per pass".format(name, coding_rate * pass_throughput(single, elevation_angle, eb_to_no, link.orbit_height)))
+    print("{:>8}: {:6.1f} bits/Hz per pass".format("ACM", coding_rate * pass_throughput(table, elevation_angle, eb_to_no, link.orbit_height)))
@@ -0,0 +1,670 @@
+import os
+import sys
+import json
+import math
+import time
+import subprocess
+import numpy as np
+
+import ber_psk
+import ber_qam
+from link_budget import LinkBudget
+import sky_temperature
+
+# Reference implementations: one Eb/No value at a time through math.erfc
+def scalar_ber_psk(M, gamma):
+    k = 1 / np.log2(M)
+    gamma = np.power(10, gamma / 10)
+    arg = np.sin(np.pi / M) * np.sqrt(np.log2(M)) * np.sqrt(gamma)
+    return k * math.erfc(arg)
+
+def scalar_ber_qam(M, gamma):
+    L = np.sqrt(M)
+    k = 2 * (L - 1) / (np.log2(M) * L)
+    gamma = np.power(10, gamma / 10)
+    arg = np.sqrt(3 * np.log2(M) * gamma / (2*M - 2))
+    return k * math.erfc(arg)
+
+# Previous solver: bisection over [0, 100] dB with a relative BER stopping rule
+def bisect_search(ber, target, constellation_size, precision = 1/100):
+    lb = 0
+    rb = 100
+    delta = 1
+    while(abs(delta) > precision):
+        mb = lb + (rb - lb)/2
+        B = ber(constellation_size, mb)
+        delta = (target - B) / B if B != 0 else 1e6
+        delta = min(delta, 1e6)
+        if(delta > 0):
+            rb = mb
+        else:
+            lb = mb
+    return mb
+
+def timed(fn, *args, repeat = 3):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+# Accuracy of the feature benchmarks: each value must stay within feature_tolerance [absolute] of
+# the one stored under 'features' in benchmark_baselines.json, which --update-baselines records.
+# Errors against a reference (brute force, solved values) are stored near 0, so their tolerance
+# is the largest error allowed.
+feature_tolerance = {
+    'scheduler bits share':             1E-6,
+    'crossings max error [deg]':        1E-6,
+    'coverage brute-force drift [s]':   1E-6,
+    'coverage contact time [h]':        1E-6,
+    'sensitivity S1(eirp) sobol':       0.01,
+    'sensitivity S1(eirp) lhs':         0.01,
+    'sensitivity S1(eirp) random':      0.01,
+    'design max |margin| [dB]':         1E-6,
+    'design max bits error':            1E-6,
+    'design ACM mean saving':           1E-6,
+    'doppler range drift':              1E-9,
+    'doppler range rate error [m/s]':   1E-3,
+    'doppler locked share':             1E-6,
+    'interference brute-force drift [dB]': 1E-9,
+    'interference worst degradation [dB]': 1E-6,
+}
+measured_features = {}
+
+def check_feature(name: str, value: float):
+    # [] or [name] if value drifted from its baseline (NaN always fails)
+    value = float(value)
+    measured_features[name] = value
+    ref = (load_baselines() or {}).get('features', {}).get(name)
+    if ref is None:
+        print("feature {}: no baseline".format(name))
+        return []
+    if abs(value - ref) <= feature_tolerance[name]:
+        return []
+    print("feature {}: {:.6g}, baseline {:.6g}, tolerance {:g}  <-- FAIL".format(name, value, ref, feature_tolerance[name]))
+    return [name]
+
+def check_assertion(name: str, ok: bool):
+    if not ok:
+        print("{}  <-- FAIL".format(name))
+    return [] if ok else [name]
+
+# special.erfc is a Chebyshev fit with fractional error below 1.2e-7: the BER of every scheme must
+# stay within it of the exact math.erfc formula, and the thresholds found by the searches within
+# search_rtol of their target BER
+ber_rtol = 1.2E-7
+search_rtol = 1E-6
+# ... which puts erfcinv within about 1.2e-7 / (2 / sqrt(pi)) of the exact inverse [absolute]
+erfcinv_atol = 1.1E-7
+
+def bench_erfcinv(n_points: int = 1000):
+    # Against scipy.special.erfcinv, near y = 1 (both sides, where x is close to 0) and in the
+    # BER tails: no NaN, and within erfcinv_atol
+    from scipy.special import erfcinv as exact
+    import special
+
+    d = np.logspace(-15, np.log10(0.5), n_points)
+    y = np.concatenate([1 - d, 1 + d, np.logspace(-300, -1, n_points)])
+    out, ref = special.erfcinv(y), exact(y)
+    err = np.max(np.abs(out - ref))
+    ok = not np.any(np.isnan(out)) and err <= erfcinv_atol
+    print("erfcinv: {} points, {} NaN, max abs. error vs. scipy {:1.1e}{}".format(
+        y.size, np.sum(np.isnan(out)), err, "" if ok else "  <-- FAIL"))
+    return [] if ok else ["erfcinv"]
+
+def bench_ber(n_points: int = 5000):
+    failed = []
+    constellations = np.array([2, 4, 8, 16, 32])
+    gamma = np.linspace(0, 25, n_points)
+
+    for name, vectorized, scalar in [
+            ("PSK", ber_psk.BER, scalar_ber_psk),
+            ("QAM", ber_qam.BER, scalar_ber_qam)]:
+
+        def scalar_loop():
+            return np.array([[scalar(M, g) for g in gamma] for M in constellations])
+
+        t_scalar, ref = timed(scalar_loop, repeat = 1)
+        t_vector, out = timed(vectorized, constellations[:, None], gamma[None, :])
+
+        # Compare only where the reference is representable down to 1e-12
+        mask = ref > 1e-12
+        rel_err = np.max(np.abs(out[mask] - ref[mask]) / ref[mask])
+
+        ok = rel_err <= ber_rtol
+        if not ok:
+            failed.append("ber " + name)
+        print("BER {}: {} points, scalar loop {:.3f} s, vectorized {:.5f} s ({:.0f}x), max rel. error {:1.1e}{}".format(
+            name, out.size, t_scalar, t_vector, t_scalar / t_vector, rel_err, "" if ok else "  <-- FAIL"))
+    return failed
+
+def bench_search(n_targets: int = 200):
+    failed = []
+    constellations = np.array([2, 4, 8, 16, 32])
+    targets = np.logspace(-12, -2, n_targets)
+
+    for name, search, scalar in [
+            ("PSK", ber_psk.search_ber_psk, scalar_ber_psk),
+            ("QAM", ber_qam.search_ber_qam, scalar_ber_qam)]:
+
+        def bisection_loop():
+            return np.array([[bisect_search(scalar, t, M) for t in targets] for M in constellations])
+
+        t_bisect, ref = timed(bisection_loop, repeat = 1)
+        t_solver, out = timed(search, targets[None, :], constellations[:, None])
+
+        # Residual of the new solver, measured against the exact math.erfc formula
+        achieved = np.array([[scalar(M, g) for g in row] for M, row in zip(constellations, out)])
+        rel_err = np.max(np.abs(achieved - targets) / targets)
+
+        ok = rel_err <= search_rtol
+        if not ok:
+            failed.append("search " + name)
+        print("search {}: {} targets, bisection {:.3f} s, inverse solver {:.5f} s ({:.0f}x), max rel. BER error {:1.1e}, max |delta| vs. bisection {:.3f} dB{}".format(
+            name, out.size, t_bisect, t_solver, t_bisect / t_solver, rel_err, np.max(np.abs(out - ref)), "" if ok else "  <-- FAIL"))
+    return failed
+
+# Library modules must import only NumPy, and within this budget [s] in a fresh interpreter
+import_budget = 0.5
+library_modules = ['special', 'ber_psk', 'ber_qam', 'fsl_vs_phi_l', 'sky_temperature', 'rx_temperature',
+                   'cache', 'link_budget', 'thresholds', 'calc_cnr', 'compare_ebno_downlink', 'maximum_rate_uplink', 'rain', 'scheduler', 'ber_sim', 'fec',
+                   'figures', 'report', 'link_graph', 'crossings',
+                   'coverage', 'sensitivity', 'design', 'doppler', 'interference']
+heavy_modules = ['matplotlib', 'pandas', 'scipy']
+
+def bench_imports():
+    import tempfile
+
+    probe = "import sys, time; t = time.perf_counter(); import {}; t = time.perf_counter() - t; " \
+            "print(t, *[m for m in {!r} if m in sys.modules])"
+    failed = []
+    for module in library_modules:
+        # Importing must not write to the cache either: each import gets an empty one
+        with tempfile.TemporaryDirectory() as empty_cache:
+            out = subprocess.run([sys.executable, "-c", probe.format(module, heavy_modules)],
+                                 capture_output = True, text = True, check = True,
+                                 env = {**os.environ, "SATCOM_CACHE_DIR": empty_cache}).stdout.split()
+            written = sorted(os.listdir(empty_cache))
+        t, leaked = float(out[0]), out[1:]
+        ok = t < import_budget and not leaked and not written
+        if not ok:
+            failed.append(module)
+        print("import {}: {:.3f} s{}{}{}".format(module, t, "" if not leaked else ", pulls in " + ", ".join(leaked),
+                                                "" if not written else ", writes " + ", ".join(written),
+                                                "" if ok else "  <-- FAIL"))
+    return failed
+
+def bench_link_budget():
+    link = LinkBudget()
+    elevation_angle = np.linspace(0, 90, 1000)
+    freq            = np.linspace(7.25E9, 8.40E9, 10)
+    bitrate         = np.array([10E6, 35E6, 70E6, 140E6, 280E6])
+    temperature     = np.linspace(250, 330, 20)
+
+    t, out = timed(link.eb_to_no_grid, elevation_angle, freq, bitrate, temperature)
+    print("link budget: {} points in {:.4f} s".format(out.size, t))
+
+def bench_sky_temperature(n_points: int = 1000000):
+    rng = np.random.default_rng(0)
+    elevation_angle = rng.uniform(0, 90, n_points)
+    freq            = rng.uniform(1E9, 50E9, n_points)
+    water_vapour    = rng.uniform(0, 25, n_points)
+
+    t_build, table = timed(sky_temperature.build_table, repeat = 1)
+    t_model, ref = timed(sky_temperature.sky_temperature_model, elevation_angle, freq / 1E9, water_vapour)
+    t_table, out = timed(sky_temperature.get_sky_temperature, elevation_angle, freq, water_vapour)
+    print("sky temperature: {} cells built in {:.3f} s, {} points, model {:.4f} s, lookup table {:.4f} s, max rel. error {:1.1e}".format(
+        table.size, t_build, n_points, t_model, t_table, np.max(np.abs(out - ref) / ref)))
+
+def bench_scheduler(cases = [(1, 8, 4), (7, 24, 12), (14, 48, 24)], step: float = 30):
+    from orbit import Orbit
+    from scheduler import network_candidates, schedule_contacts
+
+    failed = []
+    link = LinkBudget()
+    rng = np.random.default_rng(0)
+    for days, stations, satellites in cases:
+        t = np.arange(0, days * 86400, step)
+        latitude = np.rad2deg(np.arcsin(rng.uniform(-1, 1, stations)))
+        longitude = rng.uniform(-180, 180, stations)
+        orbit = Orbit.circular(link.orbit_height, raan = np.arange(satellites) * 180 / satellites,
+                               mean_anomaly = np.arange(satellites) * 137.5, j2 = True)
+
+        t_passes, candidates = timed(network_candidates, orbit, latitude, longitude, t, link, 9.9, repeat = 1)
+        t_schedule, contacts = timed(schedule_contacts, candidates, t, 60, repeat = 1)
+        print("scheduler: {} days x {} stations x {} satellites, {} passes in {:.2f} s, {} contacts scheduled in {:.3f} s, "
+              "{:.1f}% of the conflict-free bits (greedy {:.1f}%)".format(
+              days, stations, satellites, len(candidates['bits']), t_passes, len(contacts['pass']), t_schedule,
+              100 * np.sum(contacts['bits']) / np.sum(candidates['bits']), 100 * contacts['greedy_bits'] / np.sum(candidates['bits'])))
+        # The repair only swaps in passes that gain bits
+        failed += check_assertion("scheduler {}: repaired below greedy".format(days), np.sum(contacts['bits']) >= contacts['greedy_bits'])
+        failed += check_feature('scheduler bits share', np.sum(contacts['bits']) / np.sum(candidates['bits'])) if days == cases[-1][0] else []
+    return failed
+
+def bench_ber_sim(points = [('BPSK', 10.5), ('16-QAM', 14.4), ('32-QAM', 17.0)], target_errors: int = 100):
+    import os
+    from ber_sim import simulate_ber, analytic_ber
+
+    for name, ebno in points:
+        t, (ber, errors, bits) = timed(simulate_ber, name, ebno, target_errors, 1E10, 1 << 18, 0, os.cpu_count(), repeat = 1)
+        print("BER simulation {} at {} dB: {:1.2e} ({} errors in {:.1e} bits, {:.1f} s on {} workers), analytic {:1.2e}".format(
+            name, ebno, ber, errors, bits, t, os.cpu_count(), analytic_ber(name, ebno)))
+
+def bench_fec(n_words: int = 2000):
+    import fec
+
+    ebno = np.linspace(0, 20, 1000000)
+    t_formula, ref = timed(fec.coded_error_rates, 'RS(255,223)', 'QPSK', ebno[::100], repeat = 1)
+    t_table, out = timed(fec.coded_ber, 'RS(255,223)', 'QPSK', ebno)
+    valid = ref[0] > 1E-200
+    err = np.max(np.abs(np.log10(out[::100][valid] / ref[0][valid])))
+    print("FEC tables: formula {:.0f} ns/point, table lookup {:.0f} ns/point, max |log10 error| {:1.1e}".format(
+        1E9 * t_formula / len(ref[0]), 1E9 * t_table / len(ebno), err))
+
+    for name, p in [('RS(255,223)', 0.006), ('BCH(63,56)', 0.005)]:
+        t, (ber, fer) = timed(fec.simulate_decoding, name, p, n_words, 0, repeat = 1)
+        print("FEC {} decoder: {:.0f} words/s, FER {:1.2e} (analytic {:1.2e})".format(
+            name, n_words / t, fer, fec.decoded_error_rates(fec.codes[name], p)[1]))
+
+def bench_report():
+    import tempfile
+    import report
+
+    jobs = report.default_jobs()
+    with tempfile.TemporaryDirectory() as output_dir:
+        t_render, (rendered, _) = timed(report.run_report, jobs, output_dir, ['png'], 1, repeat = 1)
+        t_skip, (_, skipped) = timed(report.run_report, jobs, output_dir, ['png'], 1, repeat = 1)
+    print("Report: {} figures rendered in {:.2f} s, {} unchanged skipped in {:.3f} s".format(
+        len(rendered), t_render, len(skipped), t_skip))
+
+def bench_link_graph(n_updates: int = 200):
+    import link_graph
+
+    graph = link_graph.LinkGraph()
+    graph['throughput'], graph['acm_throughput']
+    start = time.perf_counter()
+    for i in range(n_updates):
+        graph.set(antenna_gain = 47 + (i % 2))
+        graph['throughput'], graph['acm_throughput']
+    t_update = (time.perf_counter() - start) / n_updates
+    start = time.perf_counter()
+    for i in range(n_updates // 10):
+        graph = link_graph.LinkGraph(antenna_gain = 47 + (i % 2))
+        graph['throughput'], graph['acm_throughput']
+    t_full = (time.perf_counter() - start) / (n_updates // 10)
+    print("Link graph: full evaluation {:.2f} ms, antenna gain update {:.3f} ms ({:.0f}x)".format(
+        1E3 * t_full, 1E3 * t_update, t_full / t_update))
+
+def bench_crossings(n_levels: int = 1000):
+    from crossings import threshold_elevation
+
+    link = LinkBudget()
+    levels = np.linspace(6, 16, n_levels)
+    fine, coarse = np.arange(0, 90.2, 0.2), np.arange(0, 90.1, 5.0)
+    reference = threshold_elevation(fine, link.eb_to_no(fine), levels, link.eb_to_no)
+
+    def nearest():
+        eb_to_no = link.eb_to_no(fine)
+        return fine[np.argmin(np.abs(eb_to_no[None, :] - levels[:, None]), axis = 1)]
+    def solved():
+        return threshold_elevation(coarse, link.eb_to_no(coarse), levels, link.eb_to_no)
+    for label, fn in [("argmin, 0.2 deg grid", nearest), ("solved, 5 deg grid", solved)]:
+        t, out = timed(fn)
+        print("Threshold crossings ({}): {:.0f} us per threshold, max error {:1.1e} deg".format(
+            label, 1E6 * t / n_levels, np.nanmax(np.abs(out - reference))))
+    # Same NaN (never closing) entries, and the crossings solved on the coarse grid
+    return check_assertion("crossings: NaN entries differ", np.array_equal(np.isnan(out), np.isnan(reference))) \
+         + check_feature('crossings max error [deg]', np.nanmax(np.abs(out - reference)))
+
+def bench_coverage(resolution: float = 2.0, hours: float = 6, step: float = 30):
+    import coverage
+    from orbit import Orbit
+
+    link = LinkBudget()
+    t = np.arange(0, hours * 3600, step)
+    orbit = Orbit.circular(link.orbit_height, raan = [0, 90], j2 = True)
+    elapsed, maps = timed(coverage.coverage_maps, orbit, t, link, 9.6, resolution, repeat = 1)
+    # Pairs inside the visibility cones vs. every cell at every sample
+    latitude, longitude = coverage.ground_grid(resolution)
+    r = orbit.ecef(t).reshape(-1, 3)
+    radius = np.linalg.norm(r, axis = -1)
+    sample, _, _ = coverage.visible_cells(np.rad2deg(np.arcsin(r[:, 2] / radius)), np.rad2deg(np.arctan2(r[:, 1], r[:, 0])),
+                                          coverage.elevation_angle_to_earth_angle(0.0, radius - coverage.re), latitude, longitude)
+    brute = len(r) * len(latitude) * len(longitude)
+    # Contact time of a few cells over every sample, without pruning
+    rows, columns = np.linspace(0, len(latitude) - 1, 7).astype(int), np.linspace(0, len(longitude) - 1, 5).astype(int)
+    lat, lon = np.deg2rad(latitude[rows])[:, None], np.deg2rad(longitude[columns])[None, :]
+    site = coverage.re * np.stack(np.broadcast_arrays(np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis = -1)
+    rho = r[:, None, None, :] - site
+    up = np.sum(rho * site, axis = -1) / (coverage.re * np.linalg.norm(rho, axis = -1))
+    dt = np.tile(np.gradient(t), len(r) // len(t))
+    contact = np.sum(np.where(up >= 0, dt[:, None, None], 0.0), axis = 0)
+    drift = np.max(np.abs(contact - maps['contact_time'][np.ix_(rows, columns)]))
+    print("Coverage: {} cells x {} samples in {:.2f} s, {:.0f} ns per cell-sample, cone pruning keeps {:.1f}% of the pairs, brute-force drift {:.1e} s".format(
+        len(latitude) * len(longitude), len(r), elapsed, 1E9 * elapsed / brute, 100 * len(sample) / brute, drift))
+    return check_feature('coverage brute-force drift [s]', drift) \
+         + check_feature('coverage contact time [h]', np.sum(maps['contact_time']) / 3600 / maps['contact_time'].size)
+
+# Sampling noise allowed on the sum of the first-order indices of every output, at most 1 exactly
+sobol_sum_tolerance = 0.05
+
+def bench_sensitivity(n: int = 1 << 13):
+    import sensitivity
+    from scipy.stats import qmc     # Imported outside the timings
+
+    failed = []
+    link = LinkBudget()
+    uncertainties = sensitivity.default_uncertainties(link)
+    for sampler in ['sobol', 'lhs', 'random']:
+        elapsed, result = timed(sensitivity.sobol_indices, link, uncertainties, 9.6, n, sampler, 0, repeat = 1)
+        # The margins are additive in eirp: its index is its share of the variance
+        first = result['first_order'][result['parameters'].index('eirp'), 0]
+        total = np.sum(result['first_order'], axis = 0)
+        ok = not any(np.any(np.isnan(result[key])) for key in ['first_order', 'total_order', 'percentiles']) \
+             and np.all(total <= 1 + sobol_sum_tolerance)
+        if not ok:
+            failed.append("sensitivity " + sampler)
+        failed += check_feature('sensitivity S1(eirp) ' + sampler, first)
+        print("Sensitivity ({}): {:.0f} runs/s, S1(eirp) {:.3f}, sum of S1 {:.3f} (max over outputs {:.3f}){}".format(
+            sampler, result['runs'] / elapsed, first, total[0], np.max(total), "" if ok else "  <-- FAIL"))
+    return failed
+
+def bench_design(heights: int = 50):
+    import dataclasses
+    import design
+    from acm import ModcodTable
+    from fsl_vs_phi_l import pass_time
+    from compare_ebno_downlink import default_link, schemes, scheme_efficiency, target_ber, coding_rate
+    link = default_link()
+
+    table = ModcodTable.from_schemes(schemes, scheme_efficiency, target_ber)
+    orbit_height, freq = np.linspace(400E3, 1200E3, heights)[:, None], np.array([2.25, 7.5, 8.2, 26.5])[None, :] * 1E9
+    elapsed, result = timed(design.optimize_design, link, table, 20E9, orbit_height, freq, 10.0, coding_rate)
+    # The closed-form designs close the link exactly at their threshold, with the target bits
+    ok = result['feasible']
+    index = {name: i for i, name in enumerate(table.names)}
+    scheme = np.array([index[name] for name in result['scheme'][ok]])
+    designed = dataclasses.replace(link, **{name: result[name][ok] for name in ['orbit_height', 'freq', 'eirp', 'antenna_gain', 'bitrate']})
+    elevation = result['threshold_elevation'][ok]
+    margin = designed.eb_to_no(elevation) - table.required_ebno[scheme]
+    bits = result['bitrate'][ok] * coding_rate * pass_time(elevation, result['orbit_height'][ok])
+    print("Design: {} points in {:.1f} ms, max |margin| {:.1e} dB, max bits error {:.1e}".format(
+        ok.size, 1E3 * elapsed, np.max(np.abs(margin)), np.max(np.abs(bits / 20E9 - 1))))
+    failed = check_feature('design max |margin| [dB]', np.max(np.abs(margin))) \
+           + check_feature('design max bits error', np.max(np.abs(bits / 20E9 - 1)))
+
+    elapsed, adaptive = timed(design.optimize_design, link, table, 20E9, orbit_height[::10], freq, 10.0, coding_rate,
+                              design.DesignSpace(), True, repeat = 1)
+    saving = result['cost'][::10] - adaptive['cost']
+    print("Design (ACM): {} points in {:.2f} s, cost saving over one scheme: min {:.2f}, mean {:.2f}".format(
+        adaptive['cost'].size, elapsed, np.nanmin(saving), np.nanmean(saving)))
+    # ACM can always fall back to the single best scheme
+    return failed + check_assertion("design: ACM costs more than one scheme", np.nanmin(saving) >= -1E-9) \
+                  + check_feature('design ACM mean saving', np.nanmean(saving))
+
+def bench_doppler(passes: int = 64, step: float = 0.1):
+    import doppler
+    from fsl_vs_phi_l import distance
+
+    freq = np.array([7.5E9, 8.15E9])[:, None]
+    max_elevation = np.linspace(5, 90, passes)[None, :]
+    elapsed, track = timed(doppler.locked_pass, 10.0, 600E3, freq, doppler.Receiver(), max_elevation, step)
+    samples = track['doppler'].size
+    # Same geometry as fsl_vs_phi_l.distance; range rate against the differentiated range
+    drift = np.max(np.abs(track['range'] / distance(track['elevation'], 600E3) - 1))
+    rate = np.max(np.abs(np.gradient(track['range'], track['t'], axis = -1) - track['range_rate'])[..., 1:-1])
+    locked = np.sum(track['locked']) / max(np.sum(track['usable']), 1)
+    print("Doppler: {} passes x {} samples in {:.1f} ms ({:.1f} ns/sample), range drift {:.1e}, range rate error {:.1e} m/s, {:.1f}% locked".format(
+        track['doppler'].shape[0] * track['doppler'].shape[1], len(track['t']), 1E3 * elapsed, 1E9 * elapsed / samples,
+        drift, rate, 100 * locked))
+    return check_feature('doppler range drift', drift) + check_feature('doppler range rate error [m/s]', rate) \
+         + check_feature('doppler locked share', locked)
+
+def bench_interference(satellites: int = 480, planes: int = 24, hours: float = 6, step: float = 10):
+    import interference
+    from orbit import Orbit, station_ecef
+
+    link = LinkBudget(antenna_gain = 30.0)
+    orbit = Orbit.walker(link.orbit_height, satellites, planes, j2 = True)
+    t = np.arange(0, hours * 3600, step)
+    elapsed, result = timed(interference.aggregate_interference, orbit, -31.4, -64.2, t, link, 10.0, repeat = 1)
+
+    # Brute force over every satellite at a few times: same serving satellite and I0/N0
+    station = station_ecef(-31.4, -64.2)
+    drift = 0.0
+    for j in np.linspace(0, len(t) - 1, 8).astype(int):
+        if result['serving'][j] < 0:
+            continue
+        rho = orbit.ecef(t[j:j + 1])[:, 0] - station
+        distance = np.linalg.norm(rho, axis = -1)
+        elevation = np.rad2deg(np.arcsin(rho @ station / (interference.re * distance)))
+        w = np.argmax(elevation)
+        others = (elevation >= 0) & (np.arange(len(rho)) != w)
+        off_axis = np.rad2deg(np.arccos(np.clip(rho[others] @ rho[w] / (distance[others] * distance[w]), -1, 1)))
+        i_to_no = link.c_to_no(elevation[w], slant_range = distance[others]) - link.antenna_gain - link.coding_gain \
+                + interference.antenna_pattern(off_axis, link.antenna_gain) - 10 * np.log10(link.bitrate)
+        drift = max(drift, abs(10 * np.log10(np.sum(10**(i_to_no / 10))) - result['i_to_n'][j]), float(w != result['serving'][j]))
+    tracked = result['serving'] >= 0
+    print("Interference: {} satellites x {} steps in {:.2f} s ({:.0f} ns per pair), {:.1f} interferers, worst degradation {:.3f} dB, brute-force drift {:.1e} dB".format(
+        satellites, len(t), elapsed, 1E9 * elapsed / (satellites * len(t)), np.mean(result['interferers'][tracked]),
+        np.nanmax(result['degradation']), drift))
+    return check_feature('interference brute-force drift [dB]', drift) \
+         + check_feature('interference worst degradation [dB]', np.nanmax(result['degradation']))
+
+# Regression gates. Golden outputs at fixed probe points must match the stored baselines within
+# golden_rtol. Throughput [ns/point] from throughput_min_points up must stay within
+# throughput_tolerance times the baseline of the machine that stored it.
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+golden_rtol = 1E-9
+# Outputs that were not meant to change: recorded from the baseline sources (commit 2bd88c9) and
+# kept by --update-baselines. The BER goldens are the exact math.erfc formula, so within ber_rtol
+baseline_golden = ['db_round_trip', 'ber_psk', 'ber_qam', 'distance', 'fsl', 'sky_temperature', 'rx_temperature',
+                   'downlink_eb_to_no']
+golden_tolerance = {'ber_psk': ber_rtol, 'ber_qam': ber_rtol}
+accuracy_points = 1000
+accuracy_targets = 50
+throughput_tolerance = 3.0
+throughput_min_points = 10**5
+throughput_sizes = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+def downlink_scenarios(n: int):
+    from sweep import default_scenario
+    schemes = np.resize(['BPSK', 'QPSK', '8-QAM', '16-QAM', '32-QAM'], n)
+    params = {name: np.full(n, value) for name, value in default_scenario.items()}
+    params['scheme'] = schemes
+    params['eirp'] = np.linspace(0, 12, n)
+    return params
+
+def golden_values():
+    from fsl_vs_phi_l import distance, fsl
+    from rx_temperature import get_rx_temperature, to_db, to_lineal_gain
+    from sweep import evaluate_scenarios
+    from compare_ebno_downlink import downlink_data
+
+    M = np.array([[2], [4], [8], [16], [32]])
+    gamma = np.array([0, 4, 8, 12, 16, 20])
+    targets = np.array([1E-3, 1E-5, 1E-7, 1E-9])
+    elevation_angle = np.array([0, 2.5, 5, 10, 20, 30, 45, 60, 90])
+    freq = np.array([2, 7.5, 8.15, 30]) * 1E9
+    study = evaluate_scenarios(downlink_scenarios(10))
+    downlink = downlink_data()['schemes']
+    values = {
+        'db_round_trip':        to_db(to_lineal_gain(10)),
+        'ber_psk':              ber_psk.BER(M, gamma),
+        'ber_qam':              ber_qam.BER(M, gamma),
+        'search_ber_psk':       ber_psk.search_ber_psk(targets, M),
+        'search_ber_qam':       ber_qam.search_ber_qam(targets, M),
+        'distance':             distance(elevation_angle, 600E3),
+        'fsl':                  fsl(distance(elevation_angle, 600E3), 7.5E9),
+        'sky_temperature':      sky_temperature.get_sky_temperature(elevation_angle),
+        'sky_temperature_table': sky_temperature.get_sky_temperature(elevation_angle[:, None], freq, 7.5),
+        'rx_temperature':       get_rx_temperature(elevation_angle[:, None], np.array([273.15, 300])),
+        'downlink_eb_to_no':    LinkBudget().eb_to_no(elevation_angle),
+        'downlink_required_ebno':       study['required_ebno'],
+        'downlink_threshold_elevation': study['threshold_elevation'],
+        'downlink_flyover_time':        study['flyover_time'],
+        # Flyover time, throughput and required Eb/No of every row of the downlink table
+        'downlink_data':        downlink[['Flyover time', 'Throughput', 'Required']].values,
+    }
+    return {name: np.asarray(value, dtype=float).tolist() for name, value in values.items()}
+
+def throughput_case(name: str, n: int):
+    # (function, arguments) evaluating n points
+    from fsl_vs_phi_l import distance, fsl
+    from rx_temperature import get_rx_temperature
+    from sweep import evaluate_scenarios, default_elevation_angle
+
+    elevation_angle = np.linspace(0, 90, n)
+    return {
+        'ber_psk':                  lambda: (ber_psk.BER, (4, np.linspace(0, 20, n))),
+        'ber_qam':                  lambda: (ber_qam.BER, (16, np.linspace(0, 20, n))),
+        'search_ber_psk':           lambda: (ber_psk.search_ber_psk, (np.logspace(-12, -2, n), 4)),
+        'search_ber_qam':           lambda: (ber_qam.search_ber_qam, (np.logspace(-12, -2, n), 16)),
+        'distance':                 lambda: (distance, (elevation_angle, 600E3)),
+        'fsl':                      lambda: (fsl, (np.linspace(6E5, 3E6, n), 7.5E9)),
+        'sky_temperature':          lambda: (sky_temperature.get_sky_temperature, (elevation_angle,)),
+        'sky_temperature_table':    lambda: (sky_temperature.get_sky_temperature, (elevation_angle, 8.15E9, 7.5)),
+        'rx_temperature':           lambda: (get_rx_temperature, (elevation_angle, 300)),
+        # End-to-end: link budget over the elevation grid, thresholds and flyover time per scenario
+        'downlink_study':           lambda: (evaluate_scenarios, (downlink_scenarios(max(1, n // len(default_elevation_angle))),)),
+    }[name]()
+
+throughput_names = ['ber_psk', 'ber_qam', 'search_ber_psk', 'search_ber_qam', 'distance', 'fsl',
+                    'sky_temperature', 'sky_temperature_table', 'rx_temperature', 'downlink_study']
+
+def load_baselines():
+    try:
+        with open(baseline_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def check_golden(baselines):
+    failed = []
+    current = golden_values()
+    stored = (baselines or {}).get('golden', {})
+    for name, value in current.items():
+        if name not in stored:
+            print("golden {}: no baseline".format(name))
+            continue
+        ref = np.asarray(stored[name], dtype=float)
+        value = np.asarray(value, dtype=float)
+        ok = value.shape == ref.shape and np.allclose(value, ref, rtol = golden_tolerance.get(name, golden_rtol), atol = 0, equal_nan = True)
+        if not ok:
+            failed.append(name)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                drift = np.nanmax(np.abs(value - ref) / np.abs(ref)) if value.shape == ref.shape else np.inf
+            print("golden {}: max rel. drift {:1.1e}  <-- FAIL".format(name, drift))
+    print("golden values: {} checked, {} failed".format(len(current), len(failed)))
+    return current, failed
+
+def check_throughput(baselines, max_points: int = throughput_sizes[-1]):
+    failed = []
+    measured = {}
+    stored = (baselines or {}).get('throughput', {})
+    for name in throughput_names:
+        measured[name] = {}
+        cells = []
+        for n in [n for n in throughput_sizes if n <= max_points]:
+            fn, args = throughput_case(name, n)
+            t, _ = timed(fn, *args, repeat = 3 if n < 10**7 else 1)
+            ns = 1E9 * t / n
+            measured[name][str(n)] = ns
+            ref = stored.get(name, {}).get(str(n))
+            gated = ref is not None and n >= throughput_min_points
+            if gated and ns > throughput_tolerance * ref:
+                # Confirm with a longer best-of before reporting, timings on shared machines are noisy
+                ns = min(ns, 1E9 * timed(fn, *args, repeat = 5)[0] / n)
+                measured[name][str(n)] = ns
+            slow = gated and ns > throughput_tolerance * ref
+            if slow:
+                failed.append("{}@{}".format(name, n))
+            cells.append("{:>6.0e}: {:8.1f}{}".format(n, ns, "" if ref is None else " ({:+4.0f}%)".format(100 * (ns / ref - 1)))
+                         + ("  <-- FAIL" if slow else ""))
+        print("{:>22} [ns/point]  ".format(name) + "  ".join(cells))
+    return measured, failed
+
+# Files kept with the CRLF line endings they were created with; every other source file is LF.
+# Converting a file hides its real changes in a whole-file diff.
+crlf_files = ['LICENSE', 'README.md', 'requirements.txt', 'ber_psk.py', 'ber_qam.py', 'calc_cnr.py', 'compare_ebno_downlink.py',
+              'fsl_vs_phi_l.py', 'maximum_rate_uplink.py', 'rain.py', 'rx_temperature.py', 'sky_temperature.py']
+
+def check_line_endings():
+    root = os.path.dirname(os.path.abspath(__file__))
+    names = sorted(set(crlf_files) | {name for name in os.listdir(root) if name.endswith(".py")})
+    failed = []
+    for name in names:
+        with open(os.path.join(root, name), "rb") as f:
+            lines = f.read().splitlines(keepends = True)
+        crlf = sum(line.endswith(b"\r\n") for line in lines)
+        lf = sum(line.endswith(b"\n") for line in lines) - crlf
+        if (lf if name in crlf_files else crlf) > 0:
+            failed.append(name)
+            print("line endings {}: {} CRLF, {} LF lines, expected {} only  <-- FAIL".format(
+                name, crlf, lf, "CRLF" if name in crlf_files else "LF"))
+    print("line endings: {} files checked, {} failed".format(len(names), len(failed)))
+    return failed
+
+def regression_gates(update: bool = False, max_points: int = throughput_sizes[-1]):
+    baselines = load_baselines()
+    if baselines is None and not update:
+        print("No baselines in {}, run with --update-baselines to store them".format(baseline_file))
+    endings_failed = check_line_endings()
+    golden, golden_failed = check_golden(baselines)
+    accuracy_failed = bench_ber(accuracy_points) + bench_search(accuracy_targets) + bench_erfcinv(accuracy_points)
+    throughput, throughput_failed = check_throughput(baselines, max_points)
+    if update:
+        stored = baselines or {}
+        kept = {name: value for name, value in stored.get('golden', {}).items() if name in baseline_golden}
+        stored['golden'] = {**golden, **kept}
+        stored.setdefault('throughput', {}).update(throughput)
+        with open(baseline_file, "w") as f:
+            json.dump(stored, f, indent = 1, sort_keys = True)
+        print("Baselines written to {}".format(baseline_file))
+        return endings_failed + accuracy_failed
+    return endings_failed + golden_failed + accuracy_failed + throughput_failed
+
+if __name__ == "__main__":
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print(f"Usage: {sys.argv[0]} [n_points] [--gates-only] [--update-baselines] [--max-points N]")
+        print(f"i.e. {sys.argv[0]} --gates-only --max-points 1000000 checks golden values and throughput up to 10^6 points")
+        sys.exit()
+
+    args = sys.argv[1:]
+    max_points = throughput_sizes[-1]
+    if '--max-points' in args:
+        i = args.index('--max-points')
+        max_points = int(float(args[i + 1]))
+        del args[i:i + 2]
+    flags = {arg for arg in args if arg.startswith('--')}
+    args = [arg for arg in args if not arg.startswith('--')]
+
+    failed = regression_gates('--update-baselines' in flags, max_points)
+    if '--gates-only' in flags:
+        sys.exit(1 if failed else 0)
+
+    n_points = int(args[0]) if len(args) >= 1 else 5000
+    failed += bench_imports()
+    failed += bench_ber(n_points)
+    failed += bench_search()
+    bench_link_budget()
+    bench_sky_temperature()
+    failed += bench_scheduler()
+    bench_ber_sim()
+    bench_fec()
+    bench_report()
+    bench_link_graph()
+    failed += bench_crossings()
+    failed += bench_coverage()
+    failed += bench_sensitivity()
+    failed += bench_design()
+    failed += bench_doppler()
+    failed += bench_interference()
+    if '--update-baselines' in flags:
+        stored = load_baselines() or {}
+        stored['features'] = measured_features
+        with open(baseline_file, "w") as f:
+            json.dump(stored, f, indent = 1, sort_keys = True)
+        print("Feature baselines written to {}".format(baseline_file))
+    sys.exit(1 if failed else 0)
@@ -1,37 +1,44 @@
 import sys
 import numpy as np
-import math
 
-default_precision = 0.5/100
+from special import log_erfc, erfcinv
+from instrument import profiled
 
-def BER(M, gamma):
+default_precision = 1E-3 # dB
+
+# Bump whenever BER() or the search change, invalidates cached thresholds
+formula_version = 1
+
+# M and gamma [dB] broadcast against each other
+@profiled
+def log_BER(M, gamma):
+    M = np.asarray(M, dtype=float)
     L = np.sqrt(M)
     k = 2 * (L - 1) / (np.log2(M) * L)
-    gamma = np.power(10, gamma / 10)
+    gamma = np.power(10, np.asarray(gamma, dtype=float) / 10)
     arg = np.sqrt(3 * np.log2(M) * gamma / (2*M - 2))
-    return k * math.erfc(arg)
+    return np.log(k) + log_erfc(arg)
+
+@profiled
+def BER(M, gamma):
+    return np.exp(log_BER(M, gamma))
 
+# Required Eb/No [dB] for BER = target, within precision [dB]. Target and
+# constellation size broadcast against each other.
+@profiled
 def search_ber_qam(target: float, constellation_size: int, precision = default_precision):
-    lb = 0
-    rb = 100
-    mb = lb + (rb - lb) / 2
-    delta = 1
-    n = 0;
-
-    while(abs(delta) > precision):
-        n += 1
-        mb = lb + (rb - lb)/2
-        B = BER(constellation_size, mb)
-        delta = (target - B) / B if B != 0 else 1e6 # Avoid division by infinity
-        delta = min(delta, 1e6)
-        # print("[{}] T: {} C: {:1.2e} \t({}%) \t({:1.2f} {:1.2f} {:1.2f})".format(n, target, B, int(100*delta), lb, mb, rb))
-
-        if(delta > 0):
-            rb = mb
-        else:
-            lb = mb
-
-    return mb
+    # BER = k * erfc(a * sqrt(gamma)) inverts in closed form through erfcinv
+    M = np.asarray(constellation_size, dtype=float)
+    L = np.sqrt(M)
+    k = 2 * (L - 1) / (np.log2(M) * L)
+    a = np.sqrt(3 * np.log2(M) / (2*M - 2))
+    y = np.asarray(target, dtype=float) / k
+    x = erfcinv(y, precision * np.log(10) / 20)
+
+    # Targets above k are met at any Eb/No; NaN where erfcinv did not converge
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.where(y >= 1, -np.inf, 20 * np.log10(x / a))
+    return gamma[()]
 
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -50,5 +57,5 @@ if __name__ == "__main__":
     assert( M > 1 )
     assert( pow(base, power) > 0 )
     target = pow(base, power)
-    gamma = search_ber_qam(target, M)
+    gamma = search_ber_qam(target, M, default_precision)
     print("Found BER = {:1.2e} at Eb/No = {:.2f} dB".format(BER(M, gamma), gamma))
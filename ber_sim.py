@@ -0,0 +1,190 @@
+import os
+import sys
+import numpy as np
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+import ber_psk
+import ber_qam
+from thresholds import parse_scheme
+
+def gray(n):
+    return n ^ (n >> 1)
+
+# Constellation indexed by bit label: points[label]. Demodulation slices the received samples
+# onto a rectangular lattice of odd levels (lattice[ix, iy] is the label there, -1 where the
+# lattice has no point), or by angle for PSK.
+@dataclass
+class Modem:
+    name:       str
+    points:     np.ndarray
+    kind:       str                     # 'psk' or 'qam'
+    lattice:    np.ndarray = None
+    unit:       float = 1.0             # Amplitude of the odd lattice level 1
+
+    @property
+    def bits_per_symbol(self):
+        return int(np.log2(len(self.points)))
+
+    @classmethod
+    def psk(cls, M: int, name: str = None):
+        label = gray(np.arange(M))
+        points = np.empty(M, dtype=complex)
+        points[label] = np.exp(2j * np.pi * np.arange(M) / M)
+        return cls(name or "{}-PSK".format(M), points, 'psk')
+
+    @classmethod
+    def qam(cls, M: int, name: str = None):
+        # Square for even log2(M); 8-QAM as a 4 x 2 rectangle; otherwise a cross built from a
+        # 2^(n+1) x 2^n Gray rectangle by folding its outer columns onto new rows (Smith, 1975)
+        k = int(np.log2(M))
+        nx, ny = 2**((k + 1) // 2), 2**(k // 2)
+        ix, iy = np.meshgrid(np.arange(nx), np.arange(ny), indexing = 'ij')
+        label = (gray(ix) << (k // 2)) | gray(iy)
+        x, y = 2 * ix - (nx - 1), 2 * iy - (ny - 1)
+
+        if k % 2 == 1 and k >= 5:
+            n = (k - 1) // 2
+            core = 2**(n + 1) - 1 - 2**(n - 1)          # Half width of the cross
+            moved = np.abs(x) > core
+            j = (np.abs(x[moved]) - core) // 2
+            x[moved], y[moved] = np.sign(x[moved]) * (2**n - np.abs(y[moved])), np.sign(y[moved]) * (2**n - 1 + 2 * j)
+
+        points = np.empty(M, dtype=complex)
+        points[label.ravel()] = x.ravel() + 1j * y.ravel()
+        unit = 1 / np.sqrt(np.mean(np.abs(points)**2))
+
+        size = np.max(np.abs(np.concatenate([x.ravel(), y.ravel()])))
+        lattice = np.full((size + 1, size + 1), -1)
+        lattice[(x.ravel() + size) // 2, (y.ravel() + size) // 2] = label.ravel()
+        return cls(name or "{}-QAM".format(M), points * unit, 'qam', lattice, unit)
+
+    @classmethod
+    def from_name(cls, name: str):
+        scheme, M = parse_scheme(name)
+        return cls.psk(M, name) if scheme == 'psk' else cls.qam(M, name)
+
+    def demodulate(self, received):
+        # Hard decision, minimum distance
+        M = len(self.points)
+        if self.kind == 'psk':
+            index = np.rint(np.angle(received) * (M / (2 * np.pi))).astype(int)
+            return gray(index & (M - 1))
+
+        # Nearest lattice point per axis, in units of the odd levels
+        levels = self.lattice.shape[0]
+        u = received / self.unit
+        ix = np.clip(np.rint((u.real + levels - 1) / 2), 0, levels - 1).astype(int)
+        iy = np.clip(np.rint((u.imag + levels - 1) / 2), 0, levels - 1).astype(int)
+        label = self.lattice[ix, iy]
+        # Cells the constellation leaves empty (cross corners): search every point
+        empty = label < 0
+        if np.any(empty):
+            label[empty] = np.argmin(np.abs(received[empty, None] - self.points[None, :]), axis = 1)
+        return label
+
+popcount = np.array([bin(i).count('1') for i in range(1 << 10)])
+
+def bit_errors(modem: Modem, ebno: float, n_symbols: int, rng: np.random.Generator):
+    # Bit errors over n_symbols random symbols through AWGN at Eb/No [dB]
+    k = modem.bits_per_symbol
+    labels = rng.integers(0, len(modem.points), n_symbols)
+    sigma = np.sqrt(np.mean(np.abs(modem.points)**2) / (2 * k * 10**(ebno / 10)))
+    # Interleaved normal pairs viewed as complex samples, scaled and offset in place
+    received = rng.standard_normal(2 * n_symbols).view(complex)
+    received *= sigma
+    received += modem.points[labels]
+    return int(np.sum(popcount[labels ^ modem.demodulate(received)]))
+
+def simulate_blocks(name: str, ebno: float, n_blocks: int, block_size: int, seed, target_errors: float = np.inf):
+    modem = Modem.from_name(name)
+    rng = np.random.default_rng(seed)
+    errors = bits = 0
+    for _ in range(n_blocks):
+        errors += bit_errors(modem, ebno, block_size, rng)
+        bits += block_size * modem.bits_per_symbol
+        if errors >= target_errors:
+            break
+    return errors, bits
+
+def simulate_ber(name: str, ebno: float, target_errors: int = 100, max_bits: float = 1E9,
+                 block_size: int = 1 << 18, seed = None, workers: int = 1, executor = None):
+    # BER at Eb/No [dB], stopping once target_errors bit errors (or max_bits bits) are seen.
+    # With workers > 1, rounds of blocks run across a process pool with independent streams.
+    # Returns (ber, errors, bits).
+    sequence = np.random.SeedSequence(seed)
+    bits_per_block = block_size * Modem.from_name(name).bits_per_symbol
+    errors = bits = 0
+
+    if workers <= 1 and executor is None:
+        n_blocks = int(np.ceil(max_bits / bits_per_block))
+        errors, bits = simulate_blocks(name, ebno, n_blocks, block_size, sequence, target_errors)
+        return errors / bits, errors, bits
+
+    pool = executor or ProcessPoolExecutor(workers)
+    try:
+        per_task = 4
+        while errors < target_errors and bits < max_bits:
+            seeds = sequence.spawn(workers)
+            for e, b in pool.map(simulate_blocks, [name] * workers, [ebno] * workers,
+                                 [per_task] * workers, [block_size] * workers, seeds):
+                errors, bits = errors + e, bits + b
+            # Size the next round from the error rate seen so far
+            if errors > 0:
+                missing = (target_errors - errors) * bits / errors
+                per_task = int(np.clip(np.ceil(missing / (workers * bits_per_block)), 1, 64))
+            else:
+                per_task = min(2 * per_task, 64)
+    finally:
+        if executor is None:
+            pool.shutdown()
+    return errors / bits, errors, bits
+
+def analytic_ber(name: str, ebno):
+    scheme, M = parse_scheme(name)
+    return (ber_psk.BER if scheme == 'psk' else ber_qam.BER)(M, ebno)
+
+def ber_curves(names, ebno, min_ber: float = 1E-6, **kwargs):
+    # Simulated BER of every scheme over the Eb/No grid [dB], stopping each curve below min_ber
+    curves = {}
+    for name in names:
+        ber = np.full(len(ebno), np.nan)
+        for i, gamma in enumerate(ebno):
+            ber[i] = simulate_ber(name, gamma, **kwargs)[0]
+            if ber[i] < min_ber:
+                break
+        curves[name] = ber
+    return curves
+
+def main():
+    from compare_ebno_downlink import schemes
+
+    workers = int(sys.argv[1]) if len(sys.argv) >= 2 else os.cpu_count()
+    target_errors = int(sys.argv[2]) if len(sys.argv) >= 3 else 100
+    ebno = np.arange(0, 20.5, 1.0)
+
+    curves = ber_curves(schemes, ebno, target_errors = target_errors, workers = workers, seed = 0)
+    for name, ber in curves.items():
+        print("{:>8}: ".format(name) + " ".join("{:1.1e}/{:1.1e}".format(s, a)
+                                                 for s, a in zip(ber, analytic_ber(name, ebno)) if not np.isnan(s)))
+
+    import matplotlib.pyplot as plt
+    import figures
+
+    plt.figure(figsize = (8, 6))
+    for (name, ber), color in zip(curves.items(), plt.rcParams['axes.prop_cycle'].by_key()['color']):
+        fine = np.linspace(ebno[0], ebno[-1], 400)
+        plt.semilogy(fine, analytic_ber(name, fine), '--', color = color, label = "{} analytic".format(name))
+        plt.semilogy(ebno, ber, 'o', color = color, label = "{} simulated".format(name))
+    plt.ylim(1E-7, 1)
+    plt.title("Bit error rate, simulated (Gray mapping, AWGN) vs. analytic")
+    plt.xlabel("Eb/No [dB]")
+    plt.ylabel("BER")
+    plt.grid(True, which = 'both')
+    plt.legend(ncol = 2)
+    plt.tight_layout()
+    figures.save(plt.gcf(), "ber_simulated_vs_analytic")
+    figures.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # Windows: no lock, concurrent writers may drop each other's entries
+
+# On-disk cache shared by every script and batch job (threshold tables, lookup tables)
+cache_dir = os.environ.get("SATCOM_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+
+def cache_path(name: str):
+    return os.path.join(cache_dir, name)
+
+@contextlib.contextmanager
+def locked(name: str):
+    # Exclusive lock on name across processes, for read-modify-write updates of a cache file.
+    # Held on a separate lock file, since the file itself is replaced.
+    os.makedirs(cache_dir, exist_ok = True)
+    with open(cache_path(name + ".lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
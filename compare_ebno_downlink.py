@@ -1,28 +1,18 @@
-import matplotlib.pyplot as plt
+import functools
 import numpy as np
-import pandas as pd
-
-from ber_psk import search_ber_psk
-from ber_qam import search_ber_qam
-from fsl_vs_phi_l import distance, fsl, elevation_angle_to_earth_angle
-from sky_temperature import get_sky_temperature
-from ber_psk import BER
-from rx_temperature import get_rx_temperature
-
-def pass_time(elevation_angle: float):
-    te = 23*60*60   + 56*60 + 4
-    ts = 1*60*60    + 36*60 + 32.5
-    angle = elevation_angle_to_earth_angle(elevation_angle, 650E3)
-    return angle / 180 * (ts / (1 - ts/te))
- 
+
+from thresholds import required_gammas
+from fsl_vs_phi_l import pass_time
+from link_budget import LinkBudget
+from acm import ModcodTable, pass_throughput
+from crossings import threshold_elevation
+import doppler
+import fec
+from instrument import profiled, span
+
 target_ber = 10**-5
 
-scheme_required_gamma = dict()
-scheme_required_gamma['BPSK']   = search_ber_psk(target_ber, 2, 1/100)
-scheme_required_gamma['QPSK']   = search_ber_psk(target_ber, 4, 1/100)
-scheme_required_gamma['8-QAM']  = search_ber_qam(target_ber, 8, 1/100)
-scheme_required_gamma['16-QAM'] = search_ber_qam(target_ber, 16, 1/100)
-scheme_required_gamma['32-QAM'] = search_ber_qam(target_ber, 32, 1/100)
+schemes = ['BPSK', 'QPSK', '8-QAM', '16-QAM', '32-QAM']
 
 scheme_efficiency = dict()
 scheme_efficiency['BPSK']       = 1
@@ -31,137 +21,229 @@ scheme_efficiency['8-QAM']      = np.sqrt(8)
 scheme_efficiency['16-QAM']     = 4
 scheme_efficiency['32-QAM']     = np.sqrt(32)
 
-# Dataframe for storing schemes performance
-df = pd.DataFrame(columns=['Scheme', 'Flyover time', 'Throughput'])
-
 # System variables
 orbit_height            = 600E3;
 freq                    = (7.25 + 7.75) * 0.5E9;
 bitrate                 = 70E6;
-k_boltzmann             = -10*np.log10(1.38064852E-23)
 system_phys_temperature = 300
-coding_rate             = 223 / 255
-
-elevation_angle         = np.arange(0, 90.2, 0.2)
-receiver_temperature    = get_rx_temperature(elevation_angle, system_phys_temperature)
-distance_to_satellite   = distance(elevation_angle, orbit_height)
-free_space_losses       = fsl(distance_to_satellite, freq)
+fec_code                = 'RS(255,223)'
+coding_rate             = fec.codes[fec_code].rate
 
 satellite_eirp          = 0 + 6.9    # 0 dBw + 6.9 dBi
-coding_gain             = 5
 terminal_antenna_gain   = 47
 
 additional_losses       = 1.5 + 4 - 1.4
 
-gains       = satellite_eirp + terminal_antenna_gain + coding_gain + k_boltzmann
-losses      = free_space_losses + additional_losses + 10 * np.log10(receiver_temperature)
-c_to_no     = gains - losses
-eb_to_no    = c_to_no - 10 * np.log10(bitrate)
+@functools.lru_cache(maxsize = 1)
+def coding_gain():
+    # Of fec_code at target_ber, with BPSK as reference. Computed on first use, since it reads
+    # (and may write) the FEC and threshold caches, which importing must not
+    return fec.coding_gain(fec_code, 'BPSK', target_ber)
+
+def default_link():
+    return LinkBudget(
+        orbit_height        = orbit_height,
+        freq                = freq,
+        bitrate             = bitrate,
+        eirp                = satellite_eirp,
+        antenna_gain        = terminal_antenna_gain,
+        coding_gain         = coding_gain(),
+        additional_losses   = additional_losses,
+        phys_temperature    = system_phys_temperature)
+
+# Ground receiver: the time it takes to lock onto the Doppler-shifted carrier is lost from
+# every pass
+receiver = doppler.Receiver()
+
+# Shared with link_graph, so that both count a pass the same way
+def closing_elevation(crossing):
+    # Elevation where each threshold is met for the rest of the pass (crossings.threshold_elevation),
+    # NaN where the link closes only at the zenith or never. A threshold met over the whole grid
+    # closes at its first elevation: the full flyover
+    crossing = np.asarray(crossing, dtype=float)
+    return np.where(crossing < 90, crossing, np.nan)
+
+def contact_time(crossing, orbit_height, freq, receiver: doppler.Receiver = receiver):
+    # [s] of an overhead pass above each closing elevation with the receiver locked (without
+    # receiver, the whole flyover), 0 where the link never closes
+    crossing = closing_elevation(crossing)
+    locked = 1.0
+    if receiver is not None:
+        locked = doppler.contact_fraction(np.nan_to_num(crossing, nan = 90.0), orbit_height, freq, receiver)
+    return np.nan_to_num(pass_time(crossing, orbit_height)) * locked
+
+def acm_contact(table: ModcodTable, elevation_angle, eb_to_no, orbit_height, freq, receiver: doppler.Receiver = receiver):
+    # (contact time [s], bits/Hz) of an overhead pass switching to the best scheme met at each
+    # elevation, with the time lost while acquiring and its share of the bits at the schemes used
+    # then. None where no scheme closes the link.
+    visible = table.select(eb_to_no) >= 0
+    if not visible.any():
+        return None
+    first = elevation_angle[visible][0]
+    share, efficiency_share = 1.0, 1.0
+    if receiver is not None:
+        share = doppler.contact_fraction(first, orbit_height, freq, receiver)
+        efficiency_share = doppler.contact_fraction(first, orbit_height, freq, receiver,
+            weights = lambda e: table.spectral_efficiency(np.interp(e, elevation_angle, eb_to_no)))
+    return pass_time(first, orbit_height) * share, pass_throughput(table, elevation_angle, eb_to_no, orbit_height) * efficiency_share
+
+def downlink_data(link: LinkBudget = None, coding_rate: float = coding_rate, target: float = target_ber, code: str = None,
+                  receiver: doppler.Receiver = receiver):
+    import pandas as pd
+
+    link = default_link() if link is None else link
+    # Thresholds of the uncoded schemes (the link carries the coding gain), or with code, the
+    # coded thresholds of fec.required_ebno (and a link without coding gain)
+    if code is None:
+        scheme_required_gamma = required_gammas(schemes, target, 1/100)
+    else:
+        scheme_required_gamma = {scheme: fec.required_ebno(code, scheme, target) for scheme in schemes}
+
+    # Schemes performance, one row per scheme (and margin)
+    rows = []
+    annotations = []
+
+    elevation_angle         = np.arange(0, 90.2, 0.2)
+    eb_to_no                = link.eb_to_no(elevation_angle)
+
+    # Elevation where each scheme (and with a 4-dB margin) closes the link: crossings of the
+    # sampled curve, refined on link.eb_to_no
+    required = np.array(list(scheme_required_gamma.values()))
+    crossing = closing_elevation(threshold_elevation(elevation_angle, eb_to_no, np.concatenate([required, required + 4]), link.eb_to_no))
+
+    # Effective contact time: the flyover with the receiver locked
+    contact = contact_time(crossing, link.orbit_height, link.freq, receiver)
+
+    # Evaluate schemes performance
+    for i, ((scheme, gamma), intersect, margin_intersect) in enumerate(zip(scheme_required_gamma.items(), crossing[:len(required)], crossing[len(required):])):
+        # Check if the scheme closes the link
+        if np.isfinite(intersect):
+            annotations.append((scheme, intersect, gamma))
 
-fig1, top_ax = plt.subplots(1, figsize=(8, 4))
-fig2, bot_ax = plt.subplots(1, figsize=(8, 4))
+            obj = {
+                "Scheme"        : scheme,
+                "Flyover time"  : contact[i],
+                "Throughput"    : contact[i] * scheme_efficiency[scheme],
+                "Required"      : gamma}
+            rows.append(obj)
+
+            # Repeat for 4-dB margin
+            if np.isfinite(margin_intersect):
+                obj = {
+                    "Scheme"        : scheme + ' (4 dB margin)',
+                    "Flyover time"  : contact[len(required) + i],
+                    "Throughput"    : contact[len(required) + i] * scheme_efficiency[scheme],
+                    "Required"      : gamma + 4}
+                rows.append(obj)
+
+    df = pd.DataFrame(rows, columns=['Scheme', 'Flyover time', 'Throughput', 'Required'])
+    df = df.sort_values('Required')
+
+    # Adaptive coding and modulation: switch to the best scheme met at each elevation
+    for margin, label in [(0, 'ACM'), (4, 'ACM (4 dB margin)')]:
+        table = ModcodTable.from_schemes(schemes, scheme_efficiency, target, margin, required = scheme_required_gamma)
+        acm = acm_contact(table, elevation_angle, eb_to_no, link.orbit_height, link.freq, receiver)
+        if acm is not None:
+            df.loc[len(df)] = [label, *acm, np.nan]
+
+    # Sort the schemes performance by their throughput
+    df = df.sort_values('Throughput')
+
+    # Correct the throughput by the coding rate
+    df['Throughput'] *= coding_rate
+
+    return {
+        'elevation_angle':  elevation_angle,
+        'eb_to_no':         eb_to_no,
+        'target':           target,
+        'annotations':      annotations,
+        'schemes':          df,
+    }
+
+def plot_ebno_vs_angle(data: dict):
+    import matplotlib.pyplot as plt
+
+    fig1, top_ax = plt.subplots(1, figsize=(8, 4))
+
+    ###### Plot Eb/No ######
+    top_ax.plot(data['elevation_angle'], data['eb_to_no'], color="indianred", label="$E_b/N_0$")
+
+    top_ax.set_title("$E_b/N_0$ vs. elevation angle, and threshold elevation angle\nto achieve BER $<10^{}$ for different modulation schemes".format(int(np.log10(data['target']))))
+
+    top_ax.set_xlabel("Elevation angle [deg]")
+    top_ax.set_ylabel("$E_b/N_0$")
+    ########################
 
-###### Plot Eb/No ######
-top_ax.plot(elevation_angle, eb_to_no, color="indianred", label="$E_b/N_0$")
+    arrowprops = dict(facecolor='black', arrowstyle='->')
+    for scheme, intersect, gamma in data['annotations']:
+        # Annotate the result on the plot
+        top_ax.annotate(scheme, (intersect, gamma), (intersect, gamma - 2), fontsize=14, arrowprops=arrowprops)
 
-top_ax.set_title("$E_b/N_0$ vs. elevation angle, and threshold elevation angle\nto achieve BER $<10^{}$ for different modulation schemes".format(int(np.log10(target_ber))))
+    top_ax.xaxis.set_major_locator(plt.MultipleLocator(5))
+    top_ax.yaxis.set_major_locator(plt.MultipleLocator(1))
+    top_ax.set_xlim(90, 20)
+    top_ax.set_ylim(5, 16)
+    top_ax.legend()
+    top_ax.grid(True, which="major", axis="both")
+    top_ax.grid(True, which="minor", axis="y")
 
-top_ax.set_xlabel("Elevation angle [deg]")
-top_ax.set_ylabel("$E_b/N_0$")
-########################
+    #Show minor grid
+    # top_ax.minorticks_on()
 
-# Evaluate schemes performance
-for scheme, gamma in scheme_required_gamma.items():
-    # Find angle at which the scheme satisfies the Eb/No requirement
-    intersect = np.argmin( np.abs(eb_to_no - gamma) )
-    intersect = elevation_angle[intersect]
+    fig1.tight_layout()
+    return fig1
 
-    arrowprops = dict(facecolor='black', arrowstyle='->')
+def plot_throughput(data: dict):
+    import matplotlib.pyplot as plt
 
-    # Check if the requirement is within the plot bounds
-    if(intersect < 90 and intersect > min(elevation_angle)):
-        # Annotate the result on the plot
-        top_ax.annotate(scheme, (intersect, gamma), (intersect, gamma - 2), fontsize=14, arrowprops=arrowprops)
+    df = data['schemes']
+    fig2, bot_ax = plt.subplots(1, figsize=(8, 4))
 
-        obj = {
-            "Scheme"        : scheme,
-            "Flyover time"  : pass_time(intersect),
-            "Throughput"    : pass_time(intersect) * scheme_efficiency[scheme],
-            "Required"      : gamma}
-        df = df.append(obj, ignore_index=True)
-        # print(scheme, intersect)
-
-        # Repeat for 4-dB margin
-        intersect = np.argmin( np.abs(eb_to_no - gamma - 4) )
-        intersect = elevation_angle[intersect]
-        if intersect < 90 and intersect > min(elevation_angle):
-            # print(scheme, intersect)
-            obj = {
-                "Scheme"        : scheme + ' (4 dB margin)',
-                "Flyover time"  : pass_time(intersect),
-                "Throughput"    : pass_time(intersect) * scheme_efficiency[scheme],
-                "Required"      : gamma + 4}
-            df = df.append(obj, ignore_index=True)
-
-df = df.sort_values('Required')
-text = []
-for scheme in df.values:
-    text.append(scheme[0] + ": " + "{:2.1f}".format(scheme[3]) + " dB")
-
-# Sort the schemes performance by their throughput
-df = df.sort_values('Throughput')
-
-# Correct the throughput by the coding rate
-df['Throughput'] *= coding_rate
-
-# Bar plot
-if not df.empty:
-    df.plot('Scheme', 'Throughput', ax = bot_ax, kind='bar')
-    for i, [scheme, req] in enumerate(df[['Scheme', 'Throughput']].values):
-        bot_ax.text(i, req, int(req), horizontalalignment='center', verticalalignment='bottom')
-
-bot_ax.set_xlabel('')
-bot_ax.set_title("Data throughput per unit bandwidth")
-bot_ax.set_ylabel("Bits/Hz")
-
-# Plot schemes thresholds
-props = dict(boxstyle='round', facecolor='white', alpha=0.5,)
-
-text_string = ""
-while text:
-    text_string += text.pop() + '\n'
-text_string = text_string[:-1]
-bot_ax.text(0.02, 0.5,
-            text_string,
-            transform=bot_ax.transAxes, fontsize=14, verticalalignment='center', bbox=props)
-
-
-# Plot throughput equation text
-bot_ax.text(0.02, 0.85,
-            "$throughput = flyover\ time * bandwidth\ efficiency$",
-            transform=bot_ax.transAxes, fontsize=14, verticalalignment='top', bbox=props)
-
-#Rotate x labels
-for label in bot_ax.xaxis.get_ticklabels():
-    label.set_rotation(11.25)
-
-top_ax.xaxis.set_major_locator(plt.MultipleLocator(5))
-top_ax.yaxis.set_major_locator(plt.MultipleLocator(1))
-top_ax.set_xlim(90, 20)
-top_ax.set_ylim(5, 16)
-top_ax.legend()
-top_ax.grid(True, which="major", axis="both")
-top_ax.grid(True, which="minor", axis="y")
-
-#Show minor grid
-# top_ax.minorticks_on()
-
-fig1.tight_layout()
-fig1.savefig ("output/ebno_vs_angle.svg")
-fig1.savefig ("output/ebno_vs_angle.png")
-
-fig2.tight_layout()
-fig2.savefig ("output/data_throughput.svg")
-fig2.savefig ("output/data_throughput.png")
-
-plt.show()
+    # Bar plot
+    if not df.empty:
+        df.plot('Scheme', 'Throughput', ax = bot_ax, kind='bar')
+        for i, [scheme, req] in enumerate(df[['Scheme', 'Throughput']].values):
+            bot_ax.text(i, req, int(req), horizontalalignment='center', verticalalignment='bottom')
+
+    bot_ax.set_xlabel('')
+    bot_ax.set_title("Data throughput per unit bandwidth")
+    bot_ax.set_ylabel("Bits/Hz")
+
+    # Plot schemes thresholds, the highest first
+    props = dict(boxstyle='round', facecolor='white', alpha=0.5,)
+
+    thresholds = df.dropna(subset=['Required']).sort_values('Required', ascending=False)
+    text_string = "\n".join(scheme + ": " + "{:2.1f}".format(req) + " dB"
+                            for scheme, req in thresholds[['Scheme', 'Required']].values)
+    bot_ax.text(0.02, 0.5,
+                text_string,
+                transform=bot_ax.transAxes, fontsize=14, verticalalignment='center', bbox=props)
+
+
+    # Plot throughput equation text
+    bot_ax.text(0.02, 0.85,
+                "$throughput = flyover\\ time * bandwidth\\ efficiency$",
+                transform=bot_ax.transAxes, fontsize=14, verticalalignment='top', bbox=props)
+
+    #Rotate x labels
+    for label in bot_ax.xaxis.get_ticklabels():
+        label.set_rotation(11.25)
+
+    fig2.tight_layout()
+    return fig2
+
+@profiled
+def main():
+    import figures
+
+    data = downlink_data()
+    fig1, fig2 = plot_ebno_vs_angle(data), plot_throughput(data)
+
+    with span("savefig"):
+        figures.save(fig1, "ebno_vs_angle")
+        figures.save(fig2, "data_throughput")
+
+    figures.show()
+
+if __name__ == "__main__":
+    main()
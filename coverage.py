@@ -0,0 +1,165 @@
+import os
+import sys
+import numpy as np
+
+from fsl_vs_phi_l import re, fsl, elevation_angle_to_earth_angle
+from orbit import Orbit
+from link_budget import LinkBudget
+from instrument import profiled, count
+
+default_max_pairs = 1 << 22     # (sample, cell) pairs evaluated at once
+
+# Regular latitude/longitude grid of cell centres, resolution [deg]
+def ground_grid(resolution: float):
+    latitude = np.arange(-90 + resolution / 2, 90, resolution)
+    longitude = np.arange(-180 + resolution / 2, 180, resolution)
+    return latitude, longitude
+
+def visible_cells(sub_latitude, sub_longitude, cap, latitude, longitude):
+    # Pruning: the cells of each sample's visibility cone, a spherical cap of half angle cap [deg]
+    # around the sub-satellite point. Rows within cap of the sub-satellite latitude, and in
+    # each row the longitudes within the cap at that latitude (one extra column per side, for
+    # rounding; the exact elevation test follows). Returns (sample, row, column) of every pair.
+    resolution = longitude[1] - longitude[0] if len(longitude) > 1 else 360.0
+    n_lon = len(longitude)
+    first = np.searchsorted(latitude, sub_latitude - cap, side = 'left')
+    last = np.searchsorted(latitude, sub_latitude + cap, side = 'right')
+    rows = last - first
+    sample = np.repeat(np.arange(len(sub_latitude)), rows)
+    row = np.arange(np.sum(rows)) - np.repeat(np.cumsum(rows) - rows, rows) + np.repeat(first, rows)
+
+    phi, phi_s = np.deg2rad(latitude[row]), np.deg2rad(sub_latitude[sample])
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        cos_half = (np.cos(np.deg2rad(cap[sample])) - np.sin(phi) * np.sin(phi_s)) / (np.cos(phi) * np.cos(phi_s))
+    half_width = np.rad2deg(np.arccos(np.clip(np.nan_to_num(cos_half, nan = -1.0), -1, 1)))
+
+    start = np.ceil((sub_longitude[sample] - half_width - longitude[0]) / resolution).astype(int) - 1
+    stop = np.floor((sub_longitude[sample] + half_width - longitude[0]) / resolution).astype(int) + 2
+    width = np.minimum(stop - start, n_lon)     # Caps over a pole span every longitude
+    pairs = np.repeat(np.arange(len(sample)), width)
+    column = (np.arange(np.sum(width)) - np.repeat(np.cumsum(width) - width, width) + np.repeat(start, width)) % n_lon
+    return sample[pairs], row[pairs], column
+
+@profiled
+def coverage_maps(orbit: Orbit, t, link: LinkBudget, required_ebno: float, resolution: float = 1.0,
+                  min_elevation: float = 0.0, coding_rate: float = 1.0, max_pairs: int = default_max_pairs):
+    # Per-cell statistics of every satellite in orbit over the samples t [s], on a regular
+    # grid: time above min_elevation, usable time (Eb/No >= required_ebno) and bits delivered
+    # at link.bitrate, best elevation, slant range, FSL and Eb/No. Samples are processed in
+    # chunks of at most about max_pairs (sample, cell) pairs, and only the cells inside each
+    # sample's visibility cone are evaluated.
+    t = np.asarray(t, dtype=float)
+    latitude, longitude = ground_grid(resolution)
+    shape = (len(latitude), len(longitude))
+    step = np.gradient(t) if len(t) > 1 else np.ones_like(t)
+
+    r = orbit.ecef(t).reshape(-1, 3)            # Every satellite's samples, one after the other
+    sample_step = np.tile(step, len(r) // len(t))
+    radius = np.linalg.norm(r, axis = -1)
+    sub_latitude = np.rad2deg(np.arcsin(r[:, 2] / radius))
+    sub_longitude = np.rad2deg(np.arctan2(r[:, 1], r[:, 0]))
+    cap = elevation_angle_to_earth_angle(min_elevation, radius - re)
+
+    cos_lat, sin_lat = np.cos(np.deg2rad(latitude)), np.sin(np.deg2rad(latitude))
+    cos_lon, sin_lon = np.cos(np.deg2rad(longitude)), np.sin(np.deg2rad(longitude))
+
+    cells = shape[0] * shape[1]
+    contact_time, usable_time = np.zeros(cells), np.zeros(cells)
+    max_elevation, max_eb_to_no = np.full(cells, -np.inf), np.full(cells, -np.inf)
+    min_slant_range = np.full(cells, np.inf)
+
+    # Chunks of samples from a rough count of the cells in their caps (cap area, with room for
+    # the denser cells at high latitudes)
+    cap_cells = (1 - np.cos(np.deg2rad(cap))) / 2 * cells * 1.5 + 2 * shape[1]
+    edges = np.flatnonzero(np.diff((np.cumsum(cap_cells) // max_pairs).astype(int))) + 1
+    for lo, hi in zip(np.append(0, edges), np.append(edges, len(r))):
+        sample, row, column = visible_cells(sub_latitude[lo:hi], sub_longitude[lo:hi], cap[lo:hi], latitude, longitude)
+        sample += lo
+
+        # Look angles of every pair (orbit.look_angles, one component at a time)
+        sx, sy, sz = re * cos_lat[row] * cos_lon[column], re * cos_lat[row] * sin_lon[column], re * sin_lat[row]
+        dx, dy, dz = r[sample, 0] - sx, r[sample, 1] - sy, r[sample, 2] - sz
+        slant_range = np.sqrt(dx * dx + dy * dy + dz * dz)
+        elevation = np.rad2deg(np.arcsin(np.clip((dx * sx + dy * sy + dz * sz) / (re * slant_range), -1, 1)))
+
+        visible = elevation >= min_elevation
+        count("coverage pairs", len(sample))
+        count("coverage visible pairs", np.sum(visible))
+        cell = (row * shape[1] + column)[visible]
+        elevation, slant_range, dt = elevation[visible], slant_range[visible], sample_step[sample[visible]]
+        eb_to_no = link.eb_to_no(elevation, slant_range = slant_range)
+
+        contact_time += np.bincount(cell, dt, cells)
+        usable_time += np.bincount(cell, np.where(eb_to_no >= required_ebno, dt, 0.0), cells)
+        np.maximum.at(max_elevation, cell, elevation)
+        np.maximum.at(max_eb_to_no, cell, eb_to_no)
+        np.minimum.at(min_slant_range, cell, slant_range)
+
+    maps = {
+        'contact_time':     contact_time,
+        'usable_time':      usable_time,
+        'bits':             usable_time * link.bitrate * coding_rate,
+        'max_elevation':    np.where(np.isfinite(max_elevation), max_elevation, np.nan),
+        'min_slant_range':  np.where(np.isfinite(min_slant_range), min_slant_range, np.nan),
+        'max_eb_to_no':     np.where(np.isfinite(max_eb_to_no), max_eb_to_no, np.nan),
+    }
+    maps['min_fsl'] = fsl(maps['min_slant_range'], link.freq)
+    return {'latitude': latitude, 'longitude': longitude, **{name: value.reshape(shape) for name, value in maps.items()}}
+
+def save_maps(maps: dict, output_dir: str):
+    # One .npy file per map (and the grid axes), loadable with np.load(..., mmap_mode = 'r')
+    os.makedirs(output_dir, exist_ok = True)
+    for name, value in maps.items():
+        np.save(os.path.join(output_dir, name + ".npy"), value)
+
+def plot_maps(maps: dict, names = ('contact_time', 'bits')):
+    import matplotlib.pyplot as plt
+
+    labels = {'contact_time': "Contact time [h]", 'usable_time': "Usable time [h]", 'bits': "Deliverable data [Gbit]",
+              'max_elevation': "Max. elevation [deg]", 'max_eb_to_no': "Max. $E_b/N_0$ [dB]"}
+    scale = {'contact_time': 1 / 3600, 'usable_time': 1 / 3600, 'bits': 1E-9}
+    fig, axes = plt.subplots(len(names), 1, figsize = (9, 4.5 * len(names)), squeeze = False)
+    extent = [-180, 180, -90, 90]
+    for ax, name in zip(axes[:, 0], names):
+        image = ax.imshow(maps[name] * scale.get(name, 1), origin = 'lower', extent = extent, aspect = 'auto', cmap = 'viridis')
+        fig.colorbar(image, ax = ax, label = labels.get(name, name))
+        ax.set_xlabel("Longitude [deg]")
+        ax.set_ylabel("Latitude [deg]")
+        ax.set_title(labels.get(name, name))
+    fig.tight_layout()
+    return fig
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [resolution] [hours] [satellites] [step] [output_dir]")
+        print(f"i.e. {sys.argv[0]} 0.5 24 4 30 output/coverage maps one day of 4 satellites on a 0.5 deg grid, sampled every 30 s")
+        sys.exit()
+
+    import time
+    from thresholds import required_gamma
+    from compare_ebno_downlink import default_link, target_ber, coding_rate
+    link = default_link()
+
+    resolution = float(sys.argv[1]) if len(sys.argv) >= 2 else 1.0
+    hours = float(sys.argv[2]) if len(sys.argv) >= 3 else 24
+    satellites = int(sys.argv[3]) if len(sys.argv) >= 4 else 2
+    step = float(sys.argv[4]) if len(sys.argv) >= 5 else 30
+    output_dir = sys.argv[5] if len(sys.argv) >= 6 else os.path.join("output", "coverage")
+
+    t = np.arange(0, hours * 3600, step)
+    # One sun-synchronous plane per satellite, spread in right ascension
+    orbit = Orbit.circular(link.orbit_height, raan = np.arange(satellites) * 180 / satellites, j2 = True)
+    start = time.perf_counter()
+    maps = coverage_maps(orbit, t, link, required_gamma('psk', 2, target_ber), resolution, coding_rate = coding_rate)
+    elapsed = time.perf_counter() - start
+    save_maps(maps, output_dir)
+
+    cells = maps['contact_time'].size
+    covered = maps['usable_time'] > 0
+    print("{} cells x {} samples x {} satellites in {:.1f} s, maps written to {}".format(cells, len(t), satellites, elapsed, output_dir))
+    print("{:.1f}% of the cells can downlink; best cell {:.1f} Gbit, median {:.1f} Gbit".format(
+        100 * np.mean(covered), np.max(maps['bits']) / 1E9, np.median(maps['bits'][covered]) / 1E9 if covered.any() else 0))
+
+    import figures
+    figures.save(plot_maps(maps), "coverage")
+    figures.show()
@@ -0,0 +1,121 @@
+import numpy as np
+
+from instrument import profiled, count
+
+default_xtol = 1E-9     # [deg]
+default_ytol = 1E-12    # [dB]
+
+@profiled
+def refine(f, lo, hi, level, g_lo, g_hi, xtol: float = default_xtol, ytol: float = default_ytol, max_iter: int = 60):
+    # Roots of f(x) = level, bracketed by [lo, hi] where g = f - level is g_lo and g_hi with
+    # opposite signs, all solved at once. f maps an array of x to an array of the same shape.
+    # Illinois false position: superlinear like Brent's method on these smooth curves, while
+    # every step stays inside its bracket.
+    lo, hi, level = [a.copy() for a in np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (lo, hi, level)])]
+    g_lo, g_hi = np.broadcast_to(g_lo, lo.shape).astype(float), np.broadcast_to(g_hi, lo.shape).astype(float)
+    x = np.where(g_lo == 0, lo, hi)
+    side = np.zeros(lo.shape, dtype=int)
+    active = (g_lo != 0) & (g_hi != 0)
+
+    for _ in range(max_iter):
+        if not np.any(active):
+            break
+        count("crossing refinements", np.sum(active))
+        a, b, ga, gb = lo[active], hi[active], g_lo[active], g_hi[active]
+        xa = (a * gb - b * ga) / (gb - ga)
+        ga_new = f_at(f, x, xa, active) - level[active]
+        keep_lo = np.sign(ga_new) == np.sign(ga)
+
+        # Replace the endpoint on the same side as the new point; halve the value of an
+        # endpoint kept twice in a row (Illinois), so both ends converge
+        a, ga = np.where(keep_lo, xa, a), np.where(keep_lo, ga_new, ga)
+        b, gb = np.where(keep_lo, b, xa), np.where(keep_lo, gb, ga_new)
+        s = side[active]
+        gb = np.where(keep_lo & (s == 1), gb / 2, gb)
+        ga = np.where(~keep_lo & (s == -1), ga / 2, ga)
+
+        lo[active], hi[active], g_lo[active], g_hi[active] = a, b, ga, gb
+        side[active] = np.where(keep_lo, 1, -1)
+        x[active] = xa
+        active[active] = (np.abs(ga_new) > ytol) & (b - a > xtol)
+    return x
+
+def f_at(f, x, values, active):
+    # f at values, the active entries of x: f always sees whole arrays shaped like x (i.e. one
+    # entry per scenario of a LinkBudget of arrays)
+    probe = x.copy()
+    probe[active] = values
+    return np.asarray(f(probe))[active]
+
+def linear_crossing(x0, x1, y0, y1, level):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(y1 != y0, x0 + (level - y0) * (x1 - x0) / (y1 - y0), x0)
+
+@profiled
+def threshold_elevation(x, y, level, f = None, **tolerances):
+    # Lowest x above which y >= level up to the end of the grid: the elevation where a link
+    # closes for good. x is an ascending grid, y (..., len(x)) the curve sampled on it, and
+    # level (...) the thresholds, one per curve. Between samples the crossing is interpolated,
+    # or, with f (the analytic curve, mapping an x of level's shape to y), solved to tolerance.
+    # Returns x[0] where y never drops below level, NaN where it ends below it.
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    level = np.asarray(level, dtype=float)
+    y, level = np.broadcast_arrays(y, level[..., None])
+    level = level[..., 0]
+
+    below = y < level[..., None]
+    n = x.shape[-1]
+    # Last sample below the level; the crossing is between it and the next one
+    last = n - 1 - np.argmax(below[..., ::-1], axis = -1)
+    never_below, ends_below = ~np.any(below, axis = -1), below[..., -1]
+    j = np.clip(last, 0, n - 2)
+
+    y0, y1 = np.take_along_axis(y, j[..., None], -1)[..., 0], np.take_along_axis(y, j[..., None] + 1, -1)[..., 0]
+    x0, x1 = x[j], x[j + 1]
+    valid = ~never_below & ~ends_below
+    if f is None:
+        crossing = linear_crossing(x0, x1, y0, y1, level)
+    else:
+        # Only the bracketed crossings are refined; the others return x0 untouched
+        g0 = np.where(valid, y0 - level, 0.0)
+        g1 = np.where(valid, y1 - level, 0.0)
+        crossing = refine(f, x0, x1, level, g0, g1, **tolerances)
+    return np.where(never_below, x[0], np.where(ends_below, np.nan, crossing))
+
+@profiled
+def all_crossings(x, y, levels, f = None, **tolerances):
+    # Every crossing of the sampled curve y(x) (1-D) with each of levels, from the monotone
+    # runs of y: in each run, the levels it spans are located with searchsorted. Returns
+    # (level index, x, rising) arrays sorted by level then x; with f (the analytic curve), the
+    # crossings are solved to tolerance. A peak or dip of f between two samples is not seen.
+    x, y, levels = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.atleast_1d(np.asarray(levels, dtype=float))
+    direction = np.sign(np.diff(y))
+    # Runs of samples [start, stop] with non-decreasing or non-increasing y
+    turns = np.flatnonzero((direction[1:] * direction[:-1]) < 0) + 1
+    starts, stops = np.append(0, turns), np.append(turns, len(y) - 1)
+
+    index, segment, rising = [], [], []
+    for a, b in zip(starts, stops):
+        run = y[a:b + 1]
+        up = run[-1] >= run[0]
+        # Each run owns the levels in (y[a], y[b]]: a level touched at a turn is counted once
+        if up:
+            spanned = np.flatnonzero((levels > run[0]) & (levels <= run[-1]))
+            first = a + np.searchsorted(run, levels[spanned], side='left') - 1
+        else:
+            ordered = run[::-1]
+            spanned = np.flatnonzero((levels >= ordered[0]) & (levels < ordered[-1]))
+            first = a + len(run) - 1 - np.searchsorted(ordered, levels[spanned], side='right')
+        index.append(spanned)
+        segment.append(first)
+        rising.append(np.full(len(spanned), up))
+
+    index, segment, rising = np.concatenate(index), np.concatenate(segment).astype(int), np.concatenate(rising)
+    x0, x1, y0, y1 = x[segment], x[segment + 1], y[segment], y[segment + 1]
+    level = levels[index]
+    if f is None:
+        crossing = linear_crossing(x0, x1, y0, y1, level)
+    else:
+        crossing = refine(f, x0, x1, level, y0 - level, y1 - level, **tolerances)
+    order = np.lexsort((crossing, index))
+    return index[order], crossing[order], rising[order]
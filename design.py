@@ -0,0 +1,226 @@
+import sys
+import dataclasses
+import numpy as np
+from dataclasses import dataclass
+
+from fsl_vs_phi_l import pass_time, pass_elevation
+from rx_temperature import to_db
+from link_budget import LinkBudget
+from acm import ModcodTable
+from crossings import threshold_elevation
+from instrument import profiled
+
+golden_iterations = 40          # Symbol rate search, log10 interval shrinks by 0.618 per step
+bisection_iterations = 40       # ACM gain search, 30 dB bracket halved per step
+acm_bracket = 30.0              # [dB] below the best single scheme
+acm_segments = 4                # Symbol rate intervals searched separately with ACM
+acm_elevation_step = 0.2        # [deg] of the cached C/No curve for ACM
+penalty = 1E3                   # Cost per dB of gain beyond the design space
+
+# Hardware that can be bought: bounds and a relative cost per dB of each term
+@dataclass
+class DesignSpace:
+    eirp:               tuple = (0.0, 20.0)     # [dBW]
+    antenna_gain:       tuple = (20.0, 55.0)    # [dBi]
+    symbol_rate:        tuple = (1E6, 500E6)    # [Bd], upper bound from the allocated bandwidth
+    eirp_cost:          float = 1.0             # per dB
+    antenna_gain_cost:  float = 0.5             # per dB
+    symbol_rate_cost:   float = 0.2             # per dB(Bd)
+
+def split_gains(total, space: DesignSpace):
+    # Cheapest eirp + antenna_gain = total [dB]: the cheaper term is raised first, within both
+    # bounds. A total below both lower bounds is over-designed to them; one above both upper
+    # bounds leaves the antenna gain above its bound (checked by the caller).
+    total = np.asarray(total, dtype=float)
+    if space.eirp_cost <= space.antenna_gain_cost:
+        eirp = np.clip(total - space.antenna_gain[0], *space.eirp)
+        antenna_gain = np.maximum(total - eirp, space.antenna_gain[0])
+    else:
+        antenna_gain = np.clip(total - space.eirp[0], *space.antenna_gain)
+        eirp = np.maximum(total - antenna_gain, space.eirp[0])
+    return eirp, antenna_gain
+
+def design_cost(total, symbol_rate, space: DesignSpace):
+    eirp, antenna_gain = split_gains(total, space)
+    excess = np.maximum(total - space.eirp[1] - space.antenna_gain[1], 0)
+    return space.eirp_cost * eirp + space.antenna_gain_cost * antenna_gain \
+         + space.symbol_rate_cost * to_db(symbol_rate) + penalty * excess
+
+def golden_section(f, lo, hi, iterations: int = golden_iterations):
+    # Minimum of f (unimodal on each [lo, hi], evaluated element-wise on whole arrays) for every
+    # element at once: one evaluation of f per iteration. Returns (x, f(x)), the endpoints
+    # included, since the minimum is often at the symbol rate bound.
+    ratio = (np.sqrt(5) - 1) / 2
+    a, b = lo.copy(), hi.copy()
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc, fd = f(c), f(d)
+    for _ in range(iterations):
+        left = fc < fd              # Minimum in [a, d]
+        a, b = np.where(left, a, c), np.where(left, d, b)
+        x = np.where(left, b - ratio * (b - a), a + ratio * (b - a))
+        fx = f(x)
+        c, d, fc, fd = np.where(left, x, d), np.where(left, c, x), np.where(left, fx, fd), np.where(left, fc, fx)
+    candidates = np.stack([lo, hi, np.where(fc < fd, c, d)])
+    values = np.stack([f(lo), f(hi), np.minimum(fc, fd)])
+    best = np.argmin(np.where(np.isnan(values), np.inf, values), axis = 0)
+    return np.take_along_axis(candidates, best[None], 0)[0], np.take_along_axis(values, best[None], 0)[0]
+
+def bare_link(link: LinkBudget, orbit_height, freq):
+    # C/No of this link is the losses side alone: eirp + antenna_gain is added back by the solvers
+    return dataclasses.replace(link, eirp = 0.0, antenna_gain = 0.0, orbit_height = orbit_height, freq = freq)
+
+def single_scheme_gain(bare: LinkBudget, symbol_rate, required_ebno, efficiency, target_bits: float,
+                       min_elevation: float, coding_rate: float):
+    # Closed form of the smallest eirp + antenna_gain [dB] delivering target_bits per overhead
+    # pass with one scheme: the pass must last target_bits / bitrate above the elevation where
+    # Eb/No meets the threshold, so that elevation is pass_elevation of this time, and the gain
+    # closes the link exactly there. Returns (gain, elevation), NaN where even a pass from
+    # min_elevation is too short at this symbol rate.
+    bitrate = symbol_rate * efficiency
+    elevation = pass_elevation(target_bits / (bitrate * coding_rate), bare.orbit_height)
+    elevation = np.where(elevation >= min_elevation, elevation, np.nan)
+    gain = required_ebno + to_db(bitrate) - bare.c_to_no(np.nan_to_num(elevation, nan = 90.0))
+    return np.where(np.isnan(elevation), np.nan, gain), elevation
+
+def acm_bits(gain, symbol_rate, elevation_angle, bare_c_to_no, table: ModcodTable, orbit_height, coding_rate: float):
+    # Bits per overhead pass switching MODCODs, for gains (n,) and symbol rates (n,) on cached
+    # C/No curves (n, len(elevation_angle)). table thresholds are in Es/No (required Eb/No plus
+    # the scheme's bits per symbol), and each scheme is used from the elevation where its
+    # threshold is met, solved between the cached samples.
+    es_to_no = (gain - to_db(symbol_rate))[:, None] + bare_c_to_no
+    levels = np.broadcast_to(table.required_ebno, (len(gain), len(table.required_ebno)))
+    angle = threshold_elevation(elevation_angle, es_to_no[:, None, :], levels)
+    time_above = np.nan_to_num(pass_time(angle, orbit_height[:, None]))
+    dt = time_above - np.append(time_above[:, 1:], np.zeros((len(gain), 1)), axis = 1)
+    return symbol_rate * coding_rate * np.sum(table.efficiency[table.best] * dt, axis = 1)
+
+def es_table(table: ModcodTable):
+    required = table.required_ebno + to_db(table.efficiency)
+    names = list(table.names)
+    return ModcodTable.from_schemes(names, dict(zip(names, table.efficiency)), None, required = dict(zip(names, required)))
+
+@profiled
+def optimize_design(link: LinkBudget, table: ModcodTable, target_bits: float, orbit_height, freq,
+                    min_elevation: float = 0.0, coding_rate: float = 1.0, space: DesignSpace = DesignSpace(),
+                    acm: bool = False):
+    # Cheapest satellite EIRP, terminal antenna gain and symbol rate delivering target_bits
+    # information bits per overhead pass above min_elevation, for every orbit_height and freq
+    # (broadcast together). The gain needed at a symbol rate is solved in closed form for each
+    # scheme of table (or, with acm, by bisection: the bits grow with the gain), and the symbol
+    # rate by golden-section searches of the cost. Returns a dict of arrays shaped like the
+    # broadcast inputs; 'feasible' is False where the space cannot meet the target.
+    orbit_height, freq = np.broadcast_arrays(np.asarray(orbit_height, dtype=float), np.asarray(freq, dtype=float))
+    shape = orbit_height.shape
+    h, f = orbit_height.ravel(), freq.ravel()
+    n, k = len(h), len(table.names)
+    bare = bare_link(link, h, f)
+    required, efficiency = table.required_ebno[:, None], table.efficiency[:, None]
+    horizon_time = pass_time(min_elevation, h)
+
+    # Symbol rates from the slowest one that can fit the target into a whole pass
+    def bounds(efficiency):
+        slowest = target_bits / (efficiency * coding_rate * horizon_time)
+        lo = np.log10(np.maximum(slowest * (1 + 1E-9), space.symbol_rate[0]))
+        hi = np.full_like(lo, np.log10(space.symbol_rate[1]))
+        return lo, np.maximum(hi, lo), lo <= hi
+
+    def single_gains(symbol_rate):
+        return single_scheme_gain(bare, symbol_rate, required, efficiency, target_bits, min_elevation, coding_rate)
+
+    if not acm:
+        # Every scheme at once, (scheme, point)
+        lo, hi, feasible = bounds(efficiency)
+        cost = lambda u: design_cost(single_gains(10**u)[0], 10**u, space)
+        u, value = golden_section(cost, lo, hi)
+        value = np.where(feasible, value, np.nan)
+        best = np.argmin(np.where(np.isnan(value), np.inf, value), axis = 0)
+        pick = lambda a: np.take_along_axis(np.broadcast_to(a, (k, n)), best[None], 0)[0]
+        symbol_rate = 10**pick(u)
+        gain, elevation = [pick(a) for a in single_gains(10**u)]
+        scheme = table.names[best]
+        bitrate = symbol_rate * table.efficiency[best]
+        feasible = pick(feasible)
+    else:
+        es = es_table(table)
+        elevation_angle = np.append(np.arange(min_elevation, 90, acm_elevation_step), 90.0)
+        bare_c_to_no = bare_link(link, h[:, None], f[:, None]).c_to_no(elevation_angle[None, :])
+
+        def acm_gain(symbol_rate, point):
+            # Bisection below the cheapest single scheme, which always meets the target
+            bare_point = bare_link(link, h[point], f[point])
+            upper = np.nanmin(single_scheme_gain(bare_point, symbol_rate[None, :], required, efficiency, target_bits,
+                                                 min_elevation, coding_rate)[0], axis = 0)
+            a, b = upper - acm_bracket, upper.copy()
+            for _ in range(bisection_iterations):
+                m = (a + b) / 2
+                bits = acm_bits(np.nan_to_num(m), symbol_rate, elevation_angle, bare_c_to_no[point], es, h[point], coding_rate)
+                a, b = np.where(bits >= target_bits, a, m), np.where(bits >= target_bits, m, b)
+            return b
+
+        # The cost steps where the MODCODs switch, so it is only unimodal piecewise: the symbol
+        # rate range is split into acm_segments searched at once, (segment, point) flattened
+        lo, hi, feasible = bounds(np.max(table.efficiency))
+        edges = lo + (hi - lo) * np.linspace(0, 1, acm_segments + 1)[:, None]
+        point = np.tile(np.arange(n), acm_segments)
+        u, value = golden_section(lambda u: design_cost(acm_gain(10**u, point), 10**u, space),
+                                  edges[:-1].ravel(), edges[1:].ravel())
+        best = np.argmin(np.where(np.isnan(value), np.inf, value).reshape(acm_segments, n), axis = 0)
+        symbol_rate = 10**u.reshape(acm_segments, n)[best, np.arange(n)]
+        gain = acm_gain(symbol_rate, np.arange(n))
+        elevation = threshold_elevation(elevation_angle, gain[:, None] - to_db(symbol_rate)[:, None] + bare_c_to_no,
+                                        np.full(n, es.required_ebno[0]))
+        scheme = np.full(n, 'ACM')
+        bitrate = np.full(n, np.nan)        # Changes along the pass
+
+    eirp, antenna_gain = split_gains(gain, space)
+    feasible = feasible & np.isfinite(gain) & (gain <= space.eirp[1] + space.antenna_gain[1])
+    result = {
+        'orbit_height':         h,
+        'freq':                 f,
+        'scheme':               scheme,
+        'symbol_rate':          symbol_rate,
+        'bitrate':              bitrate,                # [bit/s] of the link, coded
+        'eirp':                 eirp,
+        'antenna_gain':         antenna_gain,
+        'cost':                 design_cost(gain, symbol_rate, space),
+        'threshold_elevation':  elevation,              # Where the (first) scheme closes the link
+        'feasible':             feasible,
+    }
+    for name in ['symbol_rate', 'bitrate', 'eirp', 'antenna_gain', 'cost', 'threshold_elevation']:
+        result[name] = np.where(feasible, result[name], np.nan)
+    return {name: value.reshape(shape) for name, value in result.items()}
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [Gbit per pass] [min_elevation] [acm]")
+        print(f"i.e. {sys.argv[0]} 20 10 acm finds the cheapest downlink delivering 20 Gbit per pass above 10 deg with ACM")
+        sys.exit()
+
+    import time
+    from compare_ebno_downlink import default_link, schemes, scheme_efficiency, target_ber, coding_rate
+    link = default_link()
+
+    target_bits = float(sys.argv[1]) * 1E9 if len(sys.argv) >= 2 else 20E9
+    min_elevation = float(sys.argv[2]) if len(sys.argv) >= 3 else 10.0
+    acm = len(sys.argv) >= 4 and sys.argv[3] == 'acm'
+
+    table = ModcodTable.from_schemes(schemes, scheme_efficiency, target_ber)
+    heights = np.array([400, 500, 600, 800, 1000, 1200]) * 1E3
+    bands = {'S': 2.25E9, 'X': 7.5E9, 'X (EESS)': 8.2E9, 'Ka': 26.5E9}
+    start = time.perf_counter()
+    result = optimize_design(link, table, target_bits, heights[:, None], np.array(list(bands.values()))[None, :],
+                             min_elevation, coding_rate, acm = acm)
+    elapsed = time.perf_counter() - start
+
+    print("{} designs in {:.1f} ms, {:.1f} Gbit per pass above {:g} deg{}".format(
+        result['cost'].size, 1E3 * elapsed, target_bits / 1E9, min_elevation, " with ACM" if acm else ""))
+    print("{:>8} {:>9} {:>8} {:>12} {:>10} {:>13} {:>8} {:>10}".format(
+        "Height", "Band", "Scheme", "Symbol rate", "EIRP", "Antenna gain", "Cost", "Threshold"))
+    for i, height in enumerate(heights):
+        for j, band in enumerate(bands):
+            if not result['feasible'][i, j]:
+                print("{:>5.0f} km {:>9} {:>8}".format(height / 1E3, band, "-"))
+                continue
+            print("{:>5.0f} km {:>9} {:>8} {:>8.1f} MBd {:>6.1f} dBW {:>9.1f} dBi {:>8.1f} {:>6.1f} deg".format(
+                height / 1E3, band, result['scheme'][i, j], result['symbol_rate'][i, j] / 1E6, result['eirp'][i, j],
+                result['antenna_gain'][i, j], result['cost'][i, j], result['threshold_elevation'][i, j]))
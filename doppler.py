@@ -0,0 +1,159 @@
+import sys
+import numpy as np
+from dataclasses import dataclass
+
+from fsl_vs_phi_l import re, speed_of_light, sidereal_day, orbital_period, elevation_angle_to_earth_angle, \
+                         earth_angle_to_elevation_angle
+from instrument import profiled
+
+default_step = 0.1      # [s] between pass samples
+
+# Carrier acquisition and tracking of the ground receiver. A frequency search starts from the
+# nominal carrier when the link closes (or lock is lost) and sweeps outwards; the carrier is
+# caught once the search has covered its Doppler offset, beyond the loop's capture range, at a
+# Doppler rate the loop can pull in. Lock is declared lock_time later, and kept while the
+# Doppler rate stays within the tracking limit.
+@dataclass
+class Receiver:
+    sweep_rate:         float = 10E3    # [Hz/s] of the frequency search
+    capture_range:      float = 5E3     # [Hz] pulled in without searching
+    acquisition_rate:   float = 1.5E3   # [Hz/s] largest Doppler rate the loop pulls in
+    tracking_rate:      float = 5E3     # [Hz/s] largest Doppler rate the loop follows once locked
+    lock_time:          float = 1.0     # [s]
+
+def angular_rate(orbit_height):
+    # [rad/s] of the satellite seen from the rotating Earth, as fsl_vs_phi_l.pass_time
+    ts = orbital_period(orbit_height)
+    return 2 * np.pi / (ts / (1 - ts/sidereal_day))
+
+def half_pass_time(orbit_height, max_elevation = 90.0, min_elevation = 0.0):
+    # [s] from closest approach to min_elevation, NaN for passes that never reach it
+    beta = np.deg2rad(elevation_angle_to_earth_angle(max_elevation, orbit_height))
+    edge = np.deg2rad(elevation_angle_to_earth_angle(min_elevation, orbit_height))
+    with np.errstate(invalid='ignore'):
+        return np.arccos(np.cos(edge) / np.cos(beta)) / angular_rate(orbit_height)
+
+@profiled
+def pass_track(t, orbit_height, freq, max_elevation = 90.0):
+    # Range [m], range rate [m/s], range acceleration [m/s^2], Doppler shift [Hz] and Doppler
+    # rate [Hz/s] of a circular-orbit pass, t [s] from closest approach along the last axis.
+    # orbit_height, freq and max_elevation (90 for an overhead pass) broadcast together, one
+    # pass per element. The along-track angle grows at angular_rate; with the cross-track angle
+    # of the closest approach, the Earth central angle gives the same range as
+    # fsl_vs_phi_l.distance at the same elevation.
+    orbit_height, freq, max_elevation = [np.asarray(a, dtype=float)[..., None] for a in (orbit_height, freq, max_elevation)]
+    r = re + orbit_height
+    omega = angular_rate(orbit_height)
+    cos_beta = np.cos(np.deg2rad(elevation_angle_to_earth_angle(max_elevation, orbit_height)))
+    alpha = omega * np.asarray(t, dtype=float)
+    cos_angle = cos_beta * np.cos(alpha)
+
+    slant_range = np.sqrt(re**2 + r**2 - 2 * re * r * cos_angle)
+    range_rate = re * r * cos_beta * np.sin(alpha) * omega / slant_range
+    range_acceleration = (re * r * cos_angle * omega**2 - range_rate**2) / slant_range
+    return {
+        'elevation':            earth_angle_to_elevation_angle(np.rad2deg(np.arccos(np.clip(cos_angle, -1, 1))), orbit_height),
+        'range':                slant_range,
+        'range_rate':           range_rate,
+        'range_acceleration':   range_acceleration,
+        'doppler':              -freq * range_rate / speed_of_light,
+        'doppler_rate':         -freq * range_acceleration / speed_of_light,
+    }
+
+def running_max_time(t, events):
+    # Latest t at or before each sample where events holds, -inf before the first one
+    return np.maximum.accumulate(np.where(events, t, -np.inf), axis = -1)
+
+def locked(t, usable, doppler, doppler_rate, receiver: Receiver = Receiver()):
+    # Samples (along the last axis) where the receiver is locked, given where the link closes
+    usable = usable & (np.abs(doppler_rate) <= receiver.tracking_rate)
+    previous = np.zeros_like(usable)
+    previous[..., 1:] = usable[..., :-1]
+    start = running_max_time(t, usable & ~previous)
+
+    caught = usable & (receiver.sweep_rate * (t - start) >= np.abs(doppler) - receiver.capture_range) \
+                    & (np.abs(doppler_rate) <= receiver.acquisition_rate)
+    acquired = usable & (running_max_time(t, caught) >= start)
+    previous[..., 1:] = acquired[..., :-1]
+    return acquired & (t - running_max_time(t, acquired & ~previous) >= receiver.lock_time)
+
+@profiled
+def locked_pass(threshold_elevation, orbit_height, freq, receiver: Receiver = Receiver(), max_elevation = 90.0,
+                step: float = default_step):
+    # Pass tracks sampled every step seconds (pass_track), with the samples where the link
+    # closes (elevation >= threshold_elevation) and where the receiver is locked. Every input
+    # broadcasts with the others.
+    threshold_elevation, orbit_height, freq, max_elevation = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in (threshold_elevation, orbit_height, freq, max_elevation)])
+    half = np.nanmax(half_pass_time(orbit_height, max_elevation, np.maximum(np.min(threshold_elevation), 0)))
+    n = int(np.ceil(np.nan_to_num(half) / step))
+    t = np.arange(-n, n + 1) * step
+    track = pass_track(t, orbit_height, freq, max_elevation)
+    usable = (track['elevation'] >= threshold_elevation[..., None]) & (track['elevation'] >= 0)
+    return {
+        **track,
+        't':        t,
+        'usable':   usable,
+        'locked':   locked(t, usable, track['doppler'], track['doppler_rate'], receiver),
+    }
+
+def contact_fraction(threshold_elevation, orbit_height, freq, receiver: Receiver = Receiver(), max_elevation = 90.0,
+                     weights = None, step: float = default_step):
+    # Share of the time above threshold_elevation during which the receiver is locked: the
+    # effective-contact-time correction of a pass. With weights (a function of the sampled
+    # elevation, i.e. the spectral efficiency), the share of the weighted time. 1 where the
+    # link never closes.
+    track = locked_pass(threshold_elevation, orbit_height, freq, receiver, max_elevation, step)
+    w = np.ones_like(track['elevation']) if weights is None else weights(track['elevation'])
+    contact = np.sum(w * track['usable'], axis = -1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(contact > 0, np.sum(w * track['locked'], axis = -1) / contact, 1.0)
+
+def plot_track(track: dict, labels):
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(2, 1, figsize = (8, 6), sharex = True)
+    t = track['t']
+    for i, label in enumerate(labels):
+        line, = axes[0].plot(t, track['doppler'][i] / 1E3, label = label)
+        axes[1].plot(t, track['doppler_rate'][i], color = line.get_color())
+        # Locked part of the pass, thicker
+        axes[0].plot(t, np.where(track['locked'][i], track['doppler'][i] / 1E3, np.nan), color = line.get_color(), linewidth = 3)
+    axes[0].set_ylabel("Doppler shift [kHz]")
+    axes[1].set_ylabel("Doppler rate [Hz/s]")
+    axes[1].set_xlabel("Time from closest approach [s]")
+    axes[0].set_title("Doppler shift and rate per pass (thick: receiver locked)")
+    axes[0].legend()
+    for ax in axes:
+        ax.grid()
+    fig.tight_layout()
+    return fig
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [threshold_elevation] [freq GHz ...]")
+        print(f"i.e. {sys.argv[0]} 10 7.5 8.15 prints the Doppler and the locked time of passes above 10 deg at 7.5 and 8.15 GHz")
+        sys.exit()
+
+    from compare_ebno_downlink import default_link
+    link = default_link()
+
+    threshold = float(sys.argv[1]) if len(sys.argv) >= 2 else 10.0
+    freqs = np.array([float(f) for f in sys.argv[2:]]) * 1E9 if len(sys.argv) >= 3 else np.array([7.5E9, 8.15E9])
+    max_elevation = np.array([90, 60, 30, 15])
+
+    track = locked_pass(threshold, link.orbit_height, freqs[:, None], Receiver(), max_elevation[None, :])
+    step = track['t'][1] - track['t'][0]
+    contact, effective = np.sum(track['usable'], axis = -1) * step, np.sum(track['locked'], axis = -1) * step
+    visible = track['elevation'] >= 0
+    print("{:>8} {:>9} {:>12} {:>15} {:>10} {:>10}".format("Freq", "Max elev.", "Max Doppler", "Max rate", "Contact", "Locked"))
+    for i, freq in enumerate(freqs):
+        for j, elevation in enumerate(max_elevation):
+            print("{:>4.2f} GHz {:>5.0f} deg {:>8.1f} kHz {:>10.0f} Hz/s {:>8.1f} s {:>8.1f} s".format(
+                freq / 1E9, elevation, np.max(np.abs(track['doppler'][i, j][visible[i, j]])) / 1E3,
+                np.max(np.abs(track['doppler_rate'][i, j][visible[i, j]])), contact[i, j], effective[i, j]))
+
+    import figures
+    figures.save(plot_track({name: value[0] if name != 't' else value for name, value in track.items()},
+                            ["{:.0f} deg pass".format(e) for e in max_elevation]), "doppler")
+    figures.show()
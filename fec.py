@@ -0,0 +1,290 @@
+import os
+import re
+import sys
+import functools
+import numpy as np
+from dataclasses import dataclass
+
+import ber_psk
+import ber_qam
+import special
+from cache import cache_dir, cache_path
+from thresholds import required_gamma, parse_scheme
+
+# Block codes with bounded-distance decoding: every word with up to t symbol errors is
+# corrected, any other word is left as received
+@dataclass
+class BlockCode:
+    n:              int
+    k:              int
+    t:              int
+    symbol_bits:    int = 1
+    generator:      int = 0         # Generator polynomial of binary codes, as bits
+
+    @property
+    def rate(self):
+        return self.k / self.n
+
+codes = {
+    'RS(255,223)':  BlockCode(255, 223, 16, 8),
+    'BCH(63,56)':   BlockCode(63, 56, 1, 1, 0b11000101),    # (x^6 + x + 1)(x + 1), CCSDS telecommand
+}
+
+# Bump whenever the formulas or the table grid change, invalidates cached tables
+table_version = 1
+table_ebno = np.arange(-5, 40, 0.01)        # [dB]
+
+def log_binomial(n: int):
+    log_factorial = np.concatenate([[0], np.cumsum(np.log(np.arange(1, n + 1)))])
+    i = np.arange(n + 1)
+    return log_factorial[n] - log_factorial[i] - log_factorial[n - i]
+
+def decoded_error_rates(code: BlockCode, p):
+    # Post-decoding bit and word error rates for channel bit error probability p (any shape)
+    p = np.clip(np.asarray(p, dtype=float), 0, 0.5)[..., None]
+    with np.errstate(divide='ignore'):
+        log_p = np.log(-np.expm1(code.symbol_bits * np.log1p(-p)))   # Symbol error probability
+        log_q = code.symbol_bits * np.log1p(-p)
+        i = np.arange(code.t + 1, code.n + 1)
+        terms = log_binomial(code.n)[i] + i * log_p + (code.n - i) * log_q
+
+    peak = np.max(terms, axis = -1, keepdims = True)
+    peak = np.where(np.isfinite(peak), peak, 0)
+    fer = np.sum(np.exp(terms - peak), axis = -1) * np.exp(peak[..., 0])
+    symbol_errors = np.sum(i / code.n * np.exp(terms - peak), axis = -1) * np.exp(peak[..., 0])
+    # Words beyond t errors are left as received: each wrong symbol keeps its channel bit
+    # errors, m p / p_s bits on average
+    with np.errstate(invalid='ignore'):
+        bits_per_symbol_error = np.where(p[..., 0] > 0, p[..., 0] / np.exp(log_p[..., 0]), 1.0)
+    return symbol_errors * bits_per_symbol_error, fer
+
+def channel_ber(scheme: str, ebno):
+    name, M = parse_scheme(scheme)
+    return (ber_psk.BER if name == 'psk' else ber_qam.BER)(M, ebno)
+
+def coded_error_rates(code_name: str, scheme: str, ebno):
+    # Information bit Eb/No [dB]: every coded bit carries rate * Eb
+    code = codes[code_name]
+    return decoded_error_rates(code, channel_ber(scheme, np.asarray(ebno, dtype=float) + 10 * np.log10(code.rate)))
+
+@functools.lru_cache(maxsize = 256)
+def error_table(code_name: str, scheme: str):
+    # log10 of the post-decoding [ber, fer] over table_ebno, computed once per code, scheme and
+    # modulation formula and special function versions, then read back from the shared cache
+    version = "{}.{}".format((ber_psk if parse_scheme(scheme)[0] == 'psk' else ber_qam).formula_version, special.formula_version)
+    name = re.sub(r"\W+", "_", "fec_{}_{}_v{}_{}".format(code_name, scheme, table_version, version))
+    path = cache_path(name + ".npy")
+    try:
+        table = np.load(path)
+        if table.shape == (2, len(table_ebno)):
+            return table
+    except (OSError, ValueError):
+        pass
+
+    with np.errstate(divide='ignore'):
+        table = np.log10(np.stack(coded_error_rates(code_name, scheme, table_ebno)))
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return table
+
+def coded_ber(code_name: str, scheme: str, ebno):
+    return np.power(10, np.interp(ebno, table_ebno, error_table(code_name, scheme)[0]))
+
+def coded_fer(code_name: str, scheme: str, ebno):
+    return np.power(10, np.interp(ebno, table_ebno, error_table(code_name, scheme)[1]))
+
+@functools.lru_cache(maxsize = 4096)
+def required_ebno(code_name: str, scheme: str, target: float, word: bool = False) -> float:
+    # Information bit Eb/No [dB] for a post-decoding BER (or FER if word) equal to target, NaN
+    # for targets beyond the table (not met within table_ebno, or met at its lowest Eb/No)
+    curve = error_table(code_name, scheme)[int(word)]
+    valid = curve > -250
+    return float(np.interp(np.log10(target), curve[valid][::-1], table_ebno[valid][::-1], left = np.nan, right = np.nan))
+
+def coding_gain(code_name: str, scheme: str, target: float) -> float:
+    # [dB] saved by the code at a BER target, against the uncoded threshold
+    return required_gamma(*parse_scheme(scheme), target) - required_ebno(code_name, scheme, target)
+
+# Reference encoders and decoders, vectorized over a batch of words (one word per row)
+
+def gf_tables(primitive: int = 0x11d):
+    # Antilog (doubled, so exponent sums need no reduction) and log tables of GF(2^8)
+    exp, log = np.zeros(512, dtype = np.int64), np.zeros(256, dtype = np.int64)
+    x = 1
+    for i in range(255):
+        exp[i], log[x] = x, i
+        x <<= 1
+        if x & 0x100:
+            x ^= primitive
+    exp[255:510] = exp[:255]
+    return exp, log
+
+# x^8 + x^4 + x^3 + x^2 + 1
+gf_exp, gf_log = gf_tables()
+
+def gf_mul(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return np.where((a == 0) | (b == 0), 0, gf_exp[gf_log[a] + gf_log[b]])
+
+def gf_div(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return np.where(a == 0, 0, gf_exp[(gf_log[a] - gf_log[np.maximum(b, 1)]) % 255])
+
+def gf_pow(e):
+    return gf_exp[np.mod(e, 255)]
+
+@functools.lru_cache(maxsize = None)
+def rs_generator(t: int):
+    # Monic g(x) = (x - a^1)...(x - a^2t), highest degree first
+    g = np.array([1])
+    for i in range(1, 2 * t + 1):
+        g = np.append(g, 0) ^ np.append(0, gf_mul(g, gf_pow(i)))
+    return g
+
+def rs_encode(messages, code: BlockCode = codes['RS(255,223)']):
+    # Systematic: the message symbols followed by 2t parity symbols
+    g = rs_generator(code.t)
+    parity = np.zeros((len(messages), 2 * code.t), dtype = np.int64)
+    for j in range(code.k):
+        feedback = messages[:, j] ^ parity[:, 0]
+        parity = np.append(parity[:, 1:], np.zeros((len(messages), 1), dtype = np.int64), axis = 1) ^ gf_mul(feedback[:, None], g[None, 1:])
+    return np.append(messages, parity, axis = 1)
+
+def poly_eval(coefficients, x):
+    # coefficients (words, degree + 1) lowest degree first, at every point x (points,): (words, points)
+    value = np.zeros((len(coefficients), len(x)), dtype = np.int64)
+    for d in range(coefficients.shape[1] - 1, -1, -1):
+        value = gf_mul(value, x[None, :]) ^ coefficients[:, d, None]
+    return value
+
+def rs_decode(received, code: BlockCode = codes['RS(255,223)']):
+    # Berlekamp-Massey, Chien search and Forney. Returns the decoded messages and which words
+    # failed to decode (more than t errors detected); those are returned as received.
+    n, t, words = code.n, code.t, len(received)
+    received = np.array(received, dtype = np.int64)
+    positions = n - 1 - np.arange(n)            # Symbol i is the coefficient of x^(n-1-i)
+
+    syndromes = poly_eval(received[:, ::-1], gf_pow(np.arange(1, 2 * t + 1)))
+    errors = np.any(syndromes != 0, axis = 1)
+
+    locator = np.zeros((words, 2 * t + 1), dtype = np.int64)
+    locator[:, 0] = 1
+    previous = locator.copy()
+    L = np.zeros(words, dtype = np.int64)
+    shift = np.ones(words, dtype = np.int64)
+    b = np.ones(words, dtype = np.int64)
+    degree = np.arange(2 * t + 1)
+    for k in range(2 * t):
+        d = syndromes[:, k] ^ np.bitwise_xor.reduce(gf_mul(locator[:, 1:k + 1], syndromes[:, :k][:, ::-1]), axis = 1)
+        index = degree[None, :] - shift[:, None]
+        shifted = np.where(index >= 0, np.take_along_axis(previous, np.maximum(index, 0), axis = 1), 0)
+        update = locator ^ gf_mul(gf_div(d, b)[:, None], shifted)
+        grow = (d != 0) & (2 * L <= k)
+        previous = np.where(grow[:, None], locator, previous)
+        locator = np.where((d != 0)[:, None], update, locator)
+        b = np.where(grow, d, b)
+        L = np.where(grow, k + 1 - L, L)
+        shift = np.where(grow, 1, shift + 1)
+
+    # Roots of the locator at X^-1 for every position X = a^position
+    inverse = gf_pow(-positions)
+    roots = (poly_eval(locator, inverse) == 0) & errors[:, None]
+    failed = errors & (np.sum(roots, axis = 1) != L)
+
+    # Forney (first consecutive root a^1): e = Omega(X^-1) / Lambda'(X^-1)
+    omega = np.zeros((words, 2 * t), dtype = np.int64)
+    for k in range(2 * t):
+        omega[:, k] = np.bitwise_xor.reduce(gf_mul(locator[:, :k + 1], syndromes[:, k::-1]), axis = 1)
+    derivative = np.where(degree[1:] % 2 == 1, locator[:, 1:], 0)
+    values = gf_div(poly_eval(omega, inverse), np.maximum(poly_eval(derivative, inverse), 1))
+    corrected = received ^ np.where(roots & ~failed[:, None], values, 0)
+    return corrected[:, :code.k], failed
+
+def bch_parity_checks(code: BlockCode):
+    # x^(n-1-i) mod g(x) for every position i, as bit rows: the syndrome is received @ checks mod 2
+    r = code.n - code.k
+    checks = np.zeros((code.n, r), dtype = np.int64)
+    for i in range(code.n):
+        remainder = 1 << (code.n - 1 - i)
+        for shift in range(code.n - 1 - i, r - 1, -1):
+            if remainder >> shift & 1:
+                remainder ^= code.generator << (shift - r)
+        checks[i] = [(remainder >> (r - 1 - j)) & 1 for j in range(r)]
+    return checks
+
+def bch_encode(messages, code: BlockCode = codes['BCH(63,56)']):
+    # Systematic: parity = message(x) x^(n-k) mod g(x), the remainders of the message positions
+    checks = bch_parity_checks(code)
+    return np.append(messages, (messages @ checks[:code.k]) % 2, axis = 1)
+
+def bch_decode(received, code: BlockCode = codes['BCH(63,56)']):
+    # Single error correction by syndrome lookup; other non-zero syndromes are detected failures
+    checks = bch_parity_checks(code)
+    weights = 1 << np.arange(checks.shape[1] - 1, -1, -1)
+    syndrome = ((received @ checks) % 2) @ weights
+    position = np.full(1 << checks.shape[1], -1)
+    position[checks @ weights] = np.arange(code.n)
+    located = position[syndrome]
+    failed = (syndrome != 0) & (located < 0)
+    corrected = np.array(received)
+    rows = np.nonzero(located >= 0)[0]
+    corrected[rows, located[rows]] ^= 1
+    return corrected[:, :code.k], failed
+
+def simulate_decoding(code_name: str, p: float, n_words: int = 2000, seed = None):
+    # Monte Carlo (ber, fer) through a binary symmetric channel with bit error probability p
+    code = codes[code_name]
+    rng = np.random.default_rng(seed)
+    m = code.symbol_bits
+    messages = rng.integers(0, 1 << m, (n_words, code.k))
+    encoded = rs_encode(messages, code) if m > 1 else bch_encode(messages, code)
+    flips = rng.random((n_words, code.n, m)) < p
+    noise = flips @ (1 << np.arange(m))
+    decoded, _ = (rs_decode if m > 1 else bch_decode)(encoded ^ noise, code)
+    wrong = decoded ^ messages
+    bit_errors = np.sum(np.unpackbits(wrong.astype(np.uint8)[..., None], axis = -1)[..., 8 - m:])
+    return bit_errors / (n_words * code.k * m), np.mean(np.any(wrong != 0, axis = 1))
+
+def main():
+    from compare_ebno_downlink import schemes, target_ber
+
+    print("Required Eb/No for BER < {:.0e} [dB]".format(target_ber))
+    print("{:>8}{:>10}".format("", "uncoded") + "".join("{:>14}".format(name) for name in codes))
+    for scheme in schemes:
+        print("{:>8}{:>10.2f}".format(scheme, required_gamma(*parse_scheme(scheme), target_ber))
+              + "".join("{:>14.2f}".format(required_ebno(name, scheme, target_ber)) for name in codes))
+
+    n_words = int(sys.argv[1]) if len(sys.argv) >= 2 else 2000
+    print("Monte Carlo check over a binary symmetric channel ({} words):".format(n_words))
+    for name, p in [('RS(255,223)', 0.005), ('RS(255,223)', 0.006), ('BCH(63,56)', 0.005), ('BCH(63,56)', 0.02)]:
+        ber, fer = decoded_error_rates(codes[name], p)
+        sim_ber, sim_fer = simulate_decoding(name, p, n_words, seed = 0)
+        print("{:>12} p = {:.3f}: BER {:1.2e} (simulated {:1.2e}), FER {:1.2e} (simulated {:1.2e})".format(
+            name, p, ber, sim_ber, fer, sim_fer))
+
+    import matplotlib.pyplot as plt
+    import figures
+
+    ebno = np.linspace(0, 14, 500)
+    plt.figure(figsize = (8, 5))
+    plt.semilogy(ebno, channel_ber('BPSK', ebno), '--', label = "BPSK uncoded")
+    for name in codes:
+        plt.semilogy(ebno, coded_ber(name, 'BPSK', ebno), label = "BPSK + {}".format(name))
+    plt.ylim(1E-12, 1)
+    plt.title("Post-decoding BER, bounded-distance decoding")
+    plt.xlabel("Information bit $E_b/N_0$ [dB]")
+    plt.ylabel("BER")
+    plt.grid(True, which = 'both')
+    plt.legend()
+    plt.tight_layout()
+    figures.save(plt.gcf(), "coded_ber")
+    figures.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import os
+
+# Where, and in which formats, the scripts save their figures:
+#   SATCOM_OUTPUT_DIR=reports/run1 SATCOM_FORMATS=png,pdf python compare_ebno_downlink.py
+# With a non-interactive backend (MPLBACKEND=Agg, or no display) show() returns at once.
+output_dir = os.environ.get("SATCOM_OUTPUT_DIR", "output")
+formats = [f.strip() for f in os.environ.get("SATCOM_FORMATS", "svg,png").split(",") if f.strip()]
+
+non_interactive = ('agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template')
+
+def save(fig, name: str, directory: str = None, kinds = None):
+    directory = output_dir if directory is None else directory
+    os.makedirs(directory, exist_ok = True)
+    paths = [os.path.join(directory, "{}.{}".format(name, kind)) for kind in (formats if kinds is None else kinds)]
+    for path in paths:
+        fig.savefig(path)
+    return paths
+
+def headless():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def interactive():
+    import matplotlib
+    return matplotlib.get_backend().lower() not in non_interactive
+
+def show():
+    import matplotlib.pyplot as plt
+    if interactive():
+        plt.show()
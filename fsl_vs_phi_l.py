@@ -1,40 +1,63 @@
 import numpy as np
-from scipy import constants
-import matplotlib as mpl
-import matplotlib.ticker
-import matplotlib.pyplot as plt
 import sys
 
+from instrument import profiled
+
 re = 6371E3;
+speed_of_light = 299792458.0            # [m/s]
+mu_earth = 3.986004418E14               # Earth's gravitational parameter [m^3/s^2]
+sidereal_day = 23*60*60 + 56*60 + 4     # [s]
 
+@profiled
 def distance(phi_l_deg, h):
     phi_l_rad = phi_l_deg * np.pi / 180.0;
     return np.sqrt((re * np.sin(phi_l_rad))**2 + 2 * re * h + h**2) - re * np.sin(phi_l_rad)
 
+@profiled
 def fsl(d, f):
-    c = constants.speed_of_light
+    c = speed_of_light
     return 20.0 * np.log10( 4 * np.pi * f * d / c )
 
+@profiled
 def elevation_angle_to_earth_angle(elevation_angle: float, orbit_height: float):
     elevation_angle = elevation_angle * np.pi / 180
     return 180 / np.pi * (np.arccos(re / (re + orbit_height) * np.cos(elevation_angle)) - elevation_angle)
 
-if __name__ == "__main__":
-
-    plt.close()
-
-    h = 650E3;
+# Inverse of elevation_angle_to_earth_angle, from cos(angle + e) = re / (re + h) cos(e);
+# negative below the horizon
+def earth_angle_to_elevation_angle(earth_angle, orbit_height: float):
+    earth_angle = np.deg2rad(earth_angle)
+    return np.rad2deg(np.arctan2(np.cos(earth_angle) - re / (re + orbit_height), np.sin(earth_angle)))
+
+def orbital_period(orbit_height: float):
+    return 2 * np.pi * np.sqrt((re + orbit_height)**3 / mu_earth)
+
+# Time [s] spent above elevation_angle during an overhead pass of a circular orbit
+@profiled
+def pass_time(elevation_angle: float, orbit_height: float):
+    ts = orbital_period(orbit_height)
+    angle = elevation_angle_to_earth_angle(elevation_angle, orbit_height)
+    return angle / 180 * (ts / (1 - ts/sidereal_day))
+
+# Inverse of pass_time: the elevation angle [deg] above which an overhead pass lasts
+# pass_seconds, NaN where even the horizon-to-horizon pass is shorter
+def pass_elevation(pass_seconds, orbit_height: float):
+    ts = orbital_period(orbit_height)
+    angle = np.asarray(pass_seconds, dtype=float) * 180 / (ts / (1 - ts/sidereal_day))
+    e = earth_angle_to_elevation_angle(angle, orbit_height)
+    return np.where(angle <= elevation_angle_to_earth_angle(0.0, orbit_height) * (1 + 1E-12), np.maximum(e, 0), np.nan)
+
+def angle_data(orbit_height: float = 650E3, freq: float = 7.8E9):
     a = np.linspace(90, 0, 19);
-    z = distance(a, h);
+    z = distance(a, orbit_height);
+    return {'elevation_angle': a, 'distance': z, 'fsl': fsl(z, freq)}
 
-    if(len(sys.argv) >= 3):
-        elevation_angle = int(sys.argv[1])
-        f               = int(sys.argv[2])
-        print(fsl(10**3 * distance(elevation_angle, h), 10**9 * f))
-        exit()
+def plot_vs_angle(a, values, title, ylabel):
+    import matplotlib.ticker
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots(1)
-    ax.plot(a, z / 1e3, 'rx')
+    ax.plot(a, values, 'rx')
     ax.invert_xaxis()
     ax.xaxis.set_major_locator(matplotlib.ticker.MultipleLocator(base = 10.0))
 
@@ -42,30 +65,32 @@ if __name__ == "__main__":
     ax.grid(True, which = 'minor', axis = 'y')
     ax.minorticks_on()
 
-    plt.title   ("Distance between satellite and base station")
-    plt.xlabel  ("Elevation angle $\phi_l$ [deg]")
-    plt.ylabel  ("Distance [km]")
+    ax.set_title    (title)
+    ax.set_xlabel   ("Elevation angle $\\phi_l$ [deg]")
+    ax.set_ylabel   (ylabel)
+    return fig
 
-    plt.savefig ("output/distance.svg")
-    plt.savefig ("output/distance.png")
+def plot_distance(data: dict):
+    return plot_vs_angle(data['elevation_angle'], data['distance'] / 1e3, "Distance between satellite and base station", "Distance [km]")
 
-    plt.show()
+def plot_fsl(data: dict):
+    return plot_vs_angle(data['elevation_angle'], data['fsl'], "Free space losses", "FSL [dB]")
 
-    fig, ax = plt.subplots(1)
-    losses = fsl(z, 7.8E9)
-    ax.plot(a, losses, 'rx')
-    ax.invert_xaxis()
-    ax.xaxis.set_major_locator(matplotlib.ticker.MultipleLocator(base = 10.0))
+def main():
+    h = 650E3;
 
-    ax.grid(True, which = 'major')
-    ax.grid(True, which = 'minor', axis = 'y')
-    ax.minorticks_on()
+    if(len(sys.argv) >= 3):
+        elevation_angle = int(sys.argv[1])
+        f               = int(sys.argv[2])
+        print(fsl(10**3 * distance(elevation_angle, h), 10**9 * f))
+        exit()
 
-    plt.title   ("Free space losses")
-    plt.xlabel  ("Elevation angle $\phi_l$ [deg]")
-    plt.ylabel  ("FSL [dB]")
+    import figures
 
-    plt.savefig ("output/fsl.svg")
-    plt.savefig ("output/fsl.png")
+    data = angle_data(h)
+    figures.save(plot_distance(data), "distance")
+    figures.save(plot_fsl(data), "fsl")
+    figures.show()
 
-    plt.show()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+
+# Instrumentation is switched on per run from the environment, before the modules are imported:
+#   SATCOM_PROFILE=output/profile.json python compare_ebno_downlink.py
+# writes a JSON report and a folded-stack file (output/profile.folded, for flamegraph.pl or
+# speedscope) when the script exits. SATCOM_PROFILE=1 picks output/profile-<script>.json.
+# SATCOM_PROFILE_MEMORY=1 also traces the Python/NumPy allocation peak of every span.
+# When disabled, profiled() returns the function itself and span() a shared no-op.
+setting = os.environ.get("SATCOM_PROFILE", "")
+enabled = setting not in ("", "0")
+trace_memory = enabled and os.environ.get("SATCOM_PROFILE_MEMORY", "") not in ("", "0")
+
+spans = {}          # 'outer;inner' -> {'calls', 'total_ns', 'self_ns', 'points', 'peak_traced'}
+counters = {}
+stack = []
+started = time.perf_counter_ns()
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None     # Not available on Windows
+    # ru_maxrss is in kB on Linux, in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+class Span:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        if trace_memory:
+            import tracemalloc
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.path = (stack[-1].path + ";" if stack else "") + self.name
+        self.children = 0
+        self.peak = 0
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        stack.pop()
+        entry = spans.setdefault(self.path, {'calls': 0, 'total_ns': 0, 'self_ns': 0, 'points': 0, 'peak_traced': 0})
+        entry['calls'] += 1
+        entry['total_ns'] += elapsed
+        entry['self_ns'] += elapsed - self.children
+        if stack:
+            stack[-1].children += elapsed
+        if trace_memory:
+            import tracemalloc
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            entry['peak_traced'] = max(entry['peak_traced'], self.peak)
+            tracemalloc.reset_peak()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        return False
+
+class NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+no_span = NoSpan()
+
+def span(name: str):
+    # Times a block: with instrument.span("plot"): ...
+    return Span(name) if enabled else no_span
+
+def count(name: str, n = 1):
+    if enabled:
+        counters[name] = counters.get(name, 0) + int(n)
+
+def profiled(fn = None, *, name: str = None):
+    # Decorator timing every call of fn, and counting the points (array elements) it returns
+    if fn is None:
+        return lambda fn: profiled(fn, name = name)
+    if not enabled:
+        return fn
+    label = name or "{}.{}".format(fn.__module__, fn.__qualname__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with Span(label) as s:
+            result = fn(*args, **kwargs)
+        size = getattr(result, 'size', 1 if isinstance(result, (int, float)) else 0)
+        spans[s.path]['points'] += int(size)
+        return result
+    return wrapper
+
+def report():
+    return {
+        'argv':         sys.argv,
+        'wall_s':       (time.perf_counter_ns() - started) / 1E9,
+        'peak_rss_mb':  peak_rss_mb(),
+        'counters':     dict(counters),
+        'spans':        {path: {
+            'calls':    entry['calls'],
+            'total_s':  entry['total_ns'] / 1E9,
+            'self_s':   entry['self_ns'] / 1E9,
+            'points':   entry['points'],
+            **({'peak_traced_mb': entry['peak_traced'] / (1 << 20)} if trace_memory else {}),
+        } for path, entry in sorted(spans.items())},
+    }
+
+def folded():
+    # One 'outer;inner self_time_us' line per call path
+    return "".join("{} {}\n".format(path, entry['self_ns'] // 1000) for path, entry in sorted(spans.items()))
+
+def report_path():
+    if setting.lower() in ("1", "true", "yes"):
+        script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+        return os.path.join("output", "profile-{}.json".format(script))
+    return setting
+
+def write_report(path: str = None):
+    path = path or report_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+    with open(path, "w") as f:
+        json.dump(report(), f, indent = 1)
+    with open(os.path.splitext(path)[0] + ".folded", "w") as f:
+        f.write(folded())
+    return path
+
+def summary(limit: int = 15):
+    total = sum(entry['self_ns'] for entry in spans.values()) or 1
+    lines = ["{:>8} {:>10} {:>6}  {}".format("calls", "self [s]", "%", "span")]
+    for path, entry in sorted(spans.items(), key = lambda item: -item[1]['self_ns'])[:limit]:
+        lines.append("{:>8} {:>10.4f} {:>5.1f}%  {}".format(entry['calls'], entry['self_ns'] / 1E9, 100 * entry['self_ns'] / total, path))
+    lines += ["{:>8}  {}".format(value, name) for name, value in sorted(counters.items())]
+    return "\n".join(lines)
+
+def at_exit():
+    # Worker processes of a pool exit without running atexit: only the parent reports
+    if spans or counters:
+        path = write_report()
+        print("Profile written to {} (and {})".format(path, os.path.splitext(path)[0] + ".folded"), file = sys.stderr)
+        print(summary(), file = sys.stderr)
+
+if enabled:
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    atexit.register(at_exit)
@@ -0,0 +1,177 @@
+import sys
+import numpy as np
+
+from fsl_vs_phi_l import re, elevation_angle_to_earth_angle
+from rx_temperature import to_db
+from orbit import Orbit, station_ecef
+from link_budget import LinkBudget
+from acm import ModcodTable
+from instrument import profiled, count
+
+default_max_pairs = 1 << 22     # (satellite, time) pairs tested at once
+far_sidelobe_angle = 48.0       # [deg] beyond which the pattern is flat
+
+def antenna_pattern(off_axis, max_gain: float):
+    # Earth-station reference pattern [dBi] at off_axis [deg] from boresight: the parabolic main
+    # lobe and first sidelobe of ITU-R F.699, the 32 - 25 log(phi) envelope of ITU-R S.465 and
+    # -10 dBi beyond far_sidelobe_angle. The dish size (D / lambda) follows from max_gain at
+    # about 60% efficiency.
+    phi = np.abs(np.asarray(off_axis, dtype=float))
+    d = 10**((max_gain - 7.7) / 20)
+    g1 = 2 + 15 * np.log10(d)
+    phi_m = 20 / d * np.sqrt(max(max_gain - g1, 0))
+    phi_r = 15.85 * d**-0.6
+    with np.errstate(divide='ignore'):
+        sidelobe = 32 - 25 * np.log10(phi)
+    return np.where(phi < phi_m, max_gain - 2.5E-3 * (d * phi)**2,
+           np.where(phi < phi_r, g1, np.where(phi < far_sidelobe_angle, np.minimum(sidelobe, g1), -10.0)))
+
+def visible_pairs(r, station, cap):
+    # Pruning: the (satellite, time) pairs whose sub-satellite point is within cap [deg] of the
+    # station (its visibility cone at the horizon), from one dot product per pair
+    up = station / np.linalg.norm(station)
+    cos_angle = (r @ up) / np.linalg.norm(r, axis = -1)
+    return np.nonzero(cos_angle >= np.cos(np.deg2rad(cap))[:, None])
+
+@profiled
+def aggregate_interference(orbit: Orbit, latitude: float, longitude: float, t, link: LinkBudget,
+                           min_elevation: float = 0.0, channel = None, bandwidth: float = None,
+                           pattern = antenna_pattern, max_pairs: int = default_max_pairs):
+    # Downlink C/(N+I) at a ground station tracking the highest satellite of orbit above
+    # min_elevation at each time t [s]. Every other satellite above the horizon on the same
+    # channel (an array with one entry per satellite; all of them when None) transmits the
+    # link's EIRP over bandwidth [Hz] (link.bitrate when None) and is received through the
+    # station antenna pattern, off the tracking axis. Interference is added to the noise, so
+    # 10 log10(1 + I0/N0) [dB] is how much every MODCOD threshold rises. Times are processed in
+    # chunks of about max_pairs (satellite, time) pairs, and only the satellites in the
+    # station's visibility cone are evaluated.
+    t = np.asarray(t, dtype=float)
+    bandwidth = link.bitrate if bandwidth is None else bandwidth
+    station = station_ecef(latitude, longitude)
+    shape = orbit.ecef(t[:1]).shape[:-2]
+    satellites = int(np.prod(shape))
+    apogee = np.broadcast_to(np.asarray(orbit.semi_major_axis) * (1 + np.asarray(orbit.eccentricity)), shape).ravel()
+    cap = elevation_angle_to_earth_angle(0.0, apogee - re)
+    channel = np.zeros(satellites, dtype=int) if channel is None else np.broadcast_to(channel, satellites)
+
+    m = len(t)
+    serving = np.full(m, -1)
+    elevation, slant_range = np.full(m, np.nan), np.full(m, np.nan)
+    c_to_no, i_to_n = np.full(m, -np.inf), np.zeros(m)
+    interferers = np.zeros(m, dtype=int)
+
+    chunk = max(max_pairs // satellites, 1)
+    for lo in range(0, m, chunk):
+        hi = min(lo + chunk, m)
+        r = orbit.ecef(t[lo:hi]).reshape(satellites, hi - lo, 3)
+        sat, time = visible_pairs(r, station, cap)
+        count("interference pairs", satellites * (hi - lo))
+        count("interference visible pairs", len(sat))
+        rho = r[sat, time] - station
+        distance = np.linalg.norm(rho, axis = -1)
+        pair_elevation = np.rad2deg(np.arcsin(np.clip(rho @ station / (re * distance), -1, 1)))
+        above = pair_elevation >= 0
+        sat, time, rho, distance, pair_elevation = sat[above], time[above], rho[above], distance[above], pair_elevation[above]
+        if len(sat) == 0:
+            continue        # Nothing above the horizon: the defaults stand
+
+        # Serving satellite: the highest one of each time, if above min_elevation
+        order = np.lexsort((pair_elevation, time))
+        last = np.searchsorted(time[order], np.arange(hi - lo), side = 'right') - 1
+        has = last >= 0
+        index = np.flatnonzero(has)
+        has[index] = time[order][last[index]] == index
+        best = np.full(hi - lo, -1)
+        best[has] = order[last[has]]
+        has[has] = pair_elevation[best[has]] >= min_elevation
+        index = np.flatnonzero(has)
+        pair_serving = np.full(hi - lo, -1)
+        pair_serving[index] = best[index]
+
+        w = pair_serving[time]
+        interfering = (w >= 0) & (w != np.arange(len(sat))) & (channel[sat] == channel[sat[np.maximum(w, 0)]])
+        j, k = time[interfering], w[interfering]
+        boresight = rho[k] / distance[k, None]
+        off_axis = np.rad2deg(np.arccos(np.clip(np.sum(rho[interfering] * boresight, axis = -1) / distance[interfering], -1, 1)))
+
+        # Each interferer through the same budget as the wanted signal: noise temperature at the
+        # tracking elevation, its own slant range, the pattern gain instead of the peak gain and
+        # no coding gain (I0/N0 is a ratio of physical densities), spread over bandwidth
+        i_to_no = link.c_to_no(pair_elevation[k], slant_range = distance[interfering]) - link.antenna_gain \
+                - link.coding_gain + pattern(off_axis, link.antenna_gain)
+        contribution = i_to_no - to_db(bandwidth)
+        serving[lo + index] = sat[best[index]]
+        elevation[lo + index] = pair_elevation[best[index]]
+        slant_range[lo + index] = distance[best[index]]
+        c_to_no[lo + index] = link.c_to_no(elevation[lo + index], slant_range = slant_range[lo + index])
+        i_to_n[lo:hi] = np.bincount(j, 10**(contribution / 10), hi - lo)
+        interferers[lo:hi] = np.bincount(j, minlength = hi - lo)
+
+    degradation = to_db(1 + i_to_n)
+    with np.errstate(divide='ignore'):
+        i_to_n_db = to_db(i_to_n)
+    return {
+        'serving':          serving,                # Satellite index, -1 when none is above min_elevation
+        'elevation':        elevation,
+        'slant_range':      slant_range,
+        'interferers':      interferers,            # Co-channel satellites above the horizon
+        'c_to_no':          c_to_no,                # [dB-Hz], without interference
+        'i_to_n':           np.where(serving >= 0, i_to_n_db, np.nan),    # I0/N0 [dB]
+        'c_to_ni':          c_to_no - degradation,  # C/(N0 + I0) [dB-Hz]
+        'degradation':      np.where(serving >= 0, degradation, np.nan),
+    }
+
+def modcod_degradation(table: ModcodTable, interference: dict, bitrate: float, step: float = 1.0):
+    # Per MODCOD: its threshold raised by the interference (median, P95 and worst case over the
+    # time a satellite is tracked), and the time [s] it is in use without and with interference
+    tracked = interference['serving'] >= 0
+    degradation = interference['degradation'][tracked]
+    clean = table.select(interference['c_to_no'][tracked] - to_db(bitrate))
+    interfered = table.select(interference['c_to_ni'][tracked] - to_db(bitrate))
+    used = lambda index: np.array([np.sum(index == i) for i in range(len(table.names))]) * step
+    spread = np.percentile(degradation, [50, 95, 100]) if len(degradation) else np.full(3, np.nan)
+    return {
+        'names':                table.names,
+        'required_ebno':        table.required_ebno,
+        'effective_required':   table.required_ebno[:, None] + spread[None, :],     # (scheme, [P50, P95, max])
+        'time_in_use':          used(clean),
+        'time_in_use_interfered': used(interfered),
+        'outage_time':          np.sum(clean >= 0) * step - np.sum(interfered >= 0) * step,
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [satellites] [planes] [hours] [step] [latitude] [longitude]")
+        print(f"i.e. {sys.argv[0]} 240 12 24 10 -31.4 -64.2 aggregates one day of interference from a 240 satellite, 12 plane constellation over Cordoba")
+        sys.exit()
+
+    import time
+    from compare_ebno_downlink import default_link, schemes, scheme_efficiency, target_ber
+    link = default_link()
+
+    satellites = int(sys.argv[1]) if len(sys.argv) >= 2 else 120
+    planes = int(sys.argv[2]) if len(sys.argv) >= 3 else 12
+    hours = float(sys.argv[3]) if len(sys.argv) >= 4 else 6
+    step = float(sys.argv[4]) if len(sys.argv) >= 5 else 10
+    latitude = float(sys.argv[5]) if len(sys.argv) >= 6 else -31.4
+    longitude = float(sys.argv[6]) if len(sys.argv) >= 7 else -64.2
+
+    orbit = Orbit.walker(link.orbit_height, satellites, planes, j2 = True)
+    t = np.arange(0, hours * 3600, step)
+    start = time.perf_counter()
+    result = aggregate_interference(orbit, latitude, longitude, t, link, min_elevation = 10.0)
+    elapsed = time.perf_counter() - start
+
+    tracked = result['serving'] >= 0
+    print("{} satellites x {} steps in {:.2f} s; a satellite is tracked {:.1f}% of the time, with {:.1f} co-channel interferers on average".format(
+        satellites, len(t), elapsed, 100 * np.mean(tracked), np.mean(result['interferers'][tracked]) if tracked.any() else 0))
+    if tracked.any():
+        print("I0/N0 median {:.1f} dB, P95 {:.1f} dB".format(*np.nanpercentile(result['i_to_n'][tracked], [50, 95])))
+
+    table = ModcodTable.from_schemes(schemes, scheme_efficiency, target_ber)
+    summary = modcod_degradation(table, result, link.bitrate, step)
+    print("\n{:>8} {:>9} {:>26} {:>20}".format("Scheme", "Required", "With interference P50/P95/max", "In use clean/interf."))
+    for i, name in enumerate(summary['names']):
+        print("{:>8} {:>6.2f} dB {:>10.2f} {:>6.2f} {:>6.2f} dB {:>10.0f} s {:>6.0f} s".format(
+            name, summary['required_ebno'][i], *summary['effective_required'][i], summary['time_in_use'][i], summary['time_in_use_interfered'][i]))
+    print("Time lost to interference: {:.0f} s".format(summary['outage_time']))
@@ -0,0 +1,78 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+
+from fsl_vs_phi_l import distance, fsl
+from rx_temperature import get_rx_temperature, receiver_stages, to_db
+from sky_temperature import reference_water_vapour
+from instrument import profiled
+
+# Boltzmann constant, as -10 log10(k) [dB]
+k_boltzmann = -10 * np.log10(1.38064852E-23)
+
+# Every parameter may also be an array; all terms broadcast against each other and
+# against the elevation/frequency/bitrate/temperature arguments of the methods below.
+@dataclass
+class LinkBudget:
+    orbit_height:       float = 600E3                   # [m]
+    freq:               float = (7.25 + 7.75) * 0.5E9   # [Hz]
+    bitrate:            float = 70E6                    # [bit/s]
+    eirp:               float = 0 + 6.9                 # [dBW]
+    antenna_gain:       float = 47                      # [dBi]
+    coding_gain:        float = 5                       # [dB]
+    additional_losses:  float = 1.5 + 4 - 1.4           # [dB]
+    phys_temperature:   float = 300                     # [K]
+    lnb_noise_figure:   float = 1.62                    # [dB], first stage of rx_temperature.receiver_stages
+    # Fixed system noise temperature [K]. If None, it is computed from the sky
+    # temperature and the receiver cascade in get_rx_temperature
+    noise_temperature:  Optional[float] = None
+    # Surface water-vapour density [g/m^3] of the sky temperature lookup table, evaluated at
+    # the link frequency (opt-in, i.e. 7.5). If None (or NaN, per element of an array), the
+    # 10 GHz data points are used at every frequency
+    water_vapour:       Optional[float] = None
+
+    def distance(self, elevation_angle):
+        return distance(elevation_angle, self.orbit_height)
+
+    # slant_range [m] overrides the circular-orbit distance, i.e. for propagated orbits
+    def free_space_losses(self, elevation_angle, freq = None, slant_range = None):
+        freq = self.freq if freq is None else freq
+        slant_range = self.distance(elevation_angle) if slant_range is None else slant_range
+        return fsl(slant_range, freq)
+
+    def system_temperature(self, elevation_angle, phys_temperature = None, freq = None):
+        if self.noise_temperature is not None:
+            return np.broadcast_to(self.noise_temperature, np.shape(elevation_angle)) * 1.0
+        phys_temperature = self.phys_temperature if phys_temperature is None else phys_temperature
+        stages = receiver_stages(phys_temperature, self.lnb_noise_figure)
+        water_vapour = np.asarray(np.nan if self.water_vapour is None else self.water_vapour, dtype=float)
+        plain = np.isnan(water_vapour)
+        if np.all(plain):
+            return get_rx_temperature(elevation_angle, phys_temperature, stages = stages)
+        freq = self.freq if freq is None else freq
+        temperature = get_rx_temperature(elevation_angle, phys_temperature, stages = stages, freq = freq,
+                                         water_vapour = np.where(plain, reference_water_vapour, water_vapour))
+        if np.any(plain):
+            temperature = np.where(plain, get_rx_temperature(elevation_angle, phys_temperature, stages = stages), temperature)
+        return temperature
+
+    @profiled
+    def c_to_no(self, elevation_angle, freq = None, phys_temperature = None, slant_range = None):
+        gains   = self.eirp + self.antenna_gain + self.coding_gain + k_boltzmann
+        losses  = self.free_space_losses(elevation_angle, freq, slant_range) + self.additional_losses \
+                + to_db(self.system_temperature(elevation_angle, phys_temperature, freq))
+        return gains - losses
+
+    @profiled
+    def eb_to_no(self, elevation_angle, freq = None, bitrate = None, phys_temperature = None, slant_range = None):
+        bitrate = self.bitrate if bitrate is None else bitrate
+        return self.c_to_no(elevation_angle, freq, phys_temperature, slant_range) - to_db(bitrate)
+
+    def eb_to_no_grid(self, elevation_angle, freq = None, bitrate = None, phys_temperature = None):
+        # Outer product over 1-D axes: result has shape (elevation, freq, bitrate, temperature)
+        axes = [elevation_angle,
+                self.freq if freq is None else freq,
+                self.bitrate if bitrate is None else bitrate,
+                self.phys_temperature if phys_temperature is None else phys_temperature]
+        e, f, b, t = np.ix_(*[np.atleast_1d(np.asarray(a, dtype=float)) for a in axes])
+        return self.eb_to_no(e, f, b, t)
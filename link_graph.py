@@ -0,0 +1,167 @@
+import sys
+import dataclasses
+import numpy as np
+
+from fsl_vs_phi_l import distance, fsl
+from rx_temperature import to_db
+from link_budget import LinkBudget, k_boltzmann
+from thresholds import required_gammas
+from acm import ModcodTable
+from crossings import threshold_elevation
+import compare_ebno_downlink as downlink
+
+# Node functions. Each takes the values of its inputs, parameters or other nodes, by name.
+def system_temperature(elevation_angle, freq, phys_temperature, lnb_noise_figure, noise_temperature, water_vapour):
+    link = LinkBudget(freq = freq, phys_temperature = phys_temperature, lnb_noise_figure = lnb_noise_figure,
+                      noise_temperature = noise_temperature, water_vapour = water_vapour)
+    return link.system_temperature(elevation_angle)
+
+def c_to_no(eirp, antenna_gain, coding_gain, fsl, additional_losses, system_temperature):
+    # Same terms, in the same order, as LinkBudget.c_to_no
+    gains   = eirp + antenna_gain + coding_gain + k_boltzmann
+    losses  = fsl + additional_losses + to_db(system_temperature)
+    return gains - losses
+
+def eb_to_no(c_to_no, bitrate):
+    return c_to_no - to_db(bitrate)
+
+def required_ebno(schemes, target_ber):
+    return np.array(list(required_gammas(schemes, target_ber, 1/100).values()))
+
+def efficiency(schemes):
+    return np.array([downlink.scheme_efficiency[name] for name in schemes])
+
+def intersections(elevation_angle, eb_to_no, required_ebno):
+    # Elevation where each scheme closes the link, as compare_ebno_downlink.closing_elevation.
+    # Interpolated on the cached curve, without calling the link budget again: within 1E-3 deg
+    # of the solved crossings on the default 0.2 deg grid
+    return downlink.closing_elevation(threshold_elevation(elevation_angle, eb_to_no, required_ebno))
+
+def throughput(intersections, orbit_height, freq, receiver, efficiency, coding_rate):
+    # Bits/Hz per overhead pass of each scheme with the receiver locked, 0 where it never closes
+    # the link (as compare_ebno_downlink.downlink_data)
+    return downlink.contact_time(intersections, orbit_height, freq, receiver) * efficiency * coding_rate
+
+def modcod_table(schemes, target_ber, required_ebno):
+    return ModcodTable.from_schemes(schemes, downlink.scheme_efficiency, target_ber,
+                                    required = dict(zip(schemes, required_ebno)))
+
+def acm_throughput(modcod_table, elevation_angle, eb_to_no, orbit_height, freq, receiver, coding_rate):
+    acm = downlink.acm_contact(modcod_table, elevation_angle, eb_to_no, orbit_height, freq, receiver)
+    return 0.0 if acm is None else acm[1] * coding_rate
+
+# Node name -> (function, input names)
+nodes = {
+    'distance':             (distance, ['elevation_angle', 'orbit_height']),
+    'fsl':                  (fsl, ['distance', 'freq']),
+    'system_temperature':   (system_temperature, ['elevation_angle', 'freq', 'phys_temperature', 'lnb_noise_figure',
+                                                 'noise_temperature', 'water_vapour']),
+    'c_to_no':              (c_to_no, ['eirp', 'antenna_gain', 'coding_gain', 'fsl', 'additional_losses', 'system_temperature']),
+    'eb_to_no':             (eb_to_no, ['c_to_no', 'bitrate']),
+    'required_ebno':        (required_ebno, ['schemes', 'target_ber']),
+    'efficiency':           (efficiency, ['schemes']),
+    'intersections':        (intersections, ['elevation_angle', 'eb_to_no', 'required_ebno']),
+    'throughput':           (throughput, ['intersections', 'orbit_height', 'freq', 'receiver', 'efficiency', 'coding_rate']),
+    'modcod_table':         (modcod_table, ['schemes', 'target_ber', 'required_ebno']),
+    'acm_throughput':       (acm_throughput, ['modcod_table', 'elevation_angle', 'eb_to_no', 'orbit_height', 'freq', 'receiver',
+                                                  'coding_rate']),
+}
+
+def default_parameters():
+    return {
+        **dataclasses.asdict(downlink.default_link()),
+        'elevation_angle':  np.arange(0, 90.2, 0.2),
+        'schemes':          tuple(downlink.schemes),
+        'target_ber':       downlink.target_ber,
+        'coding_rate':      downlink.coding_rate,
+        'receiver':         downlink.receiver,      # None: no acquisition time lost
+    }
+
+def same(a, b):
+    # Equal values (arrays element-wise): setting a parameter to its value keeps its dependents
+    try:
+        return np.shape(a) == np.shape(b) and bool(np.all(np.asarray(a) == np.asarray(b)))
+    except (TypeError, ValueError):
+        return a is b
+
+# Lazily evaluated link-budget quantities. A node is computed on first access and kept until
+# one of the parameters it depends on changes; set() drops only the nodes downstream of the
+# parameters that actually changed:
+#   graph = LinkGraph()
+#   graph['throughput']
+#   graph.set(antenna_gain = 48)    # distance, FSL, temperatures and thresholds are kept
+#   graph['throughput']             # recomputes c_to_no, eb_to_no, intersections, throughput
+class LinkGraph:
+    def __init__(self, **parameters):
+        unknown = set(parameters) - set(default_parameters())
+        if unknown:
+            raise ValueError("Unknown link parameters: {}".format(", ".join(sorted(unknown))))
+        self.parameters = {**default_parameters(), **parameters}
+        self.values = {}
+        self.evaluations = dict.fromkeys(nodes, 0)
+        self.dependents = {name: [] for name in [*self.parameters, *nodes]}
+        for name, (_, inputs) in nodes.items():
+            for source in inputs:
+                self.dependents[source].append(name)
+
+    @classmethod
+    def from_link(cls, link: LinkBudget, **parameters):
+        return cls(**dataclasses.asdict(link), **parameters)
+
+    def invalidate(self, name: str):
+        for dependent in self.dependents[name]:
+            if dependent in self.values:
+                del self.values[dependent]
+                self.invalidate(dependent)
+
+    def set(self, **parameters):
+        # Returns the names of the parameters that changed
+        unknown = set(parameters) - set(self.parameters)
+        if unknown:
+            raise ValueError("Unknown link parameters: {}".format(", ".join(sorted(unknown))))
+        changed = [name for name, value in parameters.items() if not same(self.parameters[name], value)]
+        for name in changed:
+            self.parameters[name] = parameters[name]
+            self.invalidate(name)
+        return changed
+
+    def __getitem__(self, name: str):
+        if name in self.parameters:
+            return self.parameters[name]
+        if name not in self.values:
+            function, inputs = nodes[name]
+            value = function(*[self[source] for source in inputs])
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False   # Shared with later reads: never modified in place
+            self.values[name] = value
+            self.evaluations[name] += 1
+        return self.values[name]
+
+    def link(self):
+        return LinkBudget(**{field.name: self.parameters[field.name] for field in dataclasses.fields(LinkBudget)})
+
+if __name__ == "__main__":
+    import time
+
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [parameter value ...]")
+        print(f"i.e. {sys.argv[0]} antenna_gain 48 bitrate 100E6 prints the downlink throughput after changing two parameters")
+        sys.exit()
+
+    graph = LinkGraph()
+    start = time.perf_counter()
+    graph['throughput'], graph['acm_throughput']
+    first = time.perf_counter() - start
+
+    changes = {name: float(value) for name, value in zip(sys.argv[1::2], sys.argv[2::2])}
+    before = dict(graph.evaluations)
+    start = time.perf_counter()
+    graph.set(**changes)
+    throughput, acm = graph['throughput'], graph['acm_throughput']
+    update = time.perf_counter() - start
+
+    print("Full evaluation {:.1f} ms, update {:.2f} ms, recomputed: {}".format(1E3 * first, 1E3 * update,
+          ", ".join(name for name in nodes if graph.evaluations[name] > before[name]) or "nothing"))
+    for name, value in zip(graph['schemes'], throughput):
+        print("{:>8}: {:6.1f} bits/Hz per pass".format(name, value))
+    print("{:>8}: {:6.1f} bits/Hz per pass".format("ACM", acm))
@@ -1,77 +1,87 @@
-import matplotlib.pyplot as plt
+import functools
 import numpy as np
-import pandas as pd
-
-from ber_psk import search_ber_psk
-from ber_qam import search_ber_qam
-from fsl_vs_phi_l import distance, fsl, elevation_angle_to_earth_angle
-from sky_temperature import get_sky_temperature
-from ber_psk import BER
-from rx_temperature import get_rx_temperature
 
+from thresholds import required_gammas
+from link_budget import LinkBudget
+import fec
 
 target_ber = 10**-5
 
-scheme_required_gamma = dict()
-scheme_required_gamma['BPSK']   = search_ber_psk(target_ber, 2, 1/100)
-
 scheme_efficiency = dict()
 scheme_efficiency['BPSK']       = 1
 
-# Dataframe for storing schemes performance
-df = pd.DataFrame(columns=['Scheme', 'Flyover time', 'Throughput'])
-
 # System variables
 orbit_height            = 600E3;
 freq                    = (7.90 + 8.40) * 0.5E9;
 bw                      = (8.40 - 7.90) * 1.0E9;
-k_boltzmann             = -10*np.log10(1.38064852E-23)
 brightness_temp_est     = 300
-coding_rate             = 56 / 63 # BCH
-
-elevation_angle         = np.arange(0, 90.2, 0.2)
-distance_to_satellite   = distance(elevation_angle, orbit_height)
-free_space_losses       = fsl(distance_to_satellite, freq)
+fec_code                = 'BCH(63,56)'
+coding_rate             = fec.codes[fec_code].rate
 
 base_station_eirp       = 6 + 6.9    # 6 dBw + 47 dBi
-coding_gain             = 2
 terminal_antenna_gain   = 47
 
 additional_losses       = 1.5 + 4
 
-# gains       = 0 + 7 + 47 + k_boltzmann 
-gains       = base_station_eirp + terminal_antenna_gain + coding_gain + k_boltzmann
-losses      = free_space_losses + additional_losses + 10 * np.log10(brightness_temp_est)
-#losses      = free_space_losses + 2 + 10 * np.log10(brightness_temp_est)    # FSL, Additional losses, Rx temperature
-c_to_no     = gains - losses
-eb_to_no    = c_to_no # - 10 * np.log10(bitrate)
-excess_db   = eb_to_no - scheme_required_gamma['BPSK']
-allowed_bitrate = np.power(10, excess_db / 10)
-
-fig, ax = plt.subplots(1, figsize=(8, 4))
-
-
-plt.plot(elevation_angle, allowed_bitrate/1e6, color="indianred", label="Bitrate")
-## We can't increase the bitrate indefinetily bcoz we are bandwidth limited. Next we plot the upper bound
-maximum_bitrate = bw * scheme_efficiency['BPSK'] * coding_rate
-plt.plot(elevation_angle, [maximum_bitrate/ 1e6]*len(elevation_angle), label = "Maximum theoretical bitrate", linestyle = "--")
-plt.title("Maximum bitrate allowed to maintain BER $<10^{}$ for BPSK modulation".format(int(np.log10(target_ber))))
-plt.xlabel("Elevation angle [deg]")
-plt.ylabel("Maximum bitrate [Mbps]")
-plt.legend()
-
-plt.yscale('log')
-ax.set_xlim(90, 0)
-
-ax.yaxis.set_major_locator(plt.FixedLocator([1, 2, 5, 10, 20, 50, 100, 200, 500]))
-ax.yaxis.set_major_formatter(plt.FixedFormatter([1, 2, 5, 10, 20, 50, 100, 200, 500]))
-plt.grid()
-
-plt.tight_layout()
-
-plt.savefig("output/maximum_bitrate_uplink.png")
-plt.savefig("output/maximum_bitrate_uplink.svg")
-
-plt.show()
-
-
+@functools.lru_cache(maxsize = 1)
+def coding_gain():
+    # Of fec_code at target_ber, with BPSK as reference. Computed on first use, since it reads
+    # (and may write) the FEC and threshold caches, which importing must not
+    return fec.coding_gain(fec_code, 'BPSK', target_ber)
+
+def default_link():
+    return LinkBudget(
+        orbit_height        = orbit_height,
+        freq                = freq,
+        eirp                = base_station_eirp,
+        antenna_gain        = terminal_antenna_gain,
+        coding_gain         = coding_gain(),
+        additional_losses   = additional_losses,
+        noise_temperature   = brightness_temp_est)
+
+def uplink_data(link: LinkBudget = None):
+    link = default_link() if link is None else link
+    scheme_required_gamma = required_gammas(['BPSK'], target_ber, 1/100)
+
+    elevation_angle         = np.arange(0, 90.2, 0.2)
+    c_to_no     = link.c_to_no(elevation_angle)
+    eb_to_no    = c_to_no # - 10 * np.log10(bitrate)
+    excess_db   = eb_to_no - scheme_required_gamma['BPSK']
+    ## We can't increase the bitrate indefinetily bcoz we are bandwidth limited: the upper bound
+    return {
+        'elevation_angle':  elevation_angle,
+        'allowed_bitrate':  np.power(10, excess_db / 10),
+        'maximum_bitrate':  bw * scheme_efficiency['BPSK'] * coding_rate,
+    }
+
+def plot_uplink_bitrate(data: dict):
+    import matplotlib.pyplot as plt
+
+    elevation_angle = data['elevation_angle']
+    fig, ax = plt.subplots(1, figsize=(8, 4))
+
+    ax.plot(elevation_angle, data['allowed_bitrate']/1e6, color="indianred", label="Bitrate")
+    ax.plot(elevation_angle, [data['maximum_bitrate']/ 1e6]*len(elevation_angle), label = "Maximum theoretical bitrate", linestyle = "--")
+    ax.set_title("Maximum bitrate allowed to maintain BER $<10^{}$ for BPSK modulation".format(int(np.log10(target_ber))))
+    ax.set_xlabel("Elevation angle [deg]")
+    ax.set_ylabel("Maximum bitrate [Mbps]")
+    ax.legend()
+
+    ax.set_yscale('log')
+    ax.set_xlim(90, 0)
+
+    ax.yaxis.set_major_locator(plt.FixedLocator([1, 2, 5, 10, 20, 50, 100, 200, 500]))
+    ax.yaxis.set_major_formatter(plt.FixedFormatter([1, 2, 5, 10, 20, 50, 100, 200, 500]))
+    ax.grid()
+
+    fig.tight_layout()
+    return fig
+
+def main():
+    import figures
+
+    figures.save(plot_uplink_bitrate(uplink_data()), "maximum_bitrate_uplink")
+    figures.show()
+
+if __name__ == "__main__":
+    main()
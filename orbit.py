@@ -0,0 +1,187 @@
+import sys
+import numpy as np
+from dataclasses import dataclass
+
+from fsl_vs_phi_l import re, mu_earth, sidereal_day, pass_time
+from link_budget import LinkBudget
+
+earth_rotation_rate = 2 * np.pi / sidereal_day     # [rad/s]
+j2 = 1.08262668E-3
+re_equatorial = 6378137.0                           # J2 reference radius [m]
+
+# Keplerian elements at t = 0, angles in degrees. Every element may be an array
+# (i.e. one entry per satellite); positions then gain those leading dimensions.
+@dataclass
+class Orbit:
+    semi_major_axis:    float                       # [m]
+    eccentricity:       float = 0.0
+    inclination:        float = 97.8                # [deg]
+    raan:               float = 0.0                 # [deg]
+    arg_perigee:        float = 0.0                 # [deg]
+    mean_anomaly:       float = 0.0                 # [deg]
+    j2:                 bool  = False               # Secular J2 drift of raan, arg_perigee and mean anomaly
+
+    @classmethod
+    def circular(cls, orbit_height: float, inclination: float = 97.8, raan: float = 0.0,
+                 mean_anomaly: float = 0.0, j2: bool = False):
+        return cls(re + np.asarray(orbit_height, dtype=float), 0.0, inclination, raan, 0.0, mean_anomaly, j2)
+
+    @classmethod
+    def walker(cls, orbit_height: float, satellites: int, planes: int, inclination: float = 97.8,
+               phasing: int = 1, j2: bool = False):
+        # Walker delta constellation i:satellites/planes/phasing, one entry per satellite
+        if planes < 1 or satellites % planes != 0:
+            raise ValueError("Walker constellations need satellites ({}) divisible by planes ({})".format(satellites, planes))
+        if phasing not in range(planes):
+            raise ValueError("Walker phasing must be in 0..{}, got {}".format(planes - 1, phasing))
+        per_plane = satellites // planes
+        plane, slot = np.divmod(np.arange(planes * per_plane), per_plane)
+        raan = 360.0 * plane / planes
+        mean_anomaly = 360.0 * slot / per_plane + 360.0 * phasing * plane / (planes * per_plane)
+        return cls.circular(orbit_height, inclination, raan, mean_anomaly, j2)
+
+    def elements(self, t):
+        # Elements broadcast against t along a new trailing time axis, angles in radians
+        expand = lambda x: np.asarray(x, dtype=float)[..., None]
+        a, e = expand(self.semi_major_axis), expand(self.eccentricity)
+        i, raan, w, m0 = [np.deg2rad(expand(x)) for x in (self.inclination, self.raan, self.arg_perigee, self.mean_anomaly)]
+
+        n = np.sqrt(mu_earth / a**3)
+        raan_rate = w_rate = 0.0
+        m_rate = n
+        if self.j2:
+            k = 1.5 * j2 * (re_equatorial / (a * (1 - e**2)))**2 * n
+            raan_rate   = -k * np.cos(i)
+            w_rate      = 0.5 * k * (5 * np.cos(i)**2 - 1)
+            m_rate      = n + 0.5 * k * np.sqrt(1 - e**2) * (3 * np.cos(i)**2 - 1)
+
+        return a, e, i, raan + raan_rate * t, w + w_rate * t, m0 + m_rate * t
+
+    def eci(self, t):
+        # Position in an Earth-centred inertial frame [m], shape (..., len(t), 3)
+        t = np.asarray(t, dtype=float)
+        a, e, i, raan, w, m = self.elements(t)
+
+        # Kepler's equation by Newton iterations, started at pi for highly eccentric orbits
+        E = np.where(e < 0.8, m, np.pi)
+        for _ in range(8):
+            E = E - (E - e * np.sin(E) - m) / (1 - e * np.cos(E))
+
+        x_p = a * (np.cos(E) - e)
+        y_p = a * np.sqrt(1 - e**2) * np.sin(E)
+
+        cr, sr, cw, sw, ci, si = np.cos(raan), np.sin(raan), np.cos(w), np.sin(w), np.cos(i), np.sin(i)
+        x = (cr * cw - sr * sw * ci) * x_p + (-cr * sw - sr * cw * ci) * y_p
+        y = (sr * cw + cr * sw * ci) * x_p + (-sr * sw + cr * cw * ci) * y_p
+        z = (sw * si) * x_p + (cw * si) * y_p
+        return np.stack(np.broadcast_arrays(x, y, z), axis = -1)
+
+    def ecef(self, t):
+        # Earth-fixed position [m], the Greenwich meridian is aligned with the x axis at t = 0
+        r = self.eci(t)
+        theta = earth_rotation_rate * np.asarray(t, dtype=float)
+        c, s = np.cos(theta), np.sin(theta)
+        return np.stack([c * r[..., 0] + s * r[..., 1], -s * r[..., 0] + c * r[..., 1], r[..., 2]], axis = -1)
+
+def station_ecef(latitude, longitude):
+    lat, lon = np.deg2rad(latitude), np.deg2rad(longitude)
+    return re * np.stack(np.broadcast_arrays(np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis = -1)
+
+def look_angles(r_ecef, station):
+    # Elevation [deg] and slant range [m] from station to satellite, both (..., 3) and broadcastable
+    rho = r_ecef - station
+    slant_range = np.linalg.norm(rho, axis = -1)
+    up = np.sum(rho * station, axis = -1) / re
+    return np.rad2deg(np.arcsin(np.clip(up / slant_range, -1, 1))), slant_range
+
+def pass_intervals(visible):
+    # Contiguous runs of True along the last axis of a 2-D mask: (row, start, stop) with stop exclusive
+    edges = np.diff(np.pad(visible.astype(np.int8), ((0, 0), (1, 1))), axis = 1)
+    row, start = np.nonzero(edges == 1)
+    _, stop = np.nonzero(edges == -1)
+    return row, start, stop
+
+def segment_sums(values, row, start, stop, ufunc = np.add):
+    # ufunc.reduce of values[row, start:stop] for every interval, in one reduceat call
+    flat = np.append(values.ravel(), 0)
+    width = values.shape[1]
+    bounds = np.stack([row * width + start, row * width + stop], axis = 1).ravel()
+    return ufunc.reduceat(flat, bounds)[::2]
+
+def pass_geometry(orbit: Orbit, latitude, longitude, t):
+    # Elevation [deg] and slant range [m] of every station (latitude/longitude arrays) against
+    # every satellite in orbit, one row per pair, and the passes found in them
+    t = np.asarray(t, dtype=float)
+    r = orbit.ecef(t)
+    satellites = int(np.prod(r.shape[:-2]))
+
+    station = station_ecef(np.atleast_1d(latitude), np.atleast_1d(longitude))
+    stations = station.shape[0]
+    station = station.reshape((stations,) + (1,) * (r.ndim - 1) + (3,))
+    elevation, slant_range = look_angles(r[None, ...], station)
+
+    geometry = {
+        'step':         np.gradient(t) if len(t) > 1 else np.ones_like(t),
+        'elevation':    elevation.reshape(-1, len(t)),
+        'slant_range':  slant_range.reshape(-1, len(t)),
+    }
+    geometry['row'], geometry['start'], geometry['stop'] = pass_intervals(geometry['elevation'] >= 0)
+    geometry['station'], geometry['satellite'] = np.unravel_index(geometry['row'], (stations, satellites))
+    return geometry
+
+def pass_summary(geometry: dict, t, min_elevation: float = 0.0):
+    t = np.asarray(t, dtype=float)
+    row, start, stop = geometry['row'], geometry['start'], geometry['stop']
+    visible_time = np.where(geometry['elevation'] >= min_elevation, geometry['step'], 0.0)
+    return {
+        'station':          geometry['station'],
+        'satellite':        geometry['satellite'],
+        'start_time':       t[start],
+        'end_time':         t[stop - 1],
+        'duration':         segment_sums(visible_time, row, start, stop),
+        'max_elevation':    segment_sums(geometry['elevation'], row, start, stop, np.maximum),
+    }
+
+def link_eb_to_no(geometry: dict, link: LinkBudget, min_elevation: float = 0.0):
+    # Eb/No of every sample, -inf below min_elevation
+    elevation = geometry['elevation']
+    visible = elevation >= min_elevation
+    eb_to_no = np.full(elevation.shape, -np.inf)
+    eb_to_no[visible] = link.eb_to_no(elevation[visible], slant_range = geometry['slant_range'][visible])
+    return eb_to_no
+
+def simulate_passes(orbit: Orbit, latitude, longitude, t, link: LinkBudget, required_ebno: float,
+                    min_elevation: float = 0.0, coding_rate: float = 1.0):
+    # One row per pass of every station/satellite pair sampled at times t [s], with the bits
+    # delivered at link.bitrate while Eb/No >= required_ebno, integrated over the time step
+    geometry = pass_geometry(orbit, latitude, longitude, t)
+    eb_to_no = link_eb_to_no(geometry, link, min_elevation)
+    usable_time = np.where(eb_to_no >= required_ebno, geometry['step'], 0.0)
+    usable_time = segment_sums(usable_time, geometry['row'], geometry['start'], geometry['stop'])
+    return {
+        **pass_summary(geometry, t, min_elevation),
+        'usable_time':      usable_time,
+        'bits':             usable_time * link.bitrate * coding_rate,
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} latitude longitude [days] [step]")
+        print(f"i.e. {sys.argv[0]} -31.4 -64.2 1 10 lists one day of passes over Cordoba, sampled every 10 s")
+        sys.exit()
+
+    from thresholds import required_gamma
+    from compare_ebno_downlink import default_link, target_ber, coding_rate
+    link = default_link()
+
+    days = float(sys.argv[3]) if len(sys.argv) >= 4 else 1
+    step = float(sys.argv[4]) if len(sys.argv) >= 5 else 10
+    t = np.arange(0, days * 86400, step)
+    gamma = required_gamma('psk', 2, target_ber)
+
+    passes = simulate_passes(Orbit.circular(link.orbit_height, j2 = True), float(sys.argv[1]), float(sys.argv[2]),
+                             t, link, gamma, coding_rate = coding_rate)
+    for start, duration, max_el, usable, bits in zip(*[passes[k] for k in ['start_time', 'duration', 'max_elevation', 'usable_time', 'bits']]):
+        print("t = {:8.0f} s: {:5.0f} s visible, max. elevation {:4.1f} deg, {:5.0f} s usable, {:.2f} Gbit".format(
+            start, duration, max_el, usable, bits / 1e9))
+    print("Overhead pass above 0 deg for comparison: {:.0f} s".format(pass_time(0, link.orbit_height)))
@@ -1,22 +1,158 @@
-import matplotlib.pyplot as plt
+import sys
 import numpy as np
+from dataclasses import dataclass
+from statistics import NormalDist
 
-ah = 0.00454
-av = 0.00395
-bh = 1.327
-bv = 1.310
+from fsl_vs_phi_l import pass_time
 
-R = 55
-att_per_km = 0.5 * ( ah * np.power(R, bh) + av * np.power(R, bv)  )
-print(att_per_km)
+# ITU-R P.838-3 regression coefficients for the specific attenuation gamma = k * R^alpha,
+# valid from 1 to 1000 GHz: (a_j, b_j, c_j, m, c) with
+#   log10(k) or alpha = sum_j a_j * exp(-((log10(f) - b_j) / c_j)^2) + m * log10(f) + c
+# https://www.itu.int/rec/R-REC-P.838-3-200503-I/en
+p838 = {
+    'kh': ([-5.33980, -0.35351, -0.23789, -0.94158],
+           [-0.10008, 1.26970, 0.86036, 0.64552],
+           [1.13098, 0.45400, 0.15354, 0.16817], -0.18961, 0.71147),
+    'kv': ([-3.80595, -3.44965, -0.39902, 0.50167],
+           [0.56934, -0.22911, 0.73042, 1.07319],
+           [0.81061, 0.51059, 0.11899, 0.27195], -0.16398, 0.63297),
+    'ah': ([-0.14318, 0.29591, 0.32177, -5.37610, 16.1721],
+           [1.82442, 0.77564, 0.63773, -0.96230, -3.29980],
+           [-0.55187, 0.19822, 0.13164, 1.47828, 3.43990], 0.67849, -1.95537),
+    'av': ([-0.07771, 0.56727, -0.20238, -48.2991, 48.5833],
+           [2.33840, 0.95545, 1.14520, 0.791669, 0.791459],
+           [-0.76284, 0.54039, 0.26809, 0.116226, 0.116479], -0.053739, 0.83433),
+}
 
-D_0 = 35 * np.exp(-0.015 * R)
-L = 6.9
+rain_height = 4.0           # Rain height above mean sea level [km] (ITU-R P.839)
+effective_radius = 8500.0   # Effective Earth radius for low elevation slant paths [km]
 
-att_001 = att_per_km * L / (1 + L / D_0)
+def p838_fit(name: str, freq):
+    a, b, c, m, offset = p838[name]
+    x = np.log10(np.asarray(freq, dtype=float) / 1E9)
+    return sum(aj * np.exp(-((x - bj) / cj)**2) for aj, bj, cj in zip(a, b, c)) + m * x + offset
 
-p = np.linspace(0.01, 2, 1000)
-att_p = att_001 * np.power(p, -0.546 -0.043 * np.log10(p))
+def rain_coefficients(freq, elevation_angle, tilt = 45.0):
+    # k and alpha for frequency [Hz], path elevation and polarization tilt [deg]. 45 deg is circular.
+    kh, kv = 10**p838_fit('kh', freq), 10**p838_fit('kv', freq)
+    ah, av = p838_fit('ah', freq), p838_fit('av', freq)
+    mix = np.cos(np.deg2rad(elevation_angle))**2 * np.cos(np.deg2rad(2 * tilt))
+    k = 0.5 * (kh + kv + (kh - kv) * mix)
+    alpha = 0.5 * (kh * ah + kv * av + (kh * ah - kv * av) * mix) / k
+    return k, alpha
 
-plt.plot(100 * p, att_p)
-plt.show()
\ No newline at end of file
+def specific_attenuation(rain_rate, freq, elevation_angle, tilt = 45.0):
+    # [dB/km] for rain rate [mm/h]
+    k, alpha = rain_coefficients(freq, elevation_angle, tilt)
+    return k * np.power(rain_rate, alpha)
+
+def slant_path(elevation_angle, station_height: float = 0.0):
+    # Length of the path below the rain height [km] (ITU-R P.618 step 2)
+    h = rain_height - station_height
+    s = np.sin(np.deg2rad(elevation_angle))
+    low = 2 * h / (np.sqrt(s**2 + 2 * h / effective_radius) + s)
+    with np.errstate(divide='ignore'):
+        return np.where(elevation_angle >= 5, h / s, low)
+
+def rain_attenuation(rain_rate, freq, elevation_angle, tilt = 45.0, station_height: float = 0.0):
+    # Path attenuation [dB] for a rain rate [mm/h] along the slant path, with the horizontal
+    # path reduction factor 1 / (1 + L_G / L_0), L_0 = 35 exp(-0.015 R)
+    L = slant_path(elevation_angle, station_height)
+    L_G = L * np.cos(np.deg2rad(elevation_angle))
+    L_0 = 35 * np.exp(-0.015 * np.minimum(rain_rate, 100))
+    return specific_attenuation(rain_rate, freq, elevation_angle, tilt) * L / (1 + L_G / L_0)
+
+def attenuation_exceedance(p, r001, freq, elevation_angle, tilt = 45.0):
+    # Attenuation [dB] exceeded for p % of the time, scaled from the 0.01 % rain rate r001 [mm/h]
+    a001 = rain_attenuation(r001, freq, elevation_angle, tilt)
+    return a001 * 0.12 * np.power(p, -(0.546 + 0.043 * np.log10(p)))
+
+# Rain rate statistics: it rains p_rain of the time, with a log-normal rain rate scaled
+# so that r001 [mm/h] is exceeded 0.01 % of the time
+@dataclass
+class RainClimate:
+    r001:   float = 55.0
+    p_rain: float = 0.05
+    sigma:  float = 1.3
+
+    @property
+    def mu(self):
+        return np.log(self.r001) - self.sigma * NormalDist().inv_cdf(1 - 1E-4 / self.p_rain)
+
+    def sample(self, rng: np.random.Generator, n: int):
+        rate = np.exp(self.mu + self.sigma * rng.standard_normal(n))
+        return np.where(rng.random(n) < self.p_rain, rate, 0.0)
+
+def sample_pass_elevation(rng: np.random.Generator, n: int, orbit_height: float, min_elevation: float = 0.0):
+    # Elevation [deg] drawn with the density of time spent at each elevation during an overhead pass
+    grid = np.linspace(min_elevation, 90, 1801)
+    time_above = pass_time(grid, orbit_height)
+    cdf = 1 - time_above / time_above[0]
+    return np.interp(rng.random(n), cdf, grid)
+
+def availability(link, required_ebno, margins, n_samples: int = 1000000, chunk_size: int = 250000,
+                 seed = None, climate: RainClimate = None, min_elevation: float = 0.0, tilt = 45.0):
+    # Monte Carlo over rain rate and pass elevation, evaluated chunk_size draws at a time.
+    # For every threshold in required_ebno [dB] and design margin in margins [dB], the scheme is
+    # used while the clear-sky Eb/No exceeds threshold + margin. Returns:
+    #   in_use[i, j]        fraction of the pass time the scheme is used
+    #   availability[i, j]  fraction of that time its threshold is still met under rain
+    rng = np.random.default_rng(seed)
+    climate = RainClimate() if climate is None else climate
+    required_ebno = np.atleast_1d(np.asarray(required_ebno, dtype=float))
+    margins = np.sort(np.atleast_1d(np.asarray(margins, dtype=float)))
+    used = np.zeros((len(required_ebno), len(margins)))
+    met = np.zeros((len(required_ebno), len(margins)))
+
+    for start in range(0, n_samples, chunk_size):
+        n = min(chunk_size, n_samples - start)
+        elevation = sample_pass_elevation(rng, n, link.orbit_height, min_elevation)
+        fade = rain_attenuation(climate.sample(rng, n), link.freq, elevation, tilt)
+        eb_to_no = link.eb_to_no(elevation)
+
+        for i, required in enumerate(required_ebno):
+            clear_margin = eb_to_no - required
+            # Samples with clear_margin >= m, for every m at once, through sorted counts
+            used[i] += n - np.searchsorted(np.sort(clear_margin), margins, side = 'left')
+            survived = np.sort(clear_margin[fade <= clear_margin])
+            met[i]  += len(survived) - np.searchsorted(survived, margins, side = 'left')
+
+    with np.errstate(invalid='ignore'):
+        return used / n_samples, met / used
+
+def main():
+    from thresholds import required_gammas
+    from compare_ebno_downlink import default_link, schemes, target_ber
+    link = default_link()
+
+    n_samples = int(float(sys.argv[1])) if len(sys.argv) >= 2 else 1000000
+    seed = int(sys.argv[2]) if len(sys.argv) >= 3 else 0
+
+    R = 55
+    print("Specific attenuation at {} mm/h, {:.2f} GHz: {:.3f} dB/km".format(
+        R, link.freq / 1E9, specific_attenuation(R, link.freq, 90)))
+
+    margins = np.arange(0, 6.5, 0.5)
+    required = required_gammas(schemes, target_ber, 1/100)
+    in_use, available = availability(link, list(required.values()), margins, n_samples, seed = seed)
+
+    print("Availability vs. design margin ({} draws, seed {})".format(n_samples, seed))
+    print("{:>8}".format("margin") + "".join("{:>9.1f}".format(m) for m in margins))
+    for name, row in zip(required, available):
+        print("{:>8}".format(name) + "".join("{:>9.5f}".format(a) for a in row))
+
+    import matplotlib.pyplot as plt
+    import figures
+
+    p = np.logspace(-3, 0, 1000)
+    for elevation_angle in [10, 30, 90]:
+        plt.plot(p, attenuation_exceedance(p, R, link.freq, elevation_angle), label = "{} deg".format(elevation_angle))
+    plt.xscale('log')
+    plt.xlabel("Percentage of time exceeded [%]")
+    plt.ylabel("Rain attenuation [dB]")
+    plt.legend()
+    plt.grid(True, which = 'both')
+    figures.show()
+
+if __name__ == "__main__":
+    main()
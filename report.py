@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import ast
+import hashlib
+import functools
+import importlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import figures
+from instrument import profiled, span
+
+manifest_file = "figures.json"
+scenario_file = "scenarios.json"
+
+# Figure name -> (module, data function, plot function). The data functions are cheap and run
+# in the calling process; their output decides whether a figure is rendered again, and only
+# the rendering is spread across the process pool.
+registry = {
+    'distance':                 ('fsl_vs_phi_l', 'angle_data', 'plot_distance'),
+    'fsl':                      ('fsl_vs_phi_l', 'angle_data', 'plot_fsl'),
+    'sky_temperature_vs_angle': ('sky_temperature', 'sky_data', 'plot_sky_temperature'),
+    'rx_temperature_vs_angle':  ('rx_temperature', 'rx_data', 'plot_rx_temperature'),
+    'cnr_norm_vs_angle':        ('calc_cnr', 'cnr_data', 'plot_cnr'),
+    'ebno_vs_angle':            ('compare_ebno_downlink', 'downlink_data', 'plot_ebno_vs_angle'),
+    'data_throughput':          ('compare_ebno_downlink', 'downlink_data', 'plot_throughput'),
+    'maximum_bitrate_uplink':   ('maximum_rate_uplink', 'uplink_data', 'plot_uplink_bitrate'),
+}
+
+# Figures drawn once per scenario of a sweep grid
+scenario_figures = ['ebno_vs_angle', 'data_throughput']
+
+def feed(h, value):
+    # Canonical bytes of nested dicts, sequences, arrays, DataFrames and scalars
+    if isinstance(value, dict):
+        h.update(b'{')
+        for key in sorted(value, key = str):
+            feed(h, str(key))
+            feed(h, value[key])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for item in value:
+            feed(h, item)
+        h.update(b']')
+    elif hasattr(value, 'columns'):
+        feed(h, {'columns': [str(c) for c in value.columns], 'rows': value.to_dict('list')})
+    elif isinstance(value, (str, bytes, bool, int, float, type(None))):
+        h.update(repr(value).encode())
+    else:
+        value = np.asarray(value)
+        if value.dtype == object:
+            feed(h, value.tolist())
+        else:
+            value = np.ascontiguousarray(value)
+            h.update("{}{}".format(value.dtype.str, value.shape).encode())
+            h.update(value.tobytes())
+
+source_dir = os.path.dirname(os.path.abspath(__file__))
+
+@functools.lru_cache(maxsize = None)
+def local_sources(module: str):
+    # Source of module and of every module of this directory it imports, directly or not (also
+    # inside functions): name -> source
+    sources, pending = {}, [module]
+    while pending:
+        name = pending.pop()
+        path = os.path.join(source_dir, name + ".py")
+        if name in sources or not os.path.exists(path):
+            continue
+        with open(path, encoding = "utf-8") as f:
+            sources[name] = f.read()
+        for node in ast.walk(ast.parse(sources[name])):
+            if isinstance(node, ast.Import):
+                pending += [alias.name.split(".")[0] for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module.split(".")[0])
+    return sources
+
+def figure_hash(name: str, data, kinds):
+    # Changes with the data, the code of the figure's module and of the local modules it
+    # imports (helpers of the plot and data functions included), the formats or the
+    # matplotlib version
+    import matplotlib
+    module, _, _ = registry[name]
+    h = hashlib.sha256()
+    feed(h, [name, local_sources(module), list(kinds), matplotlib.__version__])
+    feed(h, data)
+    return h.hexdigest()
+
+def load_manifest(output_dir: str):
+    try:
+        with open(os.path.join(output_dir, manifest_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+def write_json(path: str, value):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(value, f, indent = 1, sort_keys = True)
+    os.replace(tmp, path)
+
+def render(job):
+    # Runs in the pool: draw one figure with Agg and save it in every format
+    key, name, data, directory, kinds = job
+    figures.headless()
+    import matplotlib.pyplot as plt
+    module, _, plot = registry[name]
+    fig = getattr(importlib.import_module(module), plot)(data)
+    paths = figures.save(fig, name, directory, kinds)
+    plt.close(fig)
+    return key, paths
+
+def default_jobs(names = None):
+    # (key, figure name, data function kwargs, subdirectory) of every registered figure
+    defaults = {}
+    return [(name, name, defaults, "") for name in (names or registry)]
+
+def scenario_jobs(grid: dict, names = scenario_figures):
+    # The downlink figures of every scenario of a sweep grid, one subdirectory per scenario
+    import fec
+    import sweep
+    from link_budget import LinkBudget
+
+    axes = sweep.expand_grid(grid)
+    total = sweep.scenario_count(axes)
+    params = sweep.scenarios(axes, 0, total)
+    jobs, index = [], {}
+    for i in range(total):
+        scenario = {key: values[i].item() for key, values in params.items()}
+        directory = "scenario-{:04d}".format(i)
+        index[directory] = scenario
+
+        link = LinkBudget(**{key: scenario[key] for key in sweep.link_parameters})
+        code = None if scenario['fec'] == 'none' else scenario['fec']
+        coding_rate = scenario['coding_rate']
+        if code is not None:
+            # Coded thresholds: no flat coding gain, and the code's own rate
+            link.coding_gain, coding_rate = 0.0, fec.codes[code].rate
+        kwargs = {'link': link, 'coding_rate': coding_rate, 'target': scenario['target_ber'], 'code': code}
+        jobs += [(directory + "/" + name, name, kwargs, directory) for name in names]
+    return jobs, index
+
+@profiled
+def run_report(jobs, output_dir: str = None, kinds = None, workers: int = None, force: bool = False):
+    # Renders the figures whose data hash changed since the last run into output_dir.
+    # Returns (rendered, skipped) lists of figure keys.
+    output_dir = figures.output_dir if output_dir is None else output_dir
+    kinds = figures.formats if kinds is None else kinds
+    manifest = load_manifest(output_dir)
+
+    pending, hashes, skipped = [], {}, []
+    computed = {}
+    with span("data"):
+        for key, name, kwargs, subdirectory in jobs:
+            module, data_function, _ = registry[name]
+            # Figures of one module and scenario share their data
+            cache_key = (module, data_function, id(kwargs))
+            if cache_key not in computed:
+                computed[cache_key] = getattr(importlib.import_module(module), data_function)(**kwargs)
+            data = computed[cache_key]
+
+            directory = os.path.join(output_dir, subdirectory)
+            hashes[key] = figure_hash(name, data, kinds)
+            exists = all(os.path.exists(os.path.join(directory, "{}.{}".format(name, kind))) for kind in kinds)
+            if not force and exists and manifest.get(key) == hashes[key]:
+                skipped.append(key)
+            else:
+                pending.append((key, name, data, directory, kinds))
+
+    rendered = []
+    with span("render"):
+        pool = ProcessPoolExecutor(workers, initializer = figures.headless) if workers != 1 and len(pending) > 1 else None
+        try:
+            for key, paths in (pool.map(render, pending) if pool is not None else map(render, pending)):
+                rendered.append(key)
+                # Record every finished figure, so an interrupted run resumes where it stopped
+                manifest[key] = hashes[key]
+                if len(rendered) % 16 == 0 or len(rendered) == len(pending):
+                    write_json(os.path.join(output_dir, manifest_file), manifest)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return rendered, skipped
+
+if __name__ == "__main__":
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print(f"Usage: {sys.argv[0]} [grid.(json|yaml)] [--output DIR] [--formats svg,png] [--workers N] [--force]")
+        print(f"i.e. {sys.argv[0]} --output reports --formats png renders every figure as PNG into reports/")
+        print(f"i.e. {sys.argv[0]} grid.json --workers 8 renders the downlink figures of every scenario in grid.json")
+        print("Figures whose data did not change since the last run are skipped, unless --force")
+        sys.exit()
+
+    args = sys.argv[1:]
+    options = {}
+    for option in ['--output', '--formats', '--workers']:
+        if option in args:
+            i = args.index(option)
+            options[option] = args[i + 1]
+            del args[i:i + 2]
+    force = '--force' in args
+    args = [arg for arg in args if not arg.startswith('--')]
+
+    figures.headless()
+    output_dir = options.get('--output', figures.output_dir)
+    kinds = [kind.strip() for kind in options['--formats'].split(",")] if '--formats' in options else figures.formats
+    workers = int(options['--workers']) if '--workers' in options else None
+
+    if args:
+        from sweep import load_grid
+        jobs, index = scenario_jobs(load_grid(args[0]))
+        write_json(os.path.join(output_dir, scenario_file), index)
+    else:
+        jobs = default_jobs()
+
+    rendered, skipped = run_report(jobs, output_dir, kinds, workers, force)
+    print("Rendered {} figures into {} ({} unchanged, skipped)".format(len(rendered), output_dir, len(skipped)))
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import struct
+import numpy as np
+
+# Every column is a .npy file whose header is padded to a fixed size, so rows can be
+# appended in place and the header rewritten with the new length. meta.json records
+# the committed row count: readers never see a partially written chunk.
+header_size = 128
+meta_file = "meta.json"
+
+def write_header(f, dtype: np.dtype, shape: tuple):
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': shape})
+    preamble = np.lib.format.magic(1, 0)
+    pad = header_size - len(preamble) - 2 - len(header) - 1
+    if pad < 0:
+        raise ValueError("Column header does not fit in {} bytes".format(header_size))
+    f.seek(0)
+    f.write(preamble + struct.pack('<H', header_size - len(preamble) - 2) + header.encode('latin1') + b' ' * pad + b'\n')
+
+class ResultStore:
+    def __init__(self, path: str, attrs: dict = None):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+        try:
+            with open(os.path.join(path, meta_file)) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            self.meta = {'length': 0, 'columns': {}, 'attrs': {}}
+        if attrs is not None:
+            self.set_attrs(attrs)
+
+    def set_attrs(self, attrs: dict):
+        self.meta['attrs'].update(attrs)
+        self.commit()
+
+    def commit(self):
+        tmp = os.path.join(self.path, meta_file + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent = 1)
+        os.replace(tmp, os.path.join(self.path, meta_file))
+
+    def column_path(self, name: str):
+        return os.path.join(self.path, name + ".npy")
+
+    def append(self, columns: dict):
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+        n = {len(values) for values in columns.values()}
+        if len(n) != 1:
+            raise ValueError("Columns must have the same number of rows")
+        n = n.pop()
+
+        schema = self.meta['columns']
+        if not schema:
+            for name, values in columns.items():
+                schema[name] = {'descr': np.lib.format.dtype_to_descr(values.dtype), 'row_shape': list(values.shape[1:])}
+        elif set(schema) != set(columns):
+            raise ValueError("Columns do not match the store: expected {}".format(", ".join(schema)))
+
+        length = self.meta['length']
+        for name, values in columns.items():
+            dtype = np.lib.format.descr_to_dtype(schema[name]['descr'])
+            row_shape = tuple(schema[name]['row_shape'])
+            if values.shape[1:] != row_shape:
+                raise ValueError("Column '{}' rows must have shape {}".format(name, row_shape))
+            if values.dtype.kind in 'US' and values.dtype.itemsize > dtype.itemsize:
+                raise ValueError("Column '{}' values are wider than {}".format(name, dtype))
+
+            path = self.column_path(name)
+            with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+                # Drop rows of an append that never committed
+                f.truncate(header_size + length * dtype.itemsize * int(np.prod(row_shape)))
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(values, dtype = dtype).tobytes())
+                write_header(f, dtype, (length + n, *row_shape))
+
+        self.meta['length'] = length + n
+        self.commit()
+
+    def __len__(self):
+        return self.meta['length']
+
+    @property
+    def columns(self):
+        return list(self.meta['columns'])
+
+    @property
+    def attrs(self):
+        return self.meta['attrs']
+
+    def __getitem__(self, name: str):
+        # Memory-mapped, read-only view of the committed rows
+        if name not in self.meta['columns']:
+            raise KeyError(name)
+        return np.load(self.column_path(name), mmap_mode = 'r')[:len(self)]
+
+    def query(self, columns = None, chunk_size: int = 1 << 20, **conditions):
+        # Rows matching every condition: a value for equality, or a (low, high) inclusive range.
+        # Columns are scanned chunk by chunk, so only the matching rows are ever loaded.
+        columns = self.columns if columns is None else columns
+        found = {name: [] for name in columns}
+        for start in range(0, len(self), chunk_size):
+            rows = slice(start, start + chunk_size)
+            mask = np.ones(min(chunk_size, len(self) - start), dtype = bool)
+            for name, condition in conditions.items():
+                values = self[name][rows]
+                if isinstance(condition, tuple):
+                    mask &= (values >= condition[0]) & (values <= condition[1])
+                else:
+                    mask &= values == condition
+            for name in columns:
+                found[name].append(self[name][rows][mask])
+        return {name: np.concatenate(parts) if parts else self[name][:0] for name, parts in found.items()}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} store_dir")
+        print(f"i.e. {sys.argv[0]} output/sweep lists the columns and row count of a sweep result store")
+        sys.exit()
+
+    store = ResultStore(sys.argv[1])
+    print("{} rows".format(len(store)))
+    for name, column in store.meta['columns'].items():
+        print("{:>24}: {} {}".format(name, column['descr'], tuple(column['row_shape'])))
@@ -1,9 +1,8 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.gridspec
-import matplotlib.ticker
-import pandas as pd
+from dataclasses import dataclass
+
 from sky_temperature import get_sky_temperature
+from instrument import profiled
 
 def to_db(value: float):
     return 10 * np.log10(value)
@@ -11,98 +10,98 @@ def to_db(value: float):
 def to_lineal_gain(value: float):
     return np.power(10, value / 10)
 
-assert(to_db(to_lineal_gain(10)) == 10)
-
 def nf_to_temperature(nf: float):
     return 290.0 * ( to_lineal_gain(nf) - 1)
 
-def get_rx_temperature(elevation_angle, Tphysical):
-    print("Simulating with Tphys = {}".format(Tphysical))
-    # Left plane
-    Tsky = get_sky_temperature(elevation_angle)
+# A two-port stage of the receiver chain. Both fields broadcast, so any stage parameter can be a grid.
+@dataclass
+class Stage:
+    gain:               float = 0.0     # [dB], negative for losses
+    noise_temperature:  float = 0.0     # Equivalent input noise temperature [K]
 
-    antenna_efficiency  = 60 / 100
-    left_plane_losses   = 0.2 # perdidas a la izquierda del plano de referencia [dB]
+def amplifier(gain: float, nf: float):
+    return Stage(gain, nf_to_temperature(nf))
 
-    Tantenna = 1.0 / to_lineal_gain(left_plane_losses) * (Tsky * antenna_efficiency + Tphysical * (to_lineal_gain(left_plane_losses) - antenna_efficiency))
-    # Temperatura a la derecha del plano de referencia -- Todas las ganancias y perdidas se expresan en dB
-    Tr = 0
+def attenuator(loss: float, Tphysical: float):
+    # Passive loss [dB] at physical temperature Tphysical [K]
+    return Stage(-loss, (to_lineal_gain(loss) - 1) * Tphysical)
 
-    # Multiplicatoria de ganancias
+def receiver_stages(Tphysical, lnb_nf = 1.62):
+    # Temperatura a la derecha del plano de referencia -- Todas las ganancias y perdidas se expresan en dB
+    return [
+        amplifier(gain = 50, nf = lnb_nf),  # LNB
+        attenuator(1, Tphysical),           # Transmission line 1
+        amplifier(gain = 0, nf = 6),        # Amplifier 1
+        attenuator(1, Tphysical),           # Transmission line 2
+        Stage(0, 0),                        # ADC, ignorado en el analisis
+    ]
+
+@profiled
+def cascade_contributions(stages):
+    # Friis: contribution of every stage to the input-referred noise temperature [K]
     K = 1
-
-    ## LNB ##
-    G_LNB   = 50
-    NF_LNB  = 1.62
-    T_LNB   = nf_to_temperature(NF_LNB)
-
-    ## TL1 ##
-    L_TL1 = 1
-
-    ## TL2 ##
-    L_TL2 = 1
-
-    ## ADC ##
-    T_ADC = 0   # Ignorado en el análisis
-
-    ## Amplifier 1 ##
-    G_AMP1  = 0
-    NF_AMP1 = 6
-    T_AMP1  = nf_to_temperature(NF_AMP1)
-
-    # LNB
-    Tr += T_LNB
-    print("[0]: {}\t".format(Tr))
-
-    # Transmission Line 1
-    K *= to_lineal_gain(G_LNB)
-    dt = ( to_lineal_gain( L_TL1 ) - 1 ) * Tphysical / K
-    Tr += dt
-    print("[1]: {}\t deltaT = {}, deltaT/T = {:1.2f}%".format(Tr, dt,100 * dt / (Tr - dt)))
-
-    # Amplifier
-    K /= to_lineal_gain(L_TL1)
-    dt = T_AMP1 / K
-    Tr += dt
-    print("[2]: {}\t deltaT = {}, deltaT/T = {:1.2f}%".format(Tr, dt,100 * dt / (Tr - dt)))
-
-    # Transmission Line 2
-    K *= to_lineal_gain(G_AMP1)
-    dt = ( to_lineal_gain( L_TL2 ) - 1 ) * Tphysical / K
-    Tr += dt
-    print("[3]: {}\t deltaT = {}, deltaT/T = {:1.2f}%".format(Tr, dt,100 * dt / (Tr - dt)))
-
-    # ADC
-    K *= 1.0 / to_lineal_gain(L_TL2)
-    dt = T_ADC / K
-    Tr += dt
-    print("[4]: {}\t deltaT = {}, deltaT/T = {:1.2f}%\n".format(Tr, dt,100 * dt / (Tr - dt)))
-
-    Teq = Tr + Tantenna
-    return Teq
-
-if __name__ == "__main__":
-    elevation_angle         = np.arange(0, 91, 1)
-    physical_temperature    = np.array([273.15, 293.15, 303.15])
-
-    temps = pd.DataFrame(
-        columns = [
-            "Physical",
-            "System"
-        ]
-    )
-
-    temps.Physical  = physical_temperature
-    temps.System    = temps.apply(
-        lambda row:
-            get_rx_temperature(elevation_angle, row[0]), axis = 1
-    )
+    contributions = []
+    for stage in stages:
+        contributions.append(stage.noise_temperature / K)
+        K = K * to_lineal_gain(stage.gain)
+    return contributions
+
+def cascade_temperature(stages):
+    return sum(cascade_contributions(stages))
+
+@profiled
+def antenna_temperature(elevation_angle, Tphysical, antenna_efficiency = 60 / 100, left_plane_losses = 0.2,
+                        freq = None, water_vapour = None):
+    # left_plane_losses: perdidas a la izquierda del plano de referencia [dB]
+    Tsky = get_sky_temperature(elevation_angle, freq, water_vapour)
+    L = to_lineal_gain(left_plane_losses)
+    return 1.0 / L * (Tsky * antenna_efficiency + Tphysical * (L - antenna_efficiency))
+
+# Elevation angle, physical temperature, frequency [Hz], water-vapour density [g/m^3] and
+# the stage parameters all broadcast against each other
+@profiled
+def get_rx_temperature(elevation_angle, Tphysical, verbose = False, stages = None, freq = None, water_vapour = None):
+    stages = receiver_stages(Tphysical) if stages is None else stages
+    contributions = cascade_contributions(stages)
+
+    if verbose:
+        print("Simulating with Tphys = {}".format(Tphysical))
+        Tr = 0
+        for i, dt in enumerate(contributions):
+            Tr = Tr + dt
+            if i == 0:
+                print("[0]: {}\t".format(Tr))
+            else:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    print("[{}]: {}\t deltaT = {}, deltaT/T = {}%".format(
+                        i, Tr, dt, np.array2string(np.asarray(100 * dt / (Tr - dt)), formatter = {'float_kind': '{:1.2f}'.format})))
+        print()
+
+    return sum(contributions) + antenna_temperature(elevation_angle, Tphysical, freq = freq, water_vapour = water_vapour)
+
+def rx_data(physical_temperature = np.array([273.15, 293.15, 303.15])):
+    elevation_angle = np.arange(0, 91, 1)
+    # One row per physical temperature
+    return {
+        'elevation_angle':      elevation_angle,
+        'physical_temperature': physical_temperature,
+        'system_temperature':   get_rx_temperature(elevation_angle[None, :], physical_temperature[:, None]),
+    }
+
+def plot_rx_temperature(data: dict):
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec
+    import matplotlib.ticker
+
+    elevation_angle         = data['elevation_angle']
+    physical_temperature    = data['physical_temperature']
+    system_temperature      = data['system_temperature']
 
     fig = plt.figure(figsize = (8, 4))
     gs = matplotlib.gridspec.GridSpec(1, 3)
 
-    ax0 = plt.subplot(gs[0, 0:2])
-    ax1 = plt.subplot(gs[0, 2:3])
+    ax0 = fig.add_subplot(gs[0, 0:2])
+    ax1 = fig.add_subplot(gs[0, 2:3])
     
     ax0.set_xlim(90, 15)
     ax0.set_yscale('log')
@@ -131,26 +130,34 @@ if __name__ == "__main__":
     ax1.yaxis.set_major_formatter(matplotlib.ticker.ScalarFormatter())
     ax1.yaxis.set_minor_formatter(matplotlib.ticker.NullFormatter())
 
-    for entry in temps.values:
+    for Tphysical, Tsystem in zip(physical_temperature, system_temperature):
         ss = elevation_angle[15:90]
-        ax0.plot(ss, entry[1][15:90], label = "Rx Temperature (phys. {} deg C)".format(entry[0] - 273.15))
+        ax0.plot(ss, Tsystem[15:90], label = "Rx Temperature (phys. {} deg C)".format(Tphysical - 273.15))
 
     ax0.legend()
     ax0.autoscale(axis='y')
 
-    for entry in temps.values:
+    for Tphysical, Tsystem in zip(physical_temperature, system_temperature):
         ss = elevation_angle[0:20]
-        ax1.plot(ss, entry[1][0:20], label = "Rx Temperature (phys. {} deg C)".format(entry[0]))
+        ax1.plot(ss, Tsystem[0:20], label = "Rx Temperature (phys. {} deg C)".format(Tphysical))
 
     ax1.autoscale(axis='y')
 
     ax0.grid(True, axis="both", which="both")
     ax1.grid(True, axis="both", which="both")
 
-    fig.savefig ("output/rx_temperature_vs_angle.png")
-    fig.savefig ("output/rx_temperature_vs_angle.svg")
-
     fig.tight_layout()
+    return fig
+
+def main():
+    import figures
 
-    plt.show()
+    data = rx_data()
+    for Tphysical in data['physical_temperature']:
+        get_rx_temperature(data['elevation_angle'], Tphysical, verbose = True)
 
+    figures.save(plot_rx_temperature(data), "rx_temperature_vs_angle")
+    figures.show()
+
+if __name__ == "__main__":
+    main()
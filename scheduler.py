@@ -0,0 +1,239 @@
+import sys
+import bisect
+import numpy as np
+
+from orbit import Orbit, pass_geometry, link_eb_to_no, segment_sums
+from link_budget import LinkBudget
+
+# Ground station network used by the command line, [deg]
+ground_stations = {
+    'Cordoba':      (-31.52, -64.46),
+    'Tierra del Fuego': (-54.51, -67.11),
+    'Svalbard':     (78.23, 15.41),
+    'Kiruna':       (67.86, 20.96),
+    'Fairbanks':    (64.86, -147.85),
+    'Hartebeesthoek': (-25.89, 27.69),
+    'Singapore':    (1.35, 103.82),
+    'Awarua':       (-46.53, 168.38),
+}
+
+def link_sample_bits(geometry: dict, link: LinkBudget, required_ebno: float,
+                     min_elevation: float = 0.0, coding_rate: float = 1.0):
+    # Bits delivered in every sample of pass_geometry at link.bitrate while Eb/No >= required_ebno
+    eb_to_no = link_eb_to_no(geometry, link, min_elevation)
+    return np.where(eb_to_no >= required_ebno, link.bitrate * coding_rate * geometry['step'], 0.0)
+
+def contact_candidates(geometry: dict, sample_bits):
+    # Usable part of every pass (first to last sample delivering bits), as sample indexes
+    # [start, stop) with the cumulative bits of its samples: the bits between samples a and b
+    # of pass p are cumulative[offset[p] + b - start[p]] - cumulative[offset[p] + a - start[p]]
+    row, start, stop = geometry['row'], geometry['start'], geometry['stop']
+    width = sample_bits.shape[1]
+    index = np.broadcast_to(np.arange(width), sample_bits.shape)
+    usable = sample_bits > 0
+    first = segment_sums(np.where(usable, index, width), row, start, stop, np.minimum)
+    last = segment_sums(np.where(usable, index, -1), row, start, stop, np.maximum)
+
+    keep = last >= first
+    row, start, stop = row[keep], first[keep], last[keep] + 1
+    lengths = stop - start
+    begin = np.cumsum(lengths) - lengths                 # First sample of each pass in the packed values
+    local = np.arange(np.sum(lengths)) - np.repeat(begin, lengths)
+    values = sample_bits.ravel()[np.repeat(row * width + start, lengths) + local]
+
+    total = np.cumsum(values)
+    total = total - np.repeat(np.append(0, total)[begin], lengths)
+    offset = begin + np.arange(len(lengths))             # One leading zero per pass
+    cumulative = np.zeros(len(values) + len(lengths))
+    cumulative[np.repeat(offset + 1, lengths) + local] = total
+    return {
+        'station':      geometry['station'][keep],
+        'satellite':    geometry['satellite'][keep],
+        'start':        start,
+        'stop':         stop,
+        'offset':       offset,
+        'cumulative':   cumulative,
+        'bits':         cumulative[offset + lengths],
+    }
+
+def merge_candidates(parts, station_offsets):
+    # Concatenate candidates computed for groups of stations, renumbering stations
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    merged['station'] = np.concatenate([part['station'] + first for part, first in zip(parts, station_offsets)])
+    shift = np.cumsum([0] + [len(part['cumulative']) for part in parts[:-1]])
+    merged['offset'] = np.concatenate([part['offset'] + s for part, s in zip(parts, shift)])
+    return merged
+
+def network_candidates(orbit: Orbit, latitude, longitude, t, link: LinkBudget, required_ebno: float,
+                       min_elevation: float = 0.0, coding_rate: float = 1.0, station_chunk: int = 8):
+    # Candidates of every station/satellite pair, evaluated station_chunk stations at a time so
+    # only the visible samples of weeks of passes are kept in memory
+    latitude, longitude = np.atleast_1d(latitude), np.atleast_1d(longitude)
+    parts, firsts = [], []
+    for first in range(0, len(latitude), station_chunk):
+        chunk = slice(first, first + station_chunk)
+        geometry = pass_geometry(orbit, latitude[chunk], longitude[chunk], t)
+        parts.append(contact_candidates(geometry, link_sample_bits(geometry, link, required_ebno, min_elevation, coding_rate)))
+        firsts.append(first)
+    return merge_candidates(parts, firsts)
+
+# Non-overlapping [start, stop) sample intervals booked on one station or satellite, sorted by start
+class Timeline:
+    def __init__(self):
+        self.starts, self.stops, self.owners = [], [], []
+
+    def overlapping(self, start, stop):
+        i = bisect.bisect_right(self.stops, start)
+        found = []
+        while i < len(self.starts) and self.starts[i] < stop:
+            found.append((self.starts[i], self.stops[i], self.owners[i]))
+            i += 1
+        return found
+
+    def book(self, start, stop, owner):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.stops.insert(i, stop)
+        self.owners.insert(i, owner)
+
+    def release(self, start):
+        i = bisect.bisect_left(self.starts, start)
+        del self.starts[i], self.stops[i], self.owners[i]
+
+class NetworkSchedule:
+    def __init__(self, candidates: dict, setup: int = 0):
+        self.c = candidates
+        self.setup = setup          # Samples a station needs between two contacts
+        self.stations = [Timeline() for _ in range(int(np.max(candidates['station'], initial = -1)) + 1)]
+        self.satellites = [Timeline() for _ in range(int(np.max(candidates['satellite'], initial = -1)) + 1)]
+        # Python lists: the search below visits passes one at a time
+        self.station, self.satellite = candidates['station'].tolist(), candidates['satellite'].tolist()
+        self.start, self.stop, self.offset = candidates['start'].tolist(), candidates['stop'].tolist(), candidates['offset'].tolist()
+        self.cumulative = candidates['cumulative']
+        n = len(self.start)
+        self.assigned = [None] * n  # (start, stop, bits) of the contact scheduled in each pass
+
+    def bits(self, p, a, b):
+        base = self.offset[p] - self.start[p]
+        return float(self.cumulative[base + b] - self.cumulative[base + a])
+
+    def blocking(self, p):
+        lo, hi, pad = self.start[p], self.stop[p], self.setup
+        found = [(s - pad, e + pad, q) for s, e, q in self.stations[self.station[p]].overlapping(lo - pad, hi + pad)]
+        return found + self.satellites[self.satellite[p]].overlapping(lo, hi)
+
+    def best_window(self, p):
+        # Free gap of pass p delivering the most bits, or None
+        lo, hi = self.start[p], self.stop[p]
+        cursor, best = lo, None
+        for s, e, _ in sorted(self.blocking(p)) + [(hi, hi, None)]:
+            if s > cursor:
+                window = (cursor, min(s, hi), self.bits(p, cursor, min(s, hi)))
+                best = window if best is None or window[2] > best[2] else best
+            cursor = max(cursor, e)
+            if cursor >= hi:
+                break
+        return best
+
+    def assign(self, p, window):
+        self.assigned[p] = window
+        self.stations[self.station[p]].book(window[0], window[1], p)
+        self.satellites[self.satellite[p]].book(window[0], window[1], p)
+
+    def unassign(self, p):
+        window, self.assigned[p] = self.assigned[p], None
+        self.stations[self.station[p]].release(window[0])
+        self.satellites[self.satellite[p]].release(window[0])
+        return window
+
+    def place(self, p, min_bits):
+        window = self.best_window(p)
+        if window is not None and window[2] > 0 and window[2] >= min_bits:
+            self.assign(p, window)
+            return window[2]
+        return 0.0
+
+def schedule_contacts(candidates: dict, t, setup_time: float = 0.0, min_bits: float = 0.0, repair_rounds: int = 2):
+    # Contacts maximizing the downlinked bits, with one contact at a time per station (plus
+    # setup_time [s] to re-point between contacts) and per satellite. Greedy in decreasing pass
+    # bits, trimming each pass to the free gap with most bits; then repaired by swapping a
+    # trimmed or dropped pass in place of the contacts blocking it, whenever that gains bits.
+    t = np.asarray(t, dtype=float)
+    step = np.median(np.diff(t)) if len(t) > 1 else 1.0
+    schedule = NetworkSchedule(candidates, int(np.ceil(setup_time / step - 1E-9)))
+    full = candidates['bits'].tolist()
+    order = np.argsort(-candidates['bits'], kind = 'stable').tolist()
+
+    for p in order:
+        schedule.place(p, min_bits)
+    greedy_bits = sum(w[2] for w in schedule.assigned if w is not None)
+
+    for _ in range(repair_rounds):
+        improved = False
+        for p in order:
+            held = schedule.assigned[p][2] if schedule.assigned[p] is not None else 0.0
+            if held >= full[p]:
+                continue
+            blocking = {q for _, _, q in schedule.blocking(p)} | ({p} if schedule.assigned[p] is not None else set())
+            lost = sum(schedule.assigned[q][2] for q in blocking)
+            if full[p] <= lost:
+                continue
+
+            saved = {q: schedule.unassign(q) for q in blocking}
+            gained = schedule.place(p, min_bits)
+            for q in sorted(blocking - {p}, key = lambda q: -full[q]):
+                gained += schedule.place(q, min_bits)
+            if gained > lost * (1 + 1E-12):
+                improved = True
+                continue
+            for q in blocking | {p}:
+                if schedule.assigned[q] is not None:
+                    schedule.unassign(q)
+            for q, window in saved.items():
+                schedule.assign(q, window)
+        if not improved:
+            break
+
+    chosen = np.array([p for p in range(len(full)) if schedule.assigned[p] is not None], dtype = int)
+    windows = np.array([schedule.assigned[p] for p in chosen]).reshape(-1, 3)
+    start, stop = windows[:, 0].astype(int), windows[:, 1].astype(int)
+    return {
+        'pass':         chosen,
+        'station':      candidates['station'][chosen],
+        'satellite':    candidates['satellite'][chosen],
+        'start_time':   t[start],
+        'end_time':     t[stop - 1],
+        'bits':         windows[:, 2],
+        'greedy_bits':  greedy_bits,
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [days] [satellites] [step] [setup_time]")
+        print(f"i.e. {sys.argv[0]} 7 6 10 60 schedules one week of 6 satellites over the ground station network")
+        sys.exit()
+
+    from thresholds import required_gamma
+    from compare_ebno_downlink import default_link, target_ber, coding_rate
+    link = default_link()
+
+    days = float(sys.argv[1]) if len(sys.argv) >= 2 else 1
+    satellites = int(sys.argv[2]) if len(sys.argv) >= 3 else 4
+    step = float(sys.argv[3]) if len(sys.argv) >= 4 else 10
+    setup_time = float(sys.argv[4]) if len(sys.argv) >= 5 else 60
+
+    t = np.arange(0, days * 86400, step)
+    # One sun-synchronous plane per satellite, spread in right ascension
+    orbit = Orbit.circular(link.orbit_height, raan = np.arange(satellites) * 180 / satellites, j2 = True)
+    latitude, longitude = np.array(list(ground_stations.values())).T
+    candidates = network_candidates(orbit, latitude, longitude, t, link, required_gamma('psk', 2, target_ber),
+                                    coding_rate = coding_rate)
+    contacts = schedule_contacts(candidates, t, setup_time)
+
+    names = list(ground_stations)
+    print("{} candidate passes, {:.1f} Gbit if there were no conflicts".format(len(candidates['bits']), np.sum(candidates['bits']) / 1E9))
+    print("{} contacts scheduled: {:.1f} Gbit (greedy alone {:.1f} Gbit)".format(
+        len(contacts['pass']), np.sum(contacts['bits']) / 1E9, contacts['greedy_bits'] / 1E9))
+    for i, name in enumerate(names):
+        mine = contacts['station'] == i
+        print("{:>18}: {:4d} contacts, {:7.1f} Gbit".format(name, np.sum(mine), np.sum(contacts['bits'][mine]) / 1E9))
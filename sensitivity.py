@@ -0,0 +1,150 @@
+import sys
+import dataclasses
+import numpy as np
+from dataclasses import dataclass
+
+from link_budget import LinkBudget
+from crossings import threshold_elevation
+from special import erfcinv
+from instrument import profiled
+
+default_chunk_size = 1 << 14                            # Draws evaluated at once
+solver_elevation_angle = np.arange(0, 90.1, 5.0)        # Threshold crossings are refined in between
+report_elevation_angle = np.array([10, 20, 30, 45, 60, 90])
+percentiles = [1, 5, 50, 95, 99]
+
+# An uncertain input: nominal +- spread uniformly, or normal with standard deviation spread
+@dataclass
+class Uncertain:
+    nominal:    float
+    spread:     float
+    kind:       str = 'uniform'
+
+    def ppf(self, u):
+        # Maps uniform draws in (0, 1) onto the distribution
+        if self.kind == 'uniform':
+            return self.nominal + self.spread * (2 * u - 1)
+        if self.kind == 'normal':
+            # Draws at u close to 0.5 go through erfcinv's series branch (|1 - 2u| < 1e-3)
+            return self.nominal - self.spread * np.sqrt(2) * erfcinv(2 * u)
+        raise ValueError("Unknown distribution '{}'".format(self.kind))
+
+def default_uncertainties(link: LinkBudget):
+    return {
+        'eirp':                 Uncertain(link.eirp, 1.0),
+        'antenna_gain':         Uncertain(link.antenna_gain, 0.5, 'normal'),
+        'additional_losses':    Uncertain(link.additional_losses, 1.0),
+        'lnb_noise_figure':     Uncertain(link.lnb_noise_figure, 0.3),
+        'phys_temperature':     Uncertain(link.phys_temperature, 20.0),
+    }
+
+def latin_hypercube(n: int, d: int, rng: np.random.Generator):
+    # One draw in each of n equal strata per dimension, strata shuffled independently
+    u = (np.arange(n)[:, None] + rng.random((n, d))) / n
+    return np.take_along_axis(u, rng.random((n, d)).argsort(axis = 0), axis = 0)
+
+def uniform_draws(n: int, d: int, sampler: str = 'sobol', seed = None):
+    # n points in (0, 1)^d
+    rng = np.random.default_rng(seed)
+    if sampler == 'sobol':
+        from scipy.stats import qmc
+        # Scrambled Sobol points; powers of two keep its balance properties
+        return qmc.Sobol(d, scramble = True, seed = rng).random(n)
+    if sampler == 'lhs':
+        return latin_hypercube(n, d, rng)
+    if sampler == 'random':
+        return rng.random((n, d))
+    raise ValueError("Unknown sampler '{}'".format(sampler))
+
+@profiled
+def evaluate_margins(link: LinkBudget, draws: dict, required_ebno: float, chunk_size: int = default_chunk_size):
+    # Full Eb/No chain for every draw (arrays of parameter values by LinkBudget field name),
+    # chunk_size draws at a time. Returns (n, len(report_elevation_angle) + 1): the margin [dB]
+    # at each report elevation, and the elevation where the margin turns positive (90 where
+    # it never does).
+    n = len(next(iter(draws.values())))
+    columns = np.searchsorted(solver_elevation_angle, report_elevation_angle)
+    out = np.empty((n, len(report_elevation_angle) + 1))
+    for lo in range(0, n, chunk_size):
+        hi = min(lo + chunk_size, n)
+        drawn = dataclasses.replace(link, **{name: values[lo:hi, None] for name, values in draws.items()})
+        eb_to_no = drawn.eb_to_no(solver_elevation_angle[None, :])
+        out[lo:hi, :-1] = eb_to_no[:, columns] - required_ebno
+        threshold = threshold_elevation(solver_elevation_angle, eb_to_no, np.full(hi - lo, required_ebno),
+                                        lambda e: drawn.eb_to_no(e[:, None])[:, 0])
+        out[lo:hi, -1] = np.nan_to_num(threshold, nan = 90.0)
+    return out
+
+def output_names():
+    return ["margin at {:g} deg".format(e) for e in report_elevation_angle] + ["threshold elevation"]
+
+@profiled
+def sobol_indices(link: LinkBudget, uncertainties: dict, required_ebno: float, n: int = 1 << 14,
+                  sampler: str = 'sobol', seed = None, chunk_size: int = default_chunk_size):
+    # First and total-order Sobol indices of every output with respect to every uncertain input,
+    # from n (d + 2) model runs: Saltelli's A, B and AB_i matrices with the Saltelli (2010)
+    # first-order and Jansen total-order estimators. The 2n runs of A and B also give the
+    # output percentiles.
+    names = list(uncertainties)
+    d = len(names)
+    u = uniform_draws(n, 2 * d, sampler, seed)
+    a, b = u[:, :d], u[:, d:]
+    # A, B, then AB_i (A with column i from B) for every i, evaluated in one batch
+    blocks = [a, b]
+    for i in range(d):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+    stacked = np.concatenate(blocks)
+    draws = {name: uncertainties[name].ppf(stacked[:, i]) for i, name in enumerate(names)}
+    y = evaluate_margins(link, draws, required_ebno, chunk_size).reshape(d + 2, n, -1)
+
+    f_a, f_b, f_ab = y[0], y[1], y[2:]
+    variance = np.var(np.concatenate([f_a, f_b]), axis = 0)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        first = np.mean(f_b[None] * (f_ab - f_a[None]), axis = 1) / variance
+        total = 0.5 * np.mean((f_a[None] - f_ab)**2, axis = 1) / variance
+    samples = np.concatenate([f_a, f_b])
+    return {
+        'parameters':   names,
+        'outputs':      output_names(),
+        'first_order':  first,                          # (parameter, output)
+        'total_order':  total,
+        'percentiles':  np.percentile(samples, percentiles, axis = 0),
+        'outage':       np.mean(samples[:, :-1] < 0, axis = 0),     # P(margin < 0) per report elevation
+        'runs':         n * (d + 2),
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in ['-h', '--help']:
+        print(f"Usage: {sys.argv[0]} [n] [sampler] [scheme]")
+        print(f"i.e. {sys.argv[0]} 16384 sobol QPSK runs 16384 x 7 draws of the downlink with Sobol points, margins for QPSK")
+        print("sampler: sobol, lhs or random")
+        sys.exit()
+
+    import time
+    from thresholds import required_gamma, parse_scheme
+    from compare_ebno_downlink import default_link, target_ber
+    link = default_link()
+
+    n = int(float(sys.argv[1])) if len(sys.argv) >= 2 else 1 << 14
+    sampler = sys.argv[2] if len(sys.argv) >= 3 else 'sobol'
+    scheme = sys.argv[3] if len(sys.argv) >= 4 else 'QPSK'
+    required = required_gamma(*parse_scheme(scheme), target_ber, 1/100)
+
+    uncertainties = default_uncertainties(link)
+    start = time.perf_counter()
+    result = sobol_indices(link, uncertainties, required, n, sampler, seed = 0)
+    elapsed = time.perf_counter() - start
+    print("{} runs in {:.1f} s ({} sampler), {} at BER {:.0e}: required Eb/No {:.2f} dB".format(
+        result['runs'], elapsed, sampler, scheme, target_ber, required))
+
+    print("\nPercentiles" + "".join("{:>10}".format("P{}".format(p)) for p in percentiles) + "  P(margin < 0)")
+    for j, name in enumerate(result['outputs']):
+        outage = "{:>14.4f}".format(result['outage'][j]) if j < len(result['outage']) else ""
+        print("{:>22}".format(name) + "".join("{:10.2f}".format(v) for v in result['percentiles'][:, j]) + outage)
+
+    for label, key in [("First-order", 'first_order'), ("Total-order", 'total_order')]:
+        print("\n{} indices".format(label) + "".join("{:>20}".format(name) for name in result['parameters']))
+        for j, name in enumerate(result['outputs']):
+            print("{:>22}".format(name) + "".join("{:20.3f}".format(v) for v in result[key][:, j]))
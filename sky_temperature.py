@@ -1,6 +1,12 @@
-import matplotlib.pyplot as plt
-import numpy as np
+import os
 import sys
+import warnings
+import itertools
+import functools
+import numpy as np
+
+from cache import cache_dir, cache_path
+from instrument import profiled
 
 # Empirical sky temperature data at 10 GHz
 # https://www.itu.int/dms_pubrec/itu-r/rec/p/R-REC-P.372-15-202109-I!!PDF-E.pdf
@@ -14,42 +20,165 @@ data_points = np.array([
     [90, 3]]
 ).transpose()
 
-def get_sky_temperature(elevation_angle: float):
-    return np.interp(elevation_angle, data_points[0], data_points[1])
+reference_freq          = 10.0      # [GHz]
+reference_water_vapour  = 7.5       # [g/m^3]
+mean_radiating_temperature = 275.0  # [K] (ITU-R P.372)
 
-if __name__ == "__main__":
+# Dense lookup table over uniform (start, step, count) axes: elevation [deg],
+# frequency [GHz] and surface water-vapour density [g/m^3]. Bump table_version
+# whenever the model or the axes change, so stale cached tables are rebuilt.
+table_version = 1
+table_axes = [
+    (0.0, 0.25, 361),
+    (1.0, 0.25, 197),
+    (0.0, 0.5,  51),
+]
 
-    if(len(sys.argv) >= 2):
-        elevation_angle = int(sys.argv[1])
-        print(get_sky_temperature(elevation_angle))
-        sys.exit()
+def zenith_attenuation(freq, water_vapour):
+    # Clear-air zenith attenuation [dB], freq [GHz] below 54 GHz: sea level specific attenuation
+    # of oxygen and water vapour times their equivalent heights (ITU-R P.676 Annex 2, simplified)
+    f, rho = np.asarray(freq, dtype=float), np.asarray(water_vapour, dtype=float)
+    gamma_o = (7.19E-3 + 6.09 / (f**2 + 0.227) + 4.81 / ((f - 57)**2 + 1.50)) * f**2 * 1E-3
+    gamma_w = (0.050 + 0.0021 * rho + 3.6 / ((f - 22.2)**2 + 8.5) + 10.6 / ((f - 183.3)**2 + 9.0)
+               + 8.9 / ((f - 325.4)**2 + 26.3)) * f**2 * rho * 1E-4
+    h_o = 6.0
+    h_w = 2.2 + 3.0 / ((f - 22.3)**2 + 3.0) + 1.0 / ((f - 183.3)**2 + 1.0) + 1.0 / ((f - 325.1)**2 + 4.0)
+    return gamma_o * h_o + gamma_w * h_w
+
+@profiled
+def sky_temperature_model(elevation_angle, freq, water_vapour):
+    # Brightness temperature [K] at freq [GHz]: the opacity along the path implied by the measured
+    # 10 GHz, 7.5 g/m^3 curve, scaled by the zenith attenuation ratio. It reproduces data_points
+    # at the reference conditions and saturates at the mean radiating temperature.
+    T_m = mean_radiating_temperature
+    opacity = -np.log1p(-np.interp(elevation_angle, data_points[0], data_points[1]) / T_m)
+    scale = zenith_attenuation(freq, water_vapour) / zenith_attenuation(reference_freq, reference_water_vapour)
+    return T_m * -np.expm1(-opacity * scale)
+
+def axis_values(axis):
+    start, step, count = axis
+    return start + step * np.arange(count)
+
+@profiled
+def build_table():
+    el, f, rho = np.ix_(*[axis_values(axis) for axis in table_axes])
+    return sky_temperature_model(el, f, rho)
+
+@functools.lru_cache(maxsize = 1)
+@profiled
+def sky_table():
+    # Built once, then memory-mapped from the shared cache by every later process
+    path = cache_path("sky_temperature_v{}.npy".format(table_version))
+    shape = tuple(count for _, _, count in table_axes)
+    try:
+        table = np.load(path, mmap_mode = 'r')
+        if table.shape == shape:
+            return table
+    except (OSError, ValueError):
+        pass
+
+    table = build_table()
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, path)
+        return np.load(path, mmap_mode = 'r')
+    except OSError:
+        return table    # The cache is best-effort, read-only checkouts still work
 
-    plt.close()
-    plt.figure(figsize = (8, 4))
+@profiled
+def interpolate(table, axes, *points):
+    # Multilinear interpolation on uniform axes, points clipped to the table edges.
+    # All points broadcast against each other; 2^ndim flat gathers per point, no search.
+    points = np.broadcast_arrays(*[np.asarray(p, dtype=float) for p in points])
+    flat = np.ravel(table)
+    strides = np.cumprod((1,) + table.shape[:0:-1])[::-1]
+    base, weight = 0, []
+    for (start, step, count), p, stride in zip(axes, points, strides):
+        x = np.clip((p - start) / step, 0, count - 1)
+        i = np.minimum(x.astype(np.intp), count - 2)
+        base = base + i * stride
+        weight.append(x - i)
 
-    plt.title("Brightness temperature vs. elevation angle\n(clean air, ${7.5g/m^3}$ water vapour concentration, freq. 10 GHz)")
-    plt.xlabel("Elevation angle [deg]")
-    plt.ylabel("Brightness temperature [K]")
+    # Gather the 2^ndim corners, then reduce them one axis at a time (last axis first)
+    corners = [flat[base + int(np.dot(corner, strides))] for corner in itertools.product((0, 1), repeat = len(axes))]
+    for w in reversed(weight):
+        corners = [low + w * (high - low) for low, high in zip(corners[0::2], corners[1::2])]
+    return corners[0]
 
-    plt.plot(data_points[0], data_points[1], 'x',   color="indianred",  markersize=8, label="Data points")
-    # plt.plot(data_points[0], data_points[1], '--',  color="dodgerblue", label="Linear interpolation")
+# freq [Hz] and water_vapour [g/m^3] select the lookup table; without them this is the
+# plain interpolation of the 10 GHz data points
+@profiled
+def get_sky_temperature(elevation_angle: float, freq = None, water_vapour = None):
+    if freq is None and water_vapour is None:
+        return np.interp(elevation_angle, data_points[0], data_points[1])
+    freq = reference_freq if freq is None else np.asarray(freq) / 1E9
+    water_vapour = reference_water_vapour if water_vapour is None else water_vapour
+    # The table is clipped at its edges: queries beyond them get the edge values
+    for name, values, (start, step, count), unit in [('frequency', freq, table_axes[1], "GHz"),
+                                                     ('water vapour density', water_vapour, table_axes[2], "g/m^3")]:
+        values = np.asarray(values, dtype=float)
+        stop = start + step * (count - 1)
+        if np.any(values < start) or np.any(values > stop):
+            warnings.warn("Sky temperature {} outside the table ({:g} to {:g} {}, got {:g} to {:g}): edge values used".format(
+                name, start, stop, unit, np.min(values), np.max(values)), RuntimeWarning, stacklevel = 2)
+    return interpolate(sky_table(), table_axes, elevation_angle, freq, water_vapour)
+
+def sky_data(freqs = (7.5E9, 8.15E9)):
     t = np.arange(0, 91, 5)
-    plt.plot(t, get_sky_temperature(t), '--',  color="dodgerblue", label="Linear interpolation")
-    plt.legend()
+    return {
+        'elevation_angle':  t,
+        'legacy':           get_sky_temperature(t),
+        'freq':             np.array(freqs),
+        'table':            np.array([get_sky_temperature(t, freq) for freq in freqs]),
+    }
+
+def plot_sky_temperature(data: dict):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize = (8, 4))
 
-    plt.yscale("log")
+    ax.set_title("Brightness temperature vs. elevation angle\n(clean air, ${7.5g/m^3}$ water vapour concentration, freq. 10 GHz)")
+    ax.set_xlabel("Elevation angle [deg]")
+    ax.set_ylabel("Brightness temperature [K]")
+
+    t = data['elevation_angle']
+    ax.plot(data_points[0], data_points[1], 'x',   color="indianred",  markersize=8, label="Data points")
+    # ax.plot(data_points[0], data_points[1], '--',  color="dodgerblue", label="Linear interpolation")
+    ax.plot(t, data['legacy'], '--',  color="dodgerblue", label="Linear interpolation")
+    for freq, temperature in zip(data['freq'], data['table']):
+        ax.plot(t, temperature, label="{:.2f} GHz (lookup table)".format(freq / 1E9))
+    ax.legend()
+
+    ax.set_yscale("log")
 
     xlocs = np.append(np.arange(0, 91, 15), data_points[0])
     ylocs = np.append(np.arange(0, 101, 25), data_points[1])
 
-    plt.xticks(xlocs, xlocs)
-    plt.yticks(ylocs, ylocs)
+    ax.set_xticks(xlocs)
+    ax.set_xticklabels(xlocs)
+    ax.set_yticks(ylocs)
+    ax.set_yticklabels(ylocs)
 
-    plt.autoscale("auto")
-    plt.grid(True, axis="both")
-    plt.tight_layout()
+    ax.autoscale(True)
+    ax.grid(True, axis="both")
+    fig.tight_layout()
+    return fig
 
-    plt.savefig ("output/sky_temperature_vs_angle.svg")
-    plt.savefig ("output/sky_temperature_vs_angle.png")
+def main():
+    if(len(sys.argv) >= 2):
+        elevation_angle = int(sys.argv[1])
+        freq = float(sys.argv[2]) * 1E9 if len(sys.argv) >= 3 else None
+        water_vapour = float(sys.argv[3]) if len(sys.argv) >= 4 else None
+        print(get_sky_temperature(elevation_angle, freq, water_vapour))
+        sys.exit()
+
+    import figures
 
-    plt.show()
+    figures.save(plot_sky_temperature(sky_data()), "sky_temperature_vs_angle")
+    figures.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+
+from instrument import profiled, count
+
+# Bump whenever log_erfc or erfcinv change results: the threshold and FEC caches are keyed on it,
+# along with the BER modules' formula_version
+formula_version = 2
+
+# Chebyshev fit of erfc(z) * exp(z^2) / t, fractional error below 1.2e-7 for all z >= 0
+# Numerical Recipes in C, 2nd ed., section 6.2 (erfcc)
+erfc_coefficients = np.array([
+    -1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+    0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277
+])
+
+@profiled
+def log_erfc(x):
+    # Natural logarithm of erfc(x), computed without underflow for large x
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+
+    poly = np.zeros_like(t)
+    for c in erfc_coefficients[::-1]:
+        poly = c + t * poly
+
+    log_pos = np.log(t) - z * z + poly
+
+    # erfc(-z) = 2 - erfc(z)
+    return np.where(x >= 0, log_pos, np.log(2 - np.exp(log_pos)))
+
+def erfc(x):
+    return np.exp(log_erfc(x))
+
+series_limit = 1e-3      # |1 - y| below which erfcinv uses the series of erfinv
+
+@profiled
+def erfcinv(y, rtol: float = 1e-12, max_iter: int = 32):
+    # Newton iterations on log(erfc(x)) - log(y). log(erfc) is concave and decreasing,
+    # so iterates started right of the root decrease monotonically towards it. They stop once
+    # the step is below rtol * max(|x|, 1), or the residual below rtol: relative for large x,
+    # absolute near 0, where the ~1e-7 error of the log_erfc fit swamps any relative test.
+    # Close to y = 1 the series of erfinv is used instead. NaN where the iterations have not
+    # converged within max_iter.
+    y = np.asarray(y, dtype=float)
+
+    # erfcinv(2 - y) = -erfcinv(y)
+    upper = y > 1
+    y = np.where(upper, 2 - y, y)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_y = np.log(y)
+        # erfc(x) <= exp(-x^2) for x >= 0, so this guess is never left of the root
+        x = np.sqrt(-log_y)
+
+        # erfcinv(1 - d) = erfinv(d) = w + w^3 / 3 + O(w^5), w = sqrt(pi) / 2 * d: within 1e-13
+        # below series_limit, where the fit is too coarse for Newton
+        w = np.sqrt(np.pi) / 2 * (1 - y)
+        series = np.abs(1 - y) < series_limit
+        x = np.where(series, w + w**3 / 3, x)
+
+        active = np.isfinite(x) & (x > 0) & ~series
+        for _ in range(max_iter):
+            if not np.any(active):
+                break
+            log_erfc_x = log_erfc(x)
+            slope = -2 / np.sqrt(np.pi) * np.exp(-x * x - log_erfc_x)
+            residual = log_erfc_x - log_y
+            step = np.where(active, residual / slope, 0)
+            x = x - step
+            active &= (np.abs(step) > rtol * np.maximum(np.abs(x), 1)) & (np.abs(residual) > rtol)
+            count("erfcinv iterations")
+
+    # NaN where max_iter was not enough to converge
+    x = np.where(active, np.nan, x)
+    x = np.where(upper, -x, x)
+    return x[()]
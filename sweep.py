@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import dataclasses
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from link_budget import LinkBudget
+from thresholds import required_gamma, parse_scheme
+from fsl_vs_phi_l import pass_time
+from compare_ebno_downlink import scheme_efficiency
+from result_store import ResultStore
+from crossings import threshold_elevation
+from instrument import profiled, span
+import fec
+
+link_parameters = [field.name for field in dataclasses.fields(LinkBudget) if field.name != 'noise_temperature']
+
+default_scenario = {
+    **{name: getattr(LinkBudget, name) for name in link_parameters},
+    'coding_rate':  223 / 255,
+    'target_ber':   1E-5,
+    'scheme':       'BPSK',
+    'fec':          'none',     # A fec.codes name: coded thresholds, coding_gain and coding_rate from the code
+    'water_vapour': np.nan,     # NaN (or null in a grid) as LinkBudget's None: the 10 GHz sky temperature data points
+}
+
+default_elevation_angle = np.arange(0, 90.2, 0.2)
+# Without curves, thresholds are solved on link.eb_to_no between the samples of a coarse grid
+solver_elevation_angle = np.arange(0, 90.1, 5.0)
+default_chunk_size = 2048
+precision = 1/100
+
+# A grid maps each scenario parameter to a value, a list of values, or a range:
+#   {"start": 7.25E9, "stop": 8.40E9, "num": 5}     -> np.linspace
+#   {"start": 400E3, "stop": 800E3, "step": 50E3}   -> np.arange
+# Parameters left out take their value from default_scenario.
+def expand_axis(spec):
+    if isinstance(spec, dict):
+        if 'num' in spec:
+            return np.linspace(spec['start'], spec['stop'], int(spec['num']))
+        return np.arange(spec['start'], spec['stop'], spec['step'], dtype = float)
+    values = np.atleast_1d(np.asarray(spec))
+    if values.dtype == object:
+        values = np.array([np.nan if value is None else value for value in values], dtype = float)
+    return values.astype(float) if values.dtype.kind in 'biu' else values
+
+def expand_grid(grid: dict):
+    unknown = set(grid) - set(default_scenario)
+    if unknown:
+        raise ValueError("Unknown scenario parameters: {}".format(", ".join(sorted(unknown))))
+    return {name: expand_axis(grid.get(name, default)) for name, default in default_scenario.items()}
+
+def load_grid(path: str):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def scenario_count(axes: dict):
+    return int(np.prod([len(values) for values in axes.values()]))
+
+def scenarios(axes: dict, start: int, stop: int):
+    # Scenarios [start, stop) of the cartesian product, without materialising the whole product
+    index = np.unravel_index(np.arange(start, stop), [len(values) for values in axes.values()])
+    return {name: values[i] for (name, values), i in zip(axes.items(), index)}
+
+@profiled
+def evaluate_scenarios(params: dict, elevation_angle = None, curves: bool = False):
+    if elevation_angle is None:
+        elevation_angle = default_elevation_angle if curves else solver_elevation_angle
+    n = len(params['scheme'])
+    # With a code, the threshold is the coded one: no flat coding gain, and the code's own rate
+    params = {**params,
+              'coding_gain':    np.where(params['fec'] != 'none', 0.0, params['coding_gain']),
+              'coding_rate':    np.array([fec.codes[code].rate if code != 'none' else rate
+                                          for code, rate in zip(params['fec'], params['coding_rate'])])}
+    link = LinkBudget(**{name: params[name][:, None] for name in link_parameters})
+    eb_to_no = link.eb_to_no(elevation_angle[None, :])
+
+    gamma = np.empty(n)
+    efficiency = np.empty(n)
+    keys = np.stack([params['scheme'], params['target_ber'].astype(str), params['fec']])
+    triples, inverse = np.unique(keys, axis = 1, return_inverse = True)
+    for i, (scheme, target, code) in enumerate(triples.T):
+        if code == 'none':
+            gamma[inverse == i]     = required_gamma(*parse_scheme(scheme), float(target), precision)
+        else:
+            gamma[inverse == i]     = fec.required_ebno(code, scheme, float(target))
+        efficiency[inverse == i]    = scheme_efficiency[scheme]
+
+    # The threshold is the elevation above which the requirement is met, solved to a small
+    # fraction of a degree between the grid samples
+    threshold = threshold_elevation(elevation_angle, eb_to_no, gamma, lambda e: link.eb_to_no(e[:, None])[:, 0])
+    flyover_time = pass_time(threshold, params['orbit_height'])
+
+    results = {
+        **params,
+        'required_ebno':        gamma,
+        'threshold_elevation':  threshold,
+        'flyover_time':         flyover_time,
+        'throughput_per_hz':    np.nan_to_num(flyover_time) * efficiency * params['coding_rate'],
+    }
+    if curves:
+        # One row per scenario, one value per elevation_angle
+        results['eb_to_no'] = eb_to_no
+        results['margin']   = eb_to_no - gamma[:, None]
+    return results
+
+def evaluate_chunk(args):
+    axes, start, stop, elevation_angle, curves = args
+    return evaluate_scenarios(scenarios(axes, start, stop), elevation_angle, curves)
+
+@profiled
+def run_sweep(grid: dict, output_dir: str, workers: int = None, chunk_size: int = default_chunk_size,
+              elevation_angle = None, curves: bool = False):
+    if elevation_angle is None:
+        elevation_angle = default_elevation_angle if curves else solver_elevation_angle
+    axes = expand_grid(grid)
+    total = scenario_count(axes)
+    # The attrs are written only once the store is known to be empty, so a refused run leaves
+    # the metadata of the results already there untouched
+    store = ResultStore(output_dir)
+    if len(store):
+        raise ValueError("{} already holds {} results".format(output_dir, len(store)))
+    store.set_attrs({
+        'grid':             {name: values.tolist() for name, values in axes.items()},
+        'elevation_angle':  elevation_angle.tolist()})
+
+    tasks = [(axes, start, min(start + chunk_size, total), elevation_angle, curves) for start in range(0, total, chunk_size)]
+    if workers == 1:
+        for columns in map(evaluate_chunk, tasks):
+            with span("store.append"):
+                store.append(columns)
+    else:
+        # Chunks are appended in order. At most window chunks are submitted ahead of the one
+        # being appended, so at most that many results wait in the parent (pool.map would
+        # submit every task at once, and hold every result that completes out of order)
+        workers = workers or os.cpu_count() or 1
+        window = 2 * workers
+        pending = deque()
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            for task in tasks:
+                pending.append(pool.submit(evaluate_chunk, task))
+                if len(pending) >= window:
+                    with span("store.append"):
+                        store.append(pending.popleft().result())
+            while pending:
+                with span("store.append"):
+                    store.append(pending.popleft().result())
+    return store
+
+if __name__ == "__main__":
+    curves = "--curves" in sys.argv
+    argv = [arg for arg in sys.argv if arg != "--curves"]
+
+    if len(argv) < 3:
+        print(f"Usage: {argv[0]} grid.(json|yaml) output_dir [workers] [chunk_size] [--curves]")
+        print(f"i.e. {argv[0]} grid.json output/sweep 8 evaluates every scenario in grid.json on 8 processes")
+        print("--curves also stores the Eb/No and margin vs. elevation of every scenario")
+        sys.exit()
+
+    workers     = int(argv[3]) if len(argv) >= 4 else None
+    chunk_size  = int(argv[4]) if len(argv) >= 5 else default_chunk_size
+    store = run_sweep(load_grid(argv[1]), argv[2], workers, chunk_size, curves = curves)
+    print("Evaluated {} scenarios into {}".format(len(store), argv[2]))
@@ -0,0 +1,92 @@
+import os
+import re
+import sys
+import json
+import functools
+
+import ber_psk
+import ber_qam
+import special
+from cache import cache_path, locked
+from instrument import profiled
+
+cache_file = "thresholds.json"
+
+# Search and version of its results: the BER formula's, and the solver's in special
+searches = {
+    'psk': (ber_psk.search_ber_psk, "{}.{}".format(ber_psk.formula_version, special.formula_version)),
+    'qam': (ber_qam.search_ber_qam, "{}.{}".format(ber_qam.formula_version, special.formula_version)),
+}
+
+disk_table = None
+
+def load_disk_table():
+    try:
+        with open(cache_path(cache_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+def store(key: str, gamma: float):
+    disk_table[key] = gamma
+    try:
+        # Merge with entries written by other processes since we loaded the table, under the
+        # lock so that none of theirs is lost between our load and replace
+        with locked(cache_file):
+            table = load_disk_table()
+            table[key] = gamma
+            tmp = "{}.{}.tmp".format(cache_path(cache_file), os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(table, f, indent = 0, sort_keys = True)
+            os.replace(tmp, cache_path(cache_file))
+    except OSError:
+        pass    # The cache is best-effort, read-only checkouts still work
+
+@functools.lru_cache(maxsize = 4096)
+@profiled
+def required_gamma(scheme: str, constellation_size: int, target: float, precision: float = ber_psk.default_precision) -> float:
+    global disk_table
+    search, version = searches[scheme]
+    key = "{}/v{}/M={}/ber={!r}/precision={!r}".format(scheme, version, int(constellation_size), float(target), float(precision))
+
+    if disk_table is None:
+        disk_table = load_disk_table()
+    if key in disk_table:
+        return disk_table[key]
+
+    gamma = float(search(target, int(constellation_size), precision))
+    store(key, gamma)
+    return gamma
+
+def parse_scheme(name: str):
+    # 'BPSK', 'QPSK', '8-PSK', '16-QAM', ... -> ('psk', 2), ('psk', 4), ('psk', 8), ('qam', 16), ...
+    named = {'BPSK': ('psk', 2), 'QPSK': ('psk', 4)}
+    if name.upper() in named:
+        return named[name.upper()]
+    match = re.fullmatch(r"(\d+)-?(PSK|QAM)", name.upper())
+    if match is None:
+        raise ValueError("Unknown modulation scheme '{}'".format(name))
+    return match.group(2).lower(), int(match.group(1))
+
+def required_gammas(names, target: float, precision: float = ber_psk.default_precision):
+    return {name: required_gamma(*parse_scheme(name), target, precision) for name in names}
+
+def clear_cache():
+    global disk_table
+    required_gamma.cache_clear()
+    disk_table = dict()
+    try:
+        os.remove(cache_path(cache_file))
+    except OSError:
+        pass
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} target_ber_base target_ber_power [scheme ...]")
+        print(f"i.e. {sys.argv[0]} 10 -5 BPSK 16-QAM prints the (cached) required Eb/No to achieve BER < 10^-5")
+        sys.exit()
+
+    target = pow(int(sys.argv[1]), int(sys.argv[2]))
+    names = sys.argv[3:] or ['BPSK', 'QPSK', '8-QAM', '16-QAM', '32-QAM']
+    for name, gamma in required_gammas(names, target).items():
+        print("{:>8}: {:.2f} dB".format(name, gamma))